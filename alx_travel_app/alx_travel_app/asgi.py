@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_travel_app.settings')
+# Async-native handlers for the hot reads; see listings.async_views.
+os.environ.setdefault('LISTINGS_ASYNC_READS', 'true')
 
 application = get_asgi_application()
+
+# Load the prebuilt OpenAPI schema now rather than on the first docs request.
+from listings import apidocs  # noqa: E402
+
+apidocs.warm()
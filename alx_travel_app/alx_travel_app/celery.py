@@ -0,0 +1,19 @@
+"""
+Celery app for alx_travel_app.
+
+Configuration comes from the ``CELERY_*`` Django settings, and tasks are
+discovered in each installed app's ``tasks`` module. Run a worker and the
+periodic jobs with::
+
+    celery -A alx_travel_app worker --beat -l info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_travel_app.settings')
+
+app = Celery('alx_travel_app')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
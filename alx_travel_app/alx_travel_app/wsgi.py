@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_travel_app.settings')
 
 application = get_wsgi_application()
+
+# Load the prebuilt OpenAPI schema now rather than on the first docs request.
+from listings import apidocs  # noqa: E402
+
+apidocs.warm()
@@ -0,0 +1,43 @@
+"""
+Parsing and normalization of amenity names.
+
+Amenities used to be a free-text, comma-separated string. Each name is now
+mapped to a canonical key so that spelling variants ("Wi-Fi", "wifi",
+"WiFi") resolve to the same catalog entry.
+"""
+import re
+
+# Common variants that do not collapse to the same key on their own.
+ALIASES = {
+    'wireless': 'wifi',
+    'wirelessinternet': 'wifi',
+    'internet': 'wifi',
+    'ac': 'airconditioning',
+    'aircon': 'airconditioning',
+    'swimmingpool': 'pool',
+    'television': 'tv',
+    'parking': 'freeparking',
+}
+
+
+def amenity_key(name):
+    """Canonical key of an amenity name: lowercase alphanumerics, aliases applied."""
+    key = re.sub(r'[^a-z0-9]', '', name.lower())
+    return ALIASES.get(key, key)
+
+
+def parse_amenities(value):
+    """
+    Split a comma-separated string (or a list of names) into clean names,
+    dropping blanks and duplicates while keeping the original order.
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    names, seen = [], set()
+    for name in value:
+        name = ' '.join(str(name).split())
+        key = amenity_key(name)
+        if key and key not in seen:
+            seen.add(key)
+            names.append(name)
+    return names
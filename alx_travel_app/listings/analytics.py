@@ -0,0 +1,225 @@
+"""
+Host analytics: occupancy, revenue and average daily rate (ADR).
+
+Confirmed and completed bookings are rolled up into ``DailyListingStats``,
+one row per listing and day with activity. A night's revenue is the
+booking's ``total_price`` spread evenly over its nights (any rounding
+remainder goes to the last night), and a check-in counts on its first day.
+
+Writes don't touch the rollups directly. Saving or deleting a booking
+records the nights it covers, and covered before a move, as a
+``StaleStatsRange``; :func:`refresh` (the ``refresh_analytics`` command)
+recomputes only those days. :func:`report` answers from the rollups alone.
+Archived bookings (see ``listings.archive``) are rolled up like live ones.
+"""
+import calendar
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+
+from django.db import connections, transaction
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import ArchivedBooking, Booking, DailyListingStats, Listing, StaleStatsRange
+
+REVENUE_STATUSES = ('confirmed', 'completed')
+GRANULARITIES = ('day', 'week', 'month')
+CENT = Decimal('0.01')
+
+
+def mark_stale(ranges, using='default'):
+    """Record ``(listing_id, start, end)`` day ranges for the next refresh."""
+    StaleStatsRange.objects.using(using).bulk_create([
+        StaleStatsRange(listing_id=listing_id, start_date=start, end_date=end)
+        for listing_id, start, end in ranges
+    ])
+
+
+def booking_ranges(booking):
+    """The stay of ``booking`` and, if it moved since it was loaded, its old stay."""
+    ranges = {(booking.listing_id, booking.check_in, booking.check_out)}
+    stored = getattr(booking, '_stored_stay', None)
+    if stored and None not in stored:
+        ranges.add(stored)
+    return ranges
+
+
+def daily_rows(bookings):
+    """``{(listing_id, day): [nights, revenue, check_ins]}`` for ``bookings``."""
+    days = {}
+    for listing_id, check_in, check_out, total_price in bookings:
+        nights = (check_out - check_in).days
+        nightly = (total_price / nights).quantize(CENT, rounding=ROUND_DOWN)
+        for night in range(nights):
+            revenue = nightly if night < nights - 1 else total_price - nightly * (nights - 1)
+            row = days.setdefault((listing_id, check_in + timedelta(days=night)), [0, Decimal(0), 0])
+            row[0] += 1
+            row[1] += revenue
+        days[(listing_id, check_in)][2] += 1
+    return days
+
+
+def rebuild(listing_ids, start=None, end=None, using='default'):
+    """
+    Recompute the rollups of ``listing_ids`` for the days in [start, end),
+    or for all days if no range is given. Returns the number of rows written.
+    """
+    stats = DailyListingStats.objects.using(using).filter(listing_id__in=listing_ids)
+    values = []
+    for model in (Booking, ArchivedBooking):
+        bookings = model.objects.using(using).filter(listing_id__in=listing_ids, status__in=REVENUE_STATUSES)
+        if start is not None:
+            bookings = bookings.filter(check_in__lt=end, check_out__gt=start)
+        values += bookings.values_list('listing_id', 'check_in', 'check_out', 'total_price')
+    if start is not None:
+        stats = stats.filter(date__gte=start, date__lt=end)
+    rows = daily_rows(values)
+    stats.delete()
+    rows = [
+        (listing_id, day.isoformat(), nights, str(revenue), check_ins)
+        for (listing_id, day), (nights, revenue, check_ins) in rows.items()
+        if start is None or start <= day < end
+    ]
+    # A plain executemany: building a model instance per row would cost
+    # several times more than the insert itself.
+    connection = connections[using]
+    table = connection.ops.quote_name(DailyListingStats._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (listing_id, date, nights_booked, revenue, check_ins) '
+            'VALUES (%s, %s, %s, %s, %s)',
+            rows,
+        )
+    return len(rows)
+
+
+def stale_batches(stale, batch_size):
+    """Stale listings with the span of their ranges, ``batch_size`` at a time."""
+    spans = list(
+        stale.values_list('listing_id')
+        .annotate(start=Min('start_date'), end=Max('end_date'))
+        .order_by('start', 'listing_id')
+    )
+    for offset in range(0, len(spans), batch_size):
+        batch = spans[offset:offset + batch_size]
+        yield (
+            [listing_id for listing_id, _, _ in batch],
+            min(start for _, start, _ in batch),
+            max(end for _, _, end in batch),
+        )
+
+
+def all_batches(using, batch_size):
+    listings = Listing.objects.using(using).order_by('pk').values_list('pk', flat=True)
+    last_pk = 0
+    while True:
+        batch = list(listings.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        yield batch, None, None
+        last_pk = batch[-1]
+
+
+def refresh(full=False, batch_size=500, using='default', progress=None):
+    """
+    Bring the rollups up to date, ``batch_size`` listings per transaction.
+
+    Only the days recorded as stale before the run started are recomputed,
+    each batch over the span of its listings' stale ranges (batches are
+    formed in start-date order to keep spans tight), and those records are
+    removed with them; anything marked during the run waits for the next
+    one. ``full`` recomputes every listing from scratch. Returns the number
+    of listings processed.
+    """
+    stale = StaleStatsRange.objects.using(using)
+    last_id = stale.aggregate(last=Max('pk'))['last'] or 0
+    stale = stale.filter(pk__lte=last_id)
+    batches = all_batches(using, batch_size) if full else stale_batches(stale, batch_size)
+    processed = 0
+    for listing_ids, start, end in batches:
+        with transaction.atomic(using=using):
+            rebuild(listing_ids, start, end, using=using)
+            stale.filter(listing_id__in=listing_ids).delete()
+        processed += len(listing_ids)
+        if progress:
+            progress(processed)
+    if full:
+        stale.delete()
+    return processed
+
+
+def period_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return start + timedelta(days=calendar.monthrange(start.year, start.month)[1])
+    return start + timedelta(days=1)
+
+
+def summarize(days, nights, revenue, check_ins):
+    return {
+        'days': days,
+        'nights_booked': nights,
+        'occupancy': round(nights / days, 4) if days else None,
+        'revenue': str(revenue.quantize(CENT)),
+        'adr': str((revenue / nights).quantize(CENT)) if nights else None,
+        'check_ins': check_ins,
+    }
+
+
+def report(listings, start, end, granularity='day', using='default'):
+    """
+    Per-listing occupancy, revenue and ADR for the days ``start`` to ``end``
+    (inclusive), per ``granularity`` period, from the rollups. Periods are
+    clipped to the requested days.
+    """
+    stop = end + timedelta(days=1)
+    truncate = {'week': TruncWeek('date'), 'month': TruncMonth('date')}.get(granularity)
+    rows = DailyListingStats.objects.using(using).filter(
+        listing__in=[listing.pk for listing in listings], date__gte=start, date__lt=stop
+    )
+    if truncate is not None:
+        rows = rows.annotate(period=truncate).values_list('listing_id', 'period')
+    else:
+        rows = rows.values_list('listing_id', 'date')
+    totals = {
+        (listing_id, period): (nights, revenue, check_ins)
+        for listing_id, period, nights, revenue, check_ins in rows.annotate(
+            nights=Sum('nights_booked'), total=Sum('revenue'), arrivals=Sum('check_ins'),
+        ).order_by()
+    }
+
+    periods = []
+    current = period_start(start, granularity)
+    while current < stop:
+        following = next_period(current, granularity)
+        periods.append((current, (min(following, stop) - max(current, start)).days))
+        current = following
+
+    empty = (0, Decimal(0), 0)
+    results = []
+    for listing in listings:
+        series = [
+            {'period_start': max(period, start), **summarize(days, *totals.get((listing.pk, period), empty))}
+            for period, days in periods
+        ]
+        results.append({
+            'listing_id': listing.pk,
+            'title': listing.title,
+            'periods': series,
+            'totals': summarize(
+                (stop - start).days,
+                sum(item['nights_booked'] for item in series),
+                sum((Decimal(item['revenue']) for item in series), Decimal(0)),
+                sum(item['check_ins'] for item in series),
+            ),
+        })
+    return results
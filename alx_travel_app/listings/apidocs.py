@@ -0,0 +1,144 @@
+"""
+The OpenAPI schema, generated once rather than on every request.
+
+drf_yasg builds the schema by introspecting every viewset and serializer,
+which takes hundreds of milliseconds of CPU. Instead, ``manage.py
+build_schema`` writes it as JSON and YAML into ``API_SCHEMA_DIR`` as part of
+the deploy, and :func:`schema_file` serves those files with an ETag and
+``Cache-Control: public, max-age=API_SCHEMA_MAX_AGE``, answering
+revalidations with 304. The schema is public, so one copy fits every user.
+
+Workers load the files at startup (:func:`warm`) and reload them when a
+deploy rewrites them; a worker that finds no files generates the schema
+once, in memory. The ETag is a hash of the content, so a deploy that changes
+the API changes it too. With ``API_DOCS_ENABLED`` off the documentation
+routes are not mounted and nothing is loaded or generated.
+"""
+import hashlib
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+FORMATS = {
+    'json': (OpenAPICodecJson, 'application/json'),
+    'yaml': (OpenAPICodecYaml, 'application/yaml'),
+}
+
+info = openapi.Info(
+    title="ALX Travel App API",
+    default_version='v1',
+    description="""
+    ALX Travel App API Documentation
+
+    This API provides endpoints for managing property listings and bookings.
+
+    ## Authentication
+    - Listings: Read operations are public, write operations require authentication
+    - Bookings: All operations require authentication
+    """,
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@alxtravel.local"),
+    license=openapi.License(name="BSD License"),
+)
+
+# Serves the Swagger UI and ReDoc pages; they fetch the schema from
+# schema_file (see SPEC_URL in SWAGGER_SETTINGS and REDOC_SETTINGS).
+schema_view = get_schema_view(info, public=True, permission_classes=(permissions.AllowAny,))
+
+lock = threading.Lock()
+# Format -> the Artifact being served.
+artifacts = {}
+
+
+def docs_enabled():
+    return getattr(settings, 'API_DOCS_ENABLED', True)
+
+
+def get_schema_dir():
+    return Path(getattr(settings, 'API_SCHEMA_DIR', Path(settings.STATIC_ROOT) / 'schema'))
+
+
+def get_max_age():
+    return getattr(settings, 'API_SCHEMA_MAX_AGE', 3600)
+
+
+class Artifact:
+    def __init__(self, content, mtime=None):
+        self.content = content
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+        # Modification time of the file it was read from; None when generated.
+        self.mtime = mtime
+
+
+def generate():
+    """The rendered schema in each of :data:`FORMATS`."""
+    schema = OpenAPISchemaGenerator(info).get_schema(request=None, public=True)
+    return {format: codec([]).encode(schema) for format, (codec, _) in FORMATS.items()}
+
+
+def build(directory=None):
+    """Write the schema files into ``directory``; returns their paths."""
+    directory = Path(directory or get_schema_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for format, content in generate().items():
+        path = directory / f'openapi.{format}'
+        # Written aside and renamed, so a worker never reads half a file.
+        partial = path.with_suffix(f'.{format}.partial')
+        partial.write_bytes(content)
+        partial.replace(path)
+        paths.append(path)
+    return paths
+
+
+def load(format):
+    """
+    The Artifact for ``format``: the file written by :func:`build` if there
+    is one, else the schema generated in this process.
+    """
+    path = get_schema_dir() / f'openapi.{format}'
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        mtime = None
+    artifact = artifacts.get(format)
+    if artifact is not None and artifact.mtime == mtime:
+        return artifact
+    with lock:
+        artifact = artifacts.get(format)
+        if artifact is not None and artifact.mtime == mtime:
+            return artifact
+        if mtime is not None:
+            artifacts[format] = Artifact(path.read_bytes(), mtime)
+        else:
+            artifacts.update({name: Artifact(content) for name, content in generate().items()})
+        return artifacts[format]
+
+
+def warm():
+    """Load or generate the schema before the first request, unless the docs are off."""
+    if docs_enabled():
+        for format in FORMATS:
+            load(format)
+
+
+@require_safe
+def schema_file(request, format):
+    """The schema as ``.json`` or ``.yaml``, cacheable and revalidated by ETag."""
+    format = format.lstrip('.')
+    artifact = load(format)
+    response = get_conditional_response(request, etag=artifact.etag)
+    if response is None:
+        response = HttpResponse(artifact.content, content_type=FORMATS[format][1])
+    response['ETag'] = artifact.etag
+    patch_cache_control(response, public=True, max_age=get_max_age())
+    return response
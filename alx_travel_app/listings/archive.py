@@ -0,0 +1,154 @@
+"""
+Booking archive.
+
+Completed and cancelled bookings whose stay ended more than
+``LISTINGS_ARCHIVE_AFTER_DAYS`` ago are moved from ``Booking`` into
+``ArchivedBooking`` by :func:`archive` (the ``archive_bookings`` command and
+a daily task), so the hot table and its availability and per-guest indexes
+only hold the bookings that can still change. Rows keep their primary key;
+their reviews are repointed at the archived copy in the same transaction.
+
+The archive is history only: it never takes part in availability, and the
+analytics rollups read it alongside the hot table. Booking lists include it
+only when asked, with ``?include_archived=true`` (see :class:`History`).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Value
+from django.utils import timezone
+
+from . import occupancy
+from .models import ArchivedBooking, Booking, Review
+
+ARCHIVED_STATUSES = ('completed', 'cancelled')
+INCLUDE_PARAM = 'include_archived'
+# Copied as-is; archived_at is set on insert.
+COLUMNS = (
+    'id', 'listing_id', 'guest_id', 'check_in', 'check_out', 'total_price', 'guests_count',
+    'status', 'special_requests', 'created_at', 'updated_at',
+)
+
+
+def get_retention():
+    return timedelta(days=getattr(settings, 'LISTINGS_ARCHIVE_AFTER_DAYS', 365))
+
+
+def get_batch_size():
+    return getattr(settings, 'LISTINGS_ARCHIVE_BATCH_SIZE', 1000)
+
+
+def requested(request):
+    return request.query_params.get(INCLUDE_PARAM) in ('1', 'true')
+
+
+def archivable(now=None, using='default'):
+    """Bookings past the retention horizon, which :func:`archive` moves."""
+    horizon = timezone.localdate(now or timezone.now()) - get_retention()
+    return Booking.objects.using(using).filter(status__in=ARCHIVED_STATUSES, check_out__lt=horizon)
+
+
+def move(pks, using='default'):
+    """
+    Move the bookings ``pks`` into the archive, within the caller's
+    transaction: one INSERT ... SELECT, one UPDATE of their reviews and one
+    DELETE. The DELETE skips the per-row delete signals on purpose: nothing
+    derived from a booking changes when it moves.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in COLUMNS)
+    placeholders = ', '.join(['%s'] * len(pks))
+    booking_table = quote(Booking._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(ArchivedBooking._meta.db_table)} ({columns}, {quote("archived_at")}) '
+            f'SELECT {columns}, %s FROM {booking_table} WHERE {quote("id")} IN ({placeholders})',
+            [timezone.now(), *pks],
+        )
+        # archived_booking is assigned first: MySQL evaluates SET left to right.
+        Review.objects.using(using).filter(booking_id__in=pks).update(
+            archived_booking_id=F('booking_id'), booking=None
+        )
+        cursor.execute(f'DELETE FROM {booking_table} WHERE {quote("id")} IN ({placeholders})', pks)
+        return cursor.rowcount
+
+
+def archive(now=None, batch_size=None, using='default', progress=None):
+    """
+    Move every archivable booking into the archive, ``batch_size`` per
+    transaction so that no transaction holds its locks for long. Each batch
+    is selected and locked inside its transaction, so a booking changed in
+    the meantime (say, a cancellation revived) is left alone. Returns the
+    number of bookings moved.
+    """
+    batch_size = batch_size or get_batch_size()
+    rows = archivable(now, using).order_by('pk').values_list('pk', 'listing_id')
+    moved, last_pk = 0, 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(rows.filter(pk__gt=last_pk).select_for_update()[:batch_size])
+            if not batch:
+                return moved
+            moved += move([pk for pk, _ in batch], using=using)
+            # Completed stays leave the calendars, which only read live bookings.
+            occupancy.invalidate({listing_id for _, listing_id in batch}, using=using)
+        last_pk = batch[-1][0]
+        if progress:
+            progress(moved)
+
+
+class History:
+    """
+    ``live`` bookings and ``archived`` ones (filtered the same way) as one
+    sequence, newest first, for the booking lists asked to ``include_archived``.
+
+    Supports what the paginators use: ``count()``, ``filter()``,
+    ``order_by()`` and slicing. A slice costs one UNION query for the keys
+    of the page and one query per table for its rows.
+    """
+
+    def __init__(self, live, archived, ordering=('-created_at', '-id')):
+        self.live = live
+        self.archived = archived
+        self.ordering = ordering
+
+    @property
+    def querysets(self):
+        return self.live, self.archived
+
+    def filter(self, *args, **kwargs):
+        return History(self.live.filter(*args, **kwargs), self.archived.filter(*args, **kwargs), self.ordering)
+
+    def order_by(self, *ordering):
+        return History(self.live, self.archived, ordering)
+
+    def count(self):
+        return self.live.count() + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def keys(self, queryset, archived):
+        return (
+            queryset.select_related(None).prefetch_related(None).order_by()
+            .annotate(archived=Value(archived)).values_list('id', 'created_at', 'archived')
+        )
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        keys = list(
+            self.keys(self.live, False).union(self.keys(self.archived, True), all=True)
+            .order_by(*self.ordering)[index]
+        )
+        rows = {}
+        for queryset, archived in ((self.live, False), (self.archived, True)):
+            pks = [pk for pk, _, is_archived in keys if bool(is_archived) == archived]
+            if pks:
+                rows.update(((obj.pk, archived), obj) for obj in queryset.filter(pk__in=pks))
+        return [rows[pk, bool(is_archived)] for pk, _, is_archived in keys]
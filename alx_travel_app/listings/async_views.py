@@ -0,0 +1,264 @@
+"""
+Native async handlers for the hot read endpoints under ASGI.
+
+With ``LISTINGS_ASYNC_READS`` on (``asgi.py`` turns it on), GET requests
+for the listing list, listing detail, availability search and a user's
+booking list are served by coroutines rather than by a sync view behind
+``sync_to_async``. Django runs every sync view, and every async ORM and
+cache call, on one shared thread-sensitive thread, so under load requests
+queue behind each other's queries. These handlers instead do each
+request's blocking work (cache lookups, queries, serialization and JSON
+rendering) in one or two hops to the default executor's thread pool, so
+requests proceed in parallel and the event loop never blocks. The
+viewsets still build the querysets and serialize the rows, so filters,
+ordering, pagination and the rendered JSON are the same as on the sync
+path; cached responses are shared with ``cache.CachedReadMixin``, and
+uncached reads go to a replica like ``replicas.ReplicaReadMixin`` sends them.
+Requests go through the viewset's own authenticators, permissions, throttles
+and paginator too.
+
+Anything a handler does not cover (other methods, formats other than
+plain JSON, cursor pagination, facets, and every error response) falls
+through to the DRF view of the same route.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import URLPattern
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+
+from . import cache, replicas
+from .views import BookingViewSet, ListingViewSet
+
+JSON_MEDIA_RANGES = {'*/*', 'application/*', 'application/json'}
+# Query parameters that select something other than a plain page-number JSON page.
+FALLBACK_PARAMS = {'format', 'cursor', 'pagination', 'facets'}
+CONTENT_TYPE = 'application/json'
+
+
+def in_worker(func):
+    """
+    ``func`` as a coroutine function running in the executor's thread pool.
+    The thread's database connections are closed afterwards, as at the end
+    of a request, so they honour ``CONN_MAX_AGE`` like the sync views do.
+    """
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def accepts(request):
+    """Whether DRF would negotiate plain, unindented JSON for ``request``."""
+    if FALLBACK_PARAMS & request.GET.keys():
+        return False
+    accept = request.headers.get('Accept', '')
+    if not accept:
+        return True
+    ranges = {media.strip() for media in accept.split(',')}
+    return bool(ranges & JSON_MEDIA_RANGES) and not any(
+        'html' in media or ';' in media for media in ranges
+    )
+
+
+def make_view(viewset, action, request, **kwargs):
+    """A viewset instance set up for ``action`` like ``as_view()`` would, without dispatching."""
+    view = viewset(action_map={'get': action}, args=(), kwargs=kwargs, format_kwarg=None, headers={})
+    view.request = view.initialize_request(request)
+    return view
+
+
+def allowed(view):
+    """Whether the view's authentication, permissions and throttles let its request through."""
+    try:
+        view.perform_authentication(view.request)
+        view.check_permissions(view.request)
+        view.check_throttles(view.request)
+    except APIException:
+        return False
+    return True
+
+
+def render(view, data, many=False, paginated=False):
+    """Serialize and render a response body."""
+    data = view.get_serializer(data, many=many).data
+    if paginated:
+        data = view.get_paginated_response(data).data
+    return JSONRenderer().render(data, CONTENT_TYPE, view.get_renderer_context())
+
+
+def render_page(view, queryset):
+    """The body of the requested page of ``queryset``; None if it does not exist."""
+    try:
+        page = view.paginate_queryset(queryset)
+    except APIException:
+        return None
+    if page is None:
+        return render(view, queryset, many=True)
+    return render(view, page, many=True, paginated=True)
+
+
+def json_response(content):
+    return None if content is None else HttpResponse(content, content_type=CONTENT_TYPE)
+
+
+@in_worker
+def cache_lookup(request, view, action, scope):
+    """
+    ``(key, version, entry or None)`` in the cache entries of
+    ``cache.CachedReadMixin``; None if the view turns the request away.
+    """
+    if not allowed(view):
+        return None
+    version = cache.current_version(scope)
+    key = cache.response_key(action, version, request.path, request.GET.lists(), CONTENT_TYPE)
+    return key, version, cache.get_cache().get(key)
+
+
+@in_worker
+def cache_build(build, key, version):
+    content = build()
+    if content is None:
+        return None
+    cache.stats.record('misses')
+    entry = cache.response_entry(content, CONTENT_TYPE, version)
+    cache.get_cache().set(key, entry, cache.get_timeout())
+    return entry
+
+
+async def cached(request, view, action, scope, build):
+    """
+    The body made by ``build`` (a sync function that returns None to give
+    up) through the response cache, in at most two worker hops.
+    """
+    found = await cache_lookup(request, view, action, scope)
+    if found is None:
+        return None
+    key, version, entry = found
+    if entry is None:
+        entry = await cache_build(build, key, version)
+        if entry is None:
+            return None
+        outcome = 'MISS'
+    else:
+        cache.stats.record('hits')
+        outcome = 'HIT'
+    response = HttpResponse(entry['content'], content_type=CONTENT_TYPE)
+    return cache.finish_response(request, response, entry, outcome)
+
+
+async def listing_list(request):
+    view = make_view(ListingViewSet, 'list', request)
+
+    def build():
+        try:
+            queryset = view.filter_queryset(view.get_queryset())
+        except APIException:
+            return None
+        return render_page(view, queryset)
+
+    return await cached(request, view, 'list', cache.LIST_SCOPE, build)
+
+
+async def listing_detail(request, pk):
+    try:
+        scope = cache.listing_scope(int(pk))
+    except ValueError:
+        return None
+    view = make_view(ListingViewSet, 'retrieve', request, pk=pk)
+
+    def build():
+        try:
+            listing = view.filter_queryset(view.get_queryset()).filter(pk=pk).first()
+        except (APIException, DjangoValidationError, TypeError, ValueError):
+            return None
+        return None if listing is None else render(view, listing)
+
+    return await cached(request, view, 'retrieve', scope, build)
+
+
+@in_worker
+def replica_page(view, get_queryset):
+    """The page of ``get_queryset()`` (read on a replica), or None to fall through."""
+    if not allowed(view):
+        return None
+
+    def build():
+        try:
+            queryset = get_queryset()
+        except APIException:
+            return None
+        return render_page(view, queryset)
+
+    return replicas.call(view.request.user, build)
+
+
+async def available_listings(request):
+    view = make_view(ListingViewSet, 'available', request)
+    return json_response(await replica_page(view, view.get_available_queryset))
+
+
+async def booking_list(request):
+    view = make_view(BookingViewSet, 'list', request)
+    return json_response(await replica_page(view, view.get_queryset))
+
+
+HANDLERS = {
+    'listing-list': listing_list,
+    'listing-detail': listing_detail,
+    'listing-available': available_listings,
+    'booking-list': booking_list,
+}
+
+
+def allowed_methods(sync_view):
+    """The ``Allow`` header DRF sends for the viewset route ``sync_view``."""
+    methods = set(sync_view.actions) | {'head', 'options'}
+    return ', '.join(
+        method.upper() for method in sync_view.cls.http_method_names if method in methods
+    )
+
+
+def async_route(sync_view, handler):
+    """
+    An async view for a router route: GETs go to ``handler``, and whatever
+    it returns None for goes to the DRF view ``sync_view``.
+    """
+    allow = allowed_methods(sync_view)
+    run_sync = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET' and 'format' not in kwargs and accepts(request):
+            response = await handler(request, *args, **kwargs)
+            if response is not None:
+                # What APIView.finalize_response() adds.
+                patch_vary_headers(response, ['Accept'])
+                response['Allow'] = allow
+                return response
+        return await run_sync(request, *args, **kwargs)
+
+    # Keep cls, actions and csrf_exempt for the schema generator and the
+    # CSRF middleware, but not __wrapped__, which leads back to a sync view.
+    functools.update_wrapper(view, sync_view)
+    del view.__wrapped__
+    return view
+
+
+def with_async_reads(patterns):
+    """``patterns`` (a router's urls) with the hot read routes served by :data:`HANDLERS`."""
+    return [
+        URLPattern(
+            pattern.pattern, async_route(pattern.callback, HANDLERS[pattern.name]),
+            pattern.default_args, pattern.name,
+        )
+        if isinstance(pattern, URLPattern) and pattern.name in HANDLERS else pattern
+        for pattern in patterns
+    ]
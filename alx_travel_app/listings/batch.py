@@ -0,0 +1,170 @@
+"""
+Batch writes for onboarding and back-office tooling.
+
+A batch is a JSON list. Every item is validated with one shared serializer
+instance, then all valid items are written in a single transaction, with
+``bulk_create`` or a few set-based UPDATEs. Invalid items are reported and
+skipped; the response lists one result per item, in request order.
+"""
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from . import analytics, cache, occupancy, search, tasks
+from .amenities import amenity_key
+from .models import Amenity, Booking, Listing, ListingAmenity
+from .serializers import BookingStatusSerializer, ListingSerializer
+
+
+def get_max_items():
+    return getattr(settings, 'LISTINGS_BATCH_MAX_ITEMS', 5000)
+
+
+def get_items(request):
+    """The list of items in the request body, bounded by ``LISTINGS_BATCH_MAX_ITEMS``."""
+    items = request.data
+    if not isinstance(items, list):
+        raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+    if not items:
+        raise ValidationError({'non_field_errors': ['The batch is empty.']})
+    if len(items) > get_max_items():
+        raise ValidationError(
+            {'non_field_errors': [f'A batch holds at most {get_max_items()} items.']}
+        )
+    return items
+
+
+class BatchResult:
+    """Per-item outcomes of a batch, in request order."""
+
+    def __init__(self):
+        self.results = {}
+        self.failed = 0
+
+    def ok(self, index, **data):
+        self.results[index] = {'index': index, 'ok': True, **data}
+
+    def error(self, index, errors):
+        self.results[index] = {'index': index, 'ok': False, 'errors': errors}
+        self.failed += 1
+
+    @property
+    def data(self):
+        return {
+            'succeeded': len(self.results) - self.failed,
+            'failed': self.failed,
+            'results': [self.results[index] for index in sorted(self.results)],
+        }
+
+    def status_code(self, success):
+        """``success`` if every item went through, 207 if some did, else 400."""
+        if not self.failed:
+            return success
+        if self.failed < len(self.results):
+            return status.HTTP_207_MULTI_STATUS
+        return status.HTTP_400_BAD_REQUEST
+
+
+def validate_items(serializer, items, result):
+    """``(index, validated_data)`` of the valid items; errors go to ``result``."""
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, serializer.run_validation(item)))
+        except ValidationError as exc:
+            result.error(index, exc.detail)
+    return valid
+
+
+def insert_listings(listings, using):
+    if connections[using].features.can_return_rows_from_bulk_insert:
+        Listing.objects.using(using).bulk_create(listings)
+    else:
+        # MySQL does not report the ids of a bulk insert, which the amenity
+        # links need; fall back to one INSERT per listing.
+        for listing in listings:
+            listing.save(using=using, force_insert=True)
+
+
+def create_listings(items, host, using='default'):
+    """Create the valid listings of ``items``, hosted by ``host``."""
+    result = BatchResult()
+    valid = validate_items(ListingSerializer(), items, result)
+    if not valid:
+        return result
+
+    listings, amenity_names, names_by_key = [], [], {}
+    for index, data in valid:
+        names = data.pop('listing_amenities', [])
+        listing = Listing(host=host, **data)
+        listing.refresh_geohash()
+        listings.append(listing)
+        amenity_names.append(names)
+        for name in names:
+            names_by_key.setdefault(amenity_key(name), name)
+
+    with transaction.atomic(using=using):
+        insert_listings(listings, using)
+        catalog = {
+            amenity.slug: amenity
+            for amenity in Amenity.objects.db_manager(using).resolve(list(names_by_key.values()))
+        }
+        ListingAmenity.objects.using(using).bulk_create([
+            ListingAmenity(listing=listing, amenity=catalog[amenity_key(name)], position=position)
+            for listing, names in zip(listings, amenity_names)
+            for position, name in enumerate(names)
+        ])
+        search.index_listings(listings, using=using)
+    cache.bump(cache.LIST_SCOPE, using=using)
+
+    for (index, _), listing in zip(valid, listings):
+        result.ok(index, id=listing.pk)
+    return result
+
+
+def update_booking_statuses(items, queryset, using='default'):
+    """
+    Apply ``{"id", "status"}`` items to the bookings in ``queryset``.
+
+    Reviving a cancelled booking needs an availability check, so it is left
+    to the single-booking endpoint.
+    """
+    result = BatchResult()
+    valid = validate_items(BookingStatusSerializer(), items, result)
+    if not valid:
+        return result
+
+    with transaction.atomic(using=using):
+        bookings = (
+            queryset.using(using).select_related(None).prefetch_related(None)
+            .select_for_update().in_bulk([data['id'] for _, data in valid])
+        )
+        now = timezone.now()
+        changed, seen = {}, set()
+        for index, data in valid:
+            booking = bookings.get(data['id'])
+            if booking is None:
+                result.error(index, {'id': ['Booking not found.']})
+            elif booking.pk in seen:
+                result.error(index, {'id': ['Booking appears more than once in the batch.']})
+            elif booking.status == 'cancelled' and data['status'] != 'cancelled':
+                result.error(index, {'status': ['Cancelled bookings must be reactivated one at a time.']})
+            else:
+                seen.add(booking.pk)
+                if booking.status != data['status']:
+                    changed.setdefault(data['status'], []).append(booking.pk)
+                result.ok(index, id=booking.pk, status=data['status'])
+        # One UPDATE per target status, rather than bulk_update()'s CASE per row.
+        for new_status, pks in changed.items():
+            Booking.objects.using(using).filter(pk__in=pks).update(status=new_status, updated_at=now)
+        analytics.mark_stale({
+            (booking.listing_id, booking.check_in, booking.check_out)
+            for pks in changed.values() for booking in map(bookings.get, pks)
+        }, using=using)
+        tasks.queue_confirmations(changed.get('confirmed', []), using=using)
+        occupancy.invalidate(
+            [bookings[pk].listing_id for pk in changed.get('cancelled', [])], using=using
+        )
+    return result
@@ -0,0 +1,140 @@
+"""
+Helpers shared by the ``bench_*`` management commands.
+"""
+import io
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, transaction
+
+from .reservations import ListingUnavailable, reserve
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list of numbers."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Summarize timings (in seconds) as milliseconds."""
+    return {
+        'runs': len(samples),
+        'min_ms': round(min(samples) * 1000, 3),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def time_runs(func, runs):
+    """Call ``func`` ``runs`` times and return the list of durations."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+@contextmanager
+def rolled_back(using='default'):
+    """Run the block in a transaction that is always rolled back."""
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
+
+
+def next_id(model, using='default'):
+    """First primary key after the current maximum in ``using``, for explicit-id bulk inserts."""
+    last = model.objects.using(using).order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+
+def hammer_reservations(listing_ids, guest, start, threads=8, attempts=10):
+    """
+    Have ``threads`` threads each try to :func:`~listings.reservations.reserve`
+    ``attempts`` overlapping stays from ``start`` on ``listing_ids``. The data
+    must be committed: every thread has its own connection. Returns the
+    outcomes, ``'booked'`` or ``'conflict'``, and the seconds taken.
+    """
+    outcomes = []
+
+    def worker(thread_no):
+        try:
+            rng = random.Random(thread_no)
+            for _ in range(attempts):
+                check_in = start + timedelta(days=rng.randint(0, 20))
+                nights = rng.randint(1, 4)
+                try:
+                    reserve(rng.choice(listing_ids), guest, check_in, check_in + timedelta(days=nights), 1)
+                    outcomes.append('booked')
+                except ListingUnavailable:
+                    outcomes.append('conflict')
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return outcomes, time.perf_counter() - started
+
+
+def wsgi_get(application, host, path, query='', cookie=''):
+    """GET ``path`` through a WSGI application: ``(seconds, status code, headers)``."""
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host, 'HTTP_COOKIE': cookie,
+        'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+    }
+    started_response = []
+    started = time.perf_counter()
+    response = application(environ, lambda status, headers: started_response.append((status, headers)))
+    b''.join(response)
+    response.close()
+    elapsed = time.perf_counter() - started
+    status, headers = started_response[0]
+    return elapsed, int(status.split(' ', 1)[0]), dict(headers)
+
+
+def compare(results, baseline, tolerance, slack_ms=5):
+    """
+    Regressions of ``results`` against ``baseline``, both ``{scenario:
+    {clients: summary}}``: throughput worse by more than ``tolerance`` (a
+    fraction); p95 latency worse by more than ``tolerance`` and by more
+    than ``slack_ms``, since a few milliseconds either way is noise; more
+    than half a query per request more, since how many responses come from
+    the cache varies between runs and makes the count fractional; or any
+    more non-2xx responses, which would otherwise pass for fast ones.
+    Entries missing from either side are not compared.
+    """
+    regressions = []
+    for scenario, levels in results.items():
+        for clients, current in levels.items():
+            previous = baseline.get(scenario, {}).get(clients)
+            if previous is None:
+                continue
+            checks = [
+                ('p95_ms', current['p95_ms'] > max(previous['p95_ms'] * (1 + tolerance),
+                                                   previous['p95_ms'] + slack_ms)),
+                ('rps', current['rps'] < previous['rps'] * (1 - tolerance)),
+                ('queries_per_request',
+                 (current['queries_per_request'] or 0) > (previous['queries_per_request'] or 0) + 0.5),
+                ('non_2xx', current.get('non_2xx', 0) > previous.get('non_2xx', 0)),
+            ]
+            regressions += [
+                {'scenario': scenario, 'clients': clients, 'metric': metric,
+                 'baseline': previous.get(metric), 'current': current.get(metric)}
+                for metric, regressed in checks if regressed
+            ]
+    return regressions
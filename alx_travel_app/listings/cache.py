@@ -0,0 +1,219 @@
+"""
+Response cache for listing reads.
+
+Rendered JSON responses of ``ListingViewSet.list``/``retrieve`` are stored in
+the configured Django cache under keys that embed a *version*: one for all
+list responses and one per listing. Changing a listing, its amenities, its
+review aggregates or its host bumps the relevant versions once the change
+commits, so stale entries are simply never read again and expire on their own.
+
+Versions are nanosecond timestamps, which double as ``Last-Modified``.
+Every cached response also carries an ``ETag``, so clients can revalidate
+with ``If-None-Match``/``If-Modified-Since`` and get a 304.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.renderers import JSONRenderer
+
+LIST_SCOPE = 'list'
+KEY_PREFIX = 'listings'
+
+
+def get_cache():
+    return caches[getattr(settings, 'LISTINGS_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'LISTINGS_CACHE_TIMEOUT', 300)
+
+
+def version_key(scope):
+    return f'{KEY_PREFIX}:version:{scope}'
+
+
+def listing_scope(pk):
+    return f'listing:{pk}'
+
+
+def bump(*scopes, using='default'):
+    """
+    Start a new version for ``scopes``, orphaning their cached responses,
+    once the current transaction on ``using`` commits (at once outside of
+    one). Bumping earlier would let a reader that misses before the commit
+    cache the old data under the new version.
+    """
+    def start():
+        now = time.time_ns()
+        get_cache().set_many({version_key(scope): now for scope in scopes}, timeout=None)
+    transaction.on_commit(start, using=using)
+
+
+def invalidate_listings(pks, using='default'):
+    """Invalidate the list responses and the detail responses of ``pks``."""
+    bump(LIST_SCOPE, *(listing_scope(pk) for pk in pks), using=using)
+
+
+def current_version(scope):
+    cache = get_cache()
+    version = cache.get(version_key(scope))
+    if version is None:
+        version = time.time_ns()
+        cache.add(version_key(scope), version, timeout=None)
+        version = cache.get(version_key(scope), version)
+    return version
+
+
+async def acurrent_version(scope):
+    """Async :func:`current_version`, for the native async views."""
+    cache = get_cache()
+    version = await cache.aget(version_key(scope))
+    if version is None:
+        version = time.time_ns()
+        await cache.aadd(version_key(scope), version, timeout=None)
+        version = await cache.aget(version_key(scope), version)
+    return version
+
+
+def current_versions(scopes):
+    """``{scope: version}`` for several scopes, in one cache round trip."""
+    keys = {version_key(scope): scope for scope in scopes}
+    found = get_cache().get_many(keys)
+    return {
+        scope: found[key] if key in found else current_version(scope)
+        for key, scope in keys.items()
+    }
+
+
+class CacheStats:
+    """Thread-safe, per-process hit/miss counters."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.not_modified = 0
+
+    def record(self, outcome):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+stats = CacheStats()
+
+
+def not_modified(request, etag, last_modified):
+    """Whether the client's validators show it already has this response."""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and last_modified <= since
+
+
+def response_key(action, version, path, params, media_type):
+    """Key of a rendered response; ``params`` are the query parameters as ``(name, values)``."""
+    digest = hashlib.sha1(repr((path, sorted(params), media_type)).encode()).hexdigest()
+    return f'{KEY_PREFIX}:response:{action}:{version}:{digest}'
+
+
+def response_entry(content, content_type, version):
+    return {
+        'content': content,
+        'content_type': content_type,
+        'etag': '"%s"' % hashlib.md5(content).hexdigest(),
+        'last_modified': version // 1_000_000_000,
+    }
+
+
+def finish_response(request, response, entry, outcome):
+    """Add the validators of ``entry``, answering 304 if the client is up to date."""
+    if not_modified(request, entry['etag'], entry['last_modified']):
+        stats.record('not_modified')
+        response = HttpResponseNotModified()
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    response['Cache-Control'] = 'no-cache'
+    response['X-Cache'] = outcome
+    return response
+
+
+class CachedReadMixin:
+    """
+    Serve ``list`` and ``retrieve`` from the response cache.
+
+    Only JSON responses are cached; the browsable API embeds per-user
+    content. Keys cover the path, every query parameter (filters, page,
+    cursor) and the negotiated media type.
+    """
+    cached_actions = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def response_cache_key(self, request, kwargs):
+        """``(key, version)`` of the response, or None if it is not cacheable."""
+        if self.action == 'retrieve':
+            # Scoped by the listing's id, which "/01/" spells too.
+            try:
+                scope = listing_scope(int(kwargs[self.lookup_url_kwarg or self.lookup_field]))
+            except ValueError:
+                return None
+        else:
+            scope = LIST_SCOPE
+        version = current_version(scope)
+        key = response_key(
+            self.action, version, request.path, request.query_params.lists(), request.accepted_media_type
+        )
+        return key, version
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.method != 'GET' or not isinstance(request.accepted_renderer, JSONRenderer):
+            return handler(request, *args, **kwargs)
+
+        cache_key = self.response_cache_key(request, kwargs)
+        if cache_key is None:
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        key, version = cache_key
+        entry = cache.get(key)
+        if entry is None:
+            stats.record('misses')
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response.accepted_renderer = request.accepted_renderer
+            response.accepted_media_type = request.accepted_media_type
+            response.renderer_context = self.get_renderer_context()
+            response.render()
+            entry = response_entry(response.content, response['Content-Type'], version)
+            cache.set(key, entry, get_timeout())
+            outcome = 'MISS'
+        else:
+            stats.record('hits')
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+            outcome = 'HIT'
+        return finish_response(request, response, entry, outcome)
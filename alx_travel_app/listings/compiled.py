@@ -0,0 +1,149 @@
+"""
+Precompiled read-only serializers.
+
+A DRF serializer resolves every field of every object through several
+layers of generic machinery: ``get_attribute`` with its error handling,
+``PKOnlyObject`` checks, and a ``to_representation`` per field that
+re-reads settings on each call. ``compile_serializer`` walks a serializer's
+fields once and turns each into an ``(name, accessor, converter)`` triple,
+with plain ``str``/``int``/``float`` converters for simple fields and
+nested serializers compiled recursively.
+
+The output is the same data, in the same key order, as the serializer it
+was compiled from, so the rendered JSON is byte-identical. Fields without
+a specialised converter keep using their own ``to_representation``.
+"""
+import functools
+from operator import attrgetter
+
+from rest_framework import ISO_8601, fields, serializers
+from rest_framework.settings import api_settings
+
+from . import perf
+
+SIMPLE_CONVERTERS = {
+    fields.CharField: str,
+    fields.EmailField: str,
+    fields.SlugField: str,
+    fields.URLField: str,
+    fields.IntegerField: int,
+    fields.FloatField: float,
+    fields.BooleanField: bool,
+}
+
+
+def datetime_converter(field):
+    """ISO 8601 in the field's timezone, the way ``DateTimeField`` renders it."""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or tz is None:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def date_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+
+    def convert(value):
+        return value if isinstance(value, str) else value.isoformat()
+    return convert
+
+
+def converter_for(field):
+    if isinstance(field, serializers.BaseSerializer):
+        if isinstance(field, serializers.ListSerializer):
+            return field.to_representation
+        return CompiledSerializer(field).to_representation
+    if type(field) in SIMPLE_CONVERTERS:
+        return SIMPLE_CONVERTERS[type(field)]
+    if type(field) is fields.DateTimeField:
+        return datetime_converter(field)
+    if type(field) is fields.DateField:
+        return date_converter(field)
+    return field.to_representation
+
+
+def accessor_for(field):
+    if field.source == '*':
+        return lambda instance: instance
+    return attrgetter('.'.join(field.source_attrs))
+
+
+class CompiledSerializer:
+    """The read path of a serializer instance, resolved ahead of time."""
+
+    def __init__(self, serializer):
+        self.plan = [
+            (field.field_name, accessor_for(field), converter_for(field))
+            for field in serializer._readable_fields
+        ]
+
+    def to_representation(self, instance):
+        data = {}
+        for name, accessor, converter in self.plan:
+            value = accessor(instance)
+            data[name] = None if value is None else converter(value)
+        return data
+
+    def many(self, instances):
+        to_representation = self.to_representation
+        return [to_representation(instance) for instance in instances]
+
+
+# Bounded: clients choose the fieldsets (see listings.fieldsets).
+@functools.lru_cache(maxsize=256)
+def compile_serializer(serializer_class, fieldset=None):
+    """Compile ``serializer_class``, for ``fieldset`` if given, once per process."""
+    if fieldset is None:
+        return CompiledSerializer(serializer_class())
+    return CompiledSerializer(serializer_class(fieldset=fieldset))
+
+
+class FastSerializer:
+    """
+    Read-only stand-in for a serializer instance, exposing ``data`` only.
+
+    Hooked in by ``FastReadMixin.get_serializer``, so views keep calling
+    ``self.get_serializer(page, many=True).data`` as usual.
+    """
+
+    def __init__(self, serializer_class, instance, many=False, fieldset=None):
+        self.compiled = compile_serializer(serializer_class, fieldset)
+        self.instance = instance
+        self.is_many = many
+
+    @property
+    def data(self):
+        with perf.timer('serialize'):
+            if self.is_many:
+                return self.compiled.many(self.instance)
+            return self.compiled.to_representation(self.instance)
+
+
+class FastReadMixin:
+    """
+    Serialize the responses of ``fast_read_actions`` with the compiled
+    serializer instead of the DRF one. Writes and schema generation are
+    left untouched.
+    """
+    fast_read_actions = ('list', 'retrieve')
+
+    def get_serializer(self, *args, **kwargs):
+        if (
+            args
+            and self.action in self.fast_read_actions
+            and not getattr(self, 'swagger_fake_view', False)
+        ):
+            return FastSerializer(
+                self.get_serializer_class(), args[0],
+                many=kwargs.get('many', False), fieldset=kwargs.get('fieldset'),
+            )
+        return super().get_serializer(*args, **kwargs)
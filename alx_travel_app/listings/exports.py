@@ -0,0 +1,219 @@
+"""
+Streaming bulk exports of bookings and listings as CSV or NDJSON.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)``, so no
+model instances are built and only one chunk is held in memory (on
+backends with server-side cursors the database streams it as well). The
+encoded output is yielded a chunk at a time, which lets
+``StreamingHttpResponse`` send the first bytes as soon as the first chunk
+is read. Both the export endpoints and the ``export`` command use this
+module.
+
+Under ASGI, Django would buffer a sync iterator in full before sending it,
+so the endpoints hand the response an async iterator instead
+(:func:`iterate_async`), which reads one chunk at a time in the thread the
+sync views run in.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+CHUNK_SIZE = 2000
+
+# Output column -> field path.
+BOOKING_COLUMNS = {
+    'id': 'id',
+    'listing_id': 'listing_id',
+    'listing_title': 'listing__title',
+    'guest_id': 'guest_id',
+    'guest_username': 'guest__username',
+    'check_in': 'check_in',
+    'check_out': 'check_out',
+    'guests_count': 'guests_count',
+    'total_price': 'total_price',
+    'status': 'status',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+LISTING_COLUMNS = {
+    'id': 'id',
+    'title': 'title',
+    'address': 'address',
+    'city': 'city',
+    'country': 'country',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'price_per_night': 'price_per_night',
+    'max_guests': 'max_guests',
+    'bedrooms': 'bedrooms',
+    'bathrooms': 'bathrooms',
+    'property_type': 'property_type',
+    'is_available': 'is_available',
+    'host_id': 'host_id',
+    'avg_rating': 'avg_rating',
+    'review_count': 'review_count',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+
+def filter_bookings(queryset, start=None, end=None, status=None, listing=None):
+    """
+    Bookings checking in between ``start`` and ``end`` (inclusive dates),
+    with one of the ``status`` values and for one of the ``listing`` ids.
+    """
+    if start:
+        queryset = queryset.filter(check_in__gte=start)
+    if end:
+        queryset = queryset.filter(check_in__lte=end)
+    if status:
+        queryset = queryset.filter(status__in=status)
+    if listing:
+        queryset = queryset.filter(listing_id__in=listing)
+    return queryset
+
+
+def start_of_day(day):
+    return datetime.combine(day, time.min, tzinfo=timezone.get_current_timezone())
+
+
+def filter_listings(queryset, start=None, end=None, listing=None):
+    """Listings created between ``start`` and ``end`` (inclusive dates), by id."""
+    if start:
+        queryset = queryset.filter(created_at__gte=start_of_day(start))
+    if end:
+        queryset = queryset.filter(created_at__lt=start_of_day(end + timedelta(days=1)))
+    if listing:
+        queryset = queryset.filter(pk__in=listing)
+    return queryset
+
+
+def iter_rows(queryset, columns, chunk_size=CHUNK_SIZE):
+    """
+    Chunks of value tuples in ``columns`` order; primary key order by
+    default. An ``archive.History`` is read one table after the other.
+    """
+    chunk = []
+    for part in getattr(queryset, 'querysets', (queryset,)):
+        if not part.query.order_by:
+            part = part.order_by('pk')
+        rows = part.select_related(None).prefetch_related(None).values_list(*columns.values())
+        for row in rows.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(queryset, columns, chunk_size=CHUNK_SIZE):
+    """
+    CSV text with a header row, one string per chunk. The header goes out
+    with the first chunk, so nothing is sent before the first query runs.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in iter_rows(queryset, columns, chunk_size):
+        writer.writerows([csv_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_ndjson(queryset, columns, chunk_size=CHUNK_SIZE):
+    """One JSON object per line, one string per chunk."""
+    encoder = DjangoJSONEncoder()
+    names = list(columns)
+    for chunk in iter_rows(queryset, columns, chunk_size):
+        yield ''.join(encoder.encode(dict(zip(names, row))) + '\n' for row in chunk)
+
+
+STREAMS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def is_asgi(request):
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+async def iterate_async(iterable):
+    """``iterable`` as an async iterator, each step run by ``sync_to_async``."""
+    iterator = iter(iterable)
+    step = sync_to_async(next)
+    try:
+        while (item := await step(iterator, None)) is not None:
+            yield item
+    finally:
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
+
+
+def streaming_response(queryset, columns, export_format, filename, chunk_size=CHUNK_SIZE,
+                       asynchronous=False):
+    """
+    A ``StreamingHttpResponse`` downloading ``queryset`` as ``filename.<format>``;
+    with an async iterator if ``asynchronous`` (under ASGI, see :func:`is_asgi`).
+    """
+    content = STREAMS[export_format](queryset, columns, chunk_size)
+    response = StreamingHttpResponse(
+        iterate_async(content) if asynchronous else content,
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    # Ask nginx-style proxies to pass chunks through instead of buffering them.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Negotiates ``?format=csv`` for the export actions, whose rows bypass
+    rendering. Only error payloads are rendered here, as ``field,detail`` rows.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        items = data.items() if isinstance(data, dict) else [('detail', data)]
+        for field, detail in items:
+            if isinstance(detail, list):
+                detail = ' '.join(str(message) for message in detail)
+            writer.writerow([field, detail])
+        return buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Negotiates ``?format=ndjson``; error payloads render as one JSON line."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return (json.dumps(data, cls=DjangoJSONEncoder) + '\n').encode(self.charset)
@@ -0,0 +1,77 @@
+"""
+Facet counts for the listing search page.
+
+:func:`compute` counts the listings of a filtered queryset per property
+type, per city and per price bucket with one grouped query: rows are
+grouped on all three at once and the small result is folded into the three
+facets in Python. :func:`facet_counts` caches the result per filter set
+under the list version of ``listings.cache``, so any listing change
+invalidates it.
+"""
+import hashlib
+
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from . import cache
+from .models import Listing
+
+# Upper bounds (exclusive) of the nightly price buckets; the last bucket is open.
+PRICE_EDGES = [50, 100, 200, 500]
+# Parameters that change the page or its order, but not the facet counts.
+IGNORED_PARAMS = {
+    'page', 'page_size', 'cursor', 'pagination', 'count', 'ordering', 'facets', 'format',
+}
+
+
+def price_bucket_labels():
+    bounds = [0, *PRICE_EDGES]
+    labels = [f'{low}-{high}' for low, high in zip(bounds, bounds[1:])]
+    return [*labels, f'{PRICE_EDGES[-1]}+']
+
+
+def price_bucket():
+    """Index of the price bucket of a listing, as a database expression."""
+    return Case(
+        *[When(price_per_night__lt=edge, then=Value(index)) for index, edge in enumerate(PRICE_EDGES)],
+        default=Value(len(PRICE_EDGES)),
+        output_field=IntegerField(),
+    )
+
+
+def compute(queryset):
+    """``{'property_type': {...}, 'city': {...}, 'price': {...}}`` counts for ``queryset``."""
+    labels = price_bucket_labels()
+    facets = {
+        'property_type': {value: 0 for value, _ in Listing.PROPERTY_TYPES},
+        'city': {},
+        'price': {label: 0 for label in labels},
+    }
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket())
+        .values_list('property_type', 'city', 'price_bucket')
+        .annotate(count=Count('pk'))
+    )
+    for property_type, city, bucket, count in rows:
+        facets['property_type'][property_type] = facets['property_type'].get(property_type, 0) + count
+        facets['city'][city] = facets['city'].get(city, 0) + count
+        facets['price'][labels[bucket]] += count
+    facets['city'] = dict(sorted(facets['city'].items(), key=lambda item: (-item[1], item[0])))
+    return facets
+
+
+def facet_counts(queryset, params):
+    """
+    :func:`compute` for ``queryset``, cached under the filter parameters in
+    ``params`` (a QueryDict); pagination and ordering parameters are ignored.
+    """
+    filters = sorted((key, values) for key, values in params.lists() if key not in IGNORED_PARAMS)
+    digest = hashlib.sha1(repr(filters).encode()).hexdigest()
+    version = cache.current_version(cache.LIST_SCOPE)
+    key = f'{cache.KEY_PREFIX}:facets:{version}:{digest}'
+    store = cache.get_cache()
+    facets = store.get(key)
+    if facets is None:
+        facets = compute(queryset)
+        store.set(key, facets, cache.get_timeout())
+    return facets
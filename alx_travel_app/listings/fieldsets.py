@@ -0,0 +1,179 @@
+"""
+Sparse fieldsets and opt-in expansion for the API reads.
+
+``?fields=id,title,price_per_night`` limits each object to the named fields,
+and ``?expand=host`` embeds a related object that otherwise comes as its id.
+Dotted names reach into expanded objects: ``?expand=listing,listing.host``,
+or ``?fields=id,listing.title``, which expands ``listing`` by itself. Without
+either parameter the full representation is rendered, embedded objects and
+all; with one of them, only the expanded relations are embedded.
+
+Views also prune the queryset to what is rendered (:func:`prune`): ``only()``
+the columns of the requested fields, joins for the expanded relations and
+prefetches for the fields that read them, and nothing else.
+"""
+from collections import namedtuple
+
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+class FieldSet(namedtuple('FieldSet', ['fields', 'expanded'])):
+    """
+    What to render of one serializer: ``fields``, a frozenset of field names
+    (None for all of them), and ``expanded``, the relations to embed as
+    ``(name, FieldSet)`` pairs. Hashable, so that compiled serializers can be
+    cached per fieldset.
+    """
+    __slots__ = ()
+
+    def nested(self):
+        return dict(self.expanded)
+
+
+def parse_names(value, param):
+    """``'id,listing.title'`` as a tree: ``{'id': {}, 'listing': {'title': {}}}``."""
+    tree = {}
+    for name in value.split(','):
+        if not name.strip():
+            continue
+        parts = name.strip().split('.')
+        if not all(parts):
+            raise serializers.ValidationError({param: f'Invalid field name: {name.strip()}.'})
+        node = tree
+        for part in parts:
+            node = node.setdefault(part, {})
+    return tree
+
+
+def build(fields, expand):
+    """The FieldSet of parsed ``fields`` (None for all) and ``expand`` trees."""
+    names = set(expand)
+    if fields is not None:
+        names.update(name for name, children in fields.items() if children)
+    expanded = frozenset(
+        (name, build((fields.get(name) or None) if fields is not None else None, expand.get(name, {})))
+        for name in names
+    )
+    return FieldSet(None if fields is None else frozenset(fields), expanded)
+
+
+def from_request(request):
+    """The FieldSet asked for by ``request``, or None for the full representation."""
+    fields = parse_names(request.query_params.get(FIELDS_PARAM, ''), FIELDS_PARAM)
+    expand = parse_names(request.query_params.get(EXPAND_PARAM, ''), EXPAND_PARAM)
+    if not (fields or expand):
+        return None
+    return build(fields or None, expand)
+
+
+class SparseFieldsMixin:
+    """
+    Render only the fields of the ``fieldset`` the serializer is given (None
+    for all). ``expandable`` maps the embedded relations to the attribute
+    holding their id, which is rendered instead unless they are expanded.
+    ``field_columns`` and ``field_prefetches`` tell :func:`prune` what the
+    fields that are not model columns read.
+    """
+    expandable = {}
+    field_columns = {}
+    field_prefetches = {}
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        self.fieldset = fieldset
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldset is None:
+            return fields
+        requested, expanded = self.fieldset.fields, self.fieldset.nested()
+        unknown = set(requested or ()) - {name for name, field in fields.items() if not field.write_only}
+        if unknown:
+            raise serializers.ValidationError({FIELDS_PARAM: f'Unknown field(s): {", ".join(sorted(unknown))}.'})
+        unknown = expanded.keys() - self.expandable.keys()
+        if unknown:
+            raise serializers.ValidationError({EXPAND_PARAM: f'Cannot expand: {", ".join(sorted(unknown))}.'})
+        sparse = {}
+        for name, field in fields.items():
+            if requested is not None and name not in requested:
+                continue
+            if name in expanded:
+                field = type(field)(read_only=True, fieldset=expanded[name])
+            elif name in self.expandable:
+                field = serializers.IntegerField(source=self.expandable[name], read_only=True)
+            sparse[name] = field
+        return sparse
+
+
+def plan(serializer, model, prefix=''):
+    """``(columns, select_related, prefetches)`` for the fields ``serializer`` renders."""
+    concrete = {}
+    for field in model._meta.concrete_fields:
+        concrete[field.name] = concrete[field.attname] = field.name
+    columns, related, prefetches = [], [], []
+    for field in serializer._readable_fields:
+        name = field.field_name
+        if name in getattr(serializer, 'field_prefetches', {}):
+            prefetches.append(serializer.field_prefetches[name](prefix))
+        elif name in getattr(serializer, 'field_columns', {}):
+            columns.extend(prefix + column for column in serializer.field_columns[name])
+        elif isinstance(field, serializers.BaseSerializer):
+            relation = model._meta.get_field(field.source)
+            columns.append(prefix + relation.name)
+            related.append(prefix + relation.name)
+            nested = plan(field, relation.related_model, f'{prefix}{relation.name}__')
+            columns.extend(nested[0])
+            related.extend(nested[1])
+            prefetches.extend(nested[2])
+        elif field.source_attrs and field.source_attrs[0] in concrete:
+            columns.append(prefix + concrete[field.source_attrs[0]])
+    return columns, related, prefetches
+
+
+def prune(queryset, serializer):
+    """
+    ``queryset`` loading only what ``serializer`` (given a fieldset) renders.
+    ``created_at`` is always loaded, for the keyset paginators.
+    """
+    columns, related, prefetches = plan(serializer, queryset.model)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset.only('created_at', *columns)
+
+
+class SparseReadMixin:
+    """
+    Apply ``?fields=`` and ``?expand=`` to the GET responses of
+    ``sparse_actions``: ``get_serializer`` passes the fieldset on, and the
+    views run the querysets they serialize through :meth:`sparse_queryset`.
+    """
+    sparse_actions = ('list', 'retrieve')
+
+    def get_fieldset(self):
+        # Schema generation runs the views without a request.
+        if getattr(self, 'swagger_fake_view', False) or self.request is None:
+            return None
+        if not hasattr(self, 'fieldset'):
+            sparse = self.action in self.sparse_actions and self.request.method in SAFE_METHODS
+            self.fieldset = from_request(self.request) if sparse else None
+        return self.fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        fieldset = self.get_fieldset()
+        if args and fieldset is not None:
+            kwargs['fieldset'] = fieldset
+        return super().get_serializer(*args, **kwargs)
+
+    def sparse_queryset(self, queryset, serializer_class=None):
+        """``queryset`` pruned to the requested fields of ``serializer_class`` (default: the view's)."""
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return queryset
+        return prune(queryset, (serializer_class or self.get_serializer_class())(fieldset=fieldset))
@@ -0,0 +1,126 @@
+"""
+Filter backends for the listings API.
+"""
+import math
+
+import django_filters
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from . import geo, search
+from .amenities import amenity_key
+from .models import Listing, ListingAmenity
+from .serializers import GeoSearchSerializer
+
+
+class AmenityFilter(BaseFilterBackend):
+    """
+    ``?amenities=wifi,pool`` keeps listings that have *all* the given
+    amenities. Names are normalized like on input, so spelling variants
+    match. The lookup runs on the (amenity, listing) unique index.
+    """
+    query_param = 'amenities'
+
+    def filter_queryset(self, request, queryset, view):
+        raw = request.query_params.get(self.query_param)
+        if not raw:
+            return queryset
+        keys = {amenity_key(name) for name in raw.split(',')} - {''}
+        if not keys:
+            return queryset
+        matching = (
+            ListingAmenity.objects.filter(amenity__slug__in=keys)
+            .values('listing')
+            .annotate(matched=Count('amenity'))
+            .filter(matched=len(keys))
+            .values('listing')
+        )
+        return queryset.filter(pk__in=matching)
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    ``?q=beach villa`` keeps listings whose title, description, city or
+    country match every word, ordered by relevance. See ``listings.search``.
+    """
+    query_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.query_param, '').strip()
+        if not query:
+            return queryset
+        return search.search(queryset, query)
+
+
+class GeoFilter(BaseFilterBackend):
+    """
+    ``?lat=&lng=&radius_km=`` keeps listings within the radius, nearest
+    first; ``?bbox=min_lng,min_lat,max_lng,max_lat`` keeps listings inside
+    the box, nearest its center first. Both narrow candidates on the
+    geohash index first.
+    """
+    params = ('lat', 'lng', 'radius_km', 'bbox')
+
+    def filter_queryset(self, request, queryset, view):
+        if not any(param in request.query_params for param in self.params):
+            return queryset
+        serializer = GeoSearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        if params.get('radius_km') is not None:
+            if params.get('bbox'):
+                queryset = queryset.filter(geo.within_bbox(*params['bbox']))
+            queryset = geo.within_radius(
+                queryset, params['lat'], params['lng'], params['radius_km']
+            )
+        elif params.get('bbox'):
+            queryset = geo.within_box(queryset, *params['bbox'])
+        return queryset
+
+
+class RatingFilter(BaseFilterBackend):
+    """
+    ``?min_rating=4.5`` (0 to 5) and ``?min_reviews=10`` filter on the
+    denormalized, indexed review aggregates.
+    """
+    error = 'min_rating must be a number from 0 to 5 and min_reviews an integer.'
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        try:
+            if params.get('min_rating'):
+                min_rating = float(params['min_rating'])
+                # Also rules out nan and inf, which the decimal column rejects.
+                if not (math.isfinite(min_rating) and 0 <= min_rating <= 5):
+                    raise ValidationError(self.error)
+                queryset = queryset.filter(avg_rating__gte=min_rating)
+            if params.get('min_reviews'):
+                queryset = queryset.filter(review_count__gte=int(params['min_reviews']))
+        except ValueError:
+            raise ValidationError(self.error)
+        return queryset
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class ListingFilterSet(django_filters.FilterSet):
+    """
+    Attribute filters for ``ListingViewSet`` (via ``DjangoFilterBackend``):
+    ``city``, ``country``, ``property_type`` (comma-separated), ``min_price``,
+    ``max_price``, ``min_bedrooms`` and ``guests``. Exact matches and ranges
+    only, so each can use an index.
+    """
+    city = django_filters.CharFilter()
+    country = django_filters.CharFilter()
+    property_type = CharInFilter()
+    min_price = django_filters.NumberFilter(field_name='price_per_night', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price_per_night', lookup_expr='lte')
+    min_bedrooms = django_filters.NumberFilter(field_name='bedrooms', lookup_expr='gte')
+    guests = django_filters.NumberFilter(field_name='max_guests', lookup_expr='gte')
+
+    class Meta:
+        model = Listing
+        fields = ['city', 'country', 'property_type']
@@ -0,0 +1,135 @@
+"""
+Geospatial helpers that work without PostGIS.
+
+Listings store a geohash of their coordinates in an indexed column. A
+radius or bounding-box query is first turned into a small set of geohash
+cells covering the area; each cell is a contiguous range of the index, so
+the database only reads nearby candidates. The exact bounding-box or
+great-circle distance check then runs on those candidates only.
+"""
+import math
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """Geohash of a point, ``precision`` characters long."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """``(height, width)`` in degrees of a geohash cell."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def cover(min_lat, min_lng, max_lat, max_lng, max_cells=32):
+    """
+    Geohash prefixes whose cells together cover the bounding box, at the
+    finest precision that needs no more than ``max_cells`` cells.
+    """
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(math.floor((min_lat + 90) / height), math.floor((max_lat + 90) / height) + 1)
+        cols = range(math.floor((min_lng + 180) / width), math.floor((max_lng + 180) / width) + 1)
+        if len(rows) * len(cols) <= max_cells:
+            break
+    cells = set()
+    for row in rows:
+        latitude = min(-90 + (row + 0.5) * height, 90.0)
+        for col in cols:
+            longitude = min(-180 + (col + 0.5) * width, 180.0)
+            cells.add(encode(latitude, longitude, precision))
+    return sorted(cells)
+
+
+def split_bbox(min_lat, min_lng, max_lat, max_lng):
+    """Split a box crossing the antimeridian (``min_lng > max_lng``) in two."""
+    if min_lng <= max_lng:
+        return [(min_lat, min_lng, max_lat, max_lng)]
+    return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """Bounding box ``(min_lat, min_lng, max_lat, max_lng)`` around a circle."""
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    if min_lat == -90.0 or max_lat == 90.0:
+        return min_lat, -180.0, max_lat, 180.0
+    dlng = radius_km / (KM_PER_DEGREE * math.cos(math.radians(latitude)))
+    if dlng >= 180:
+        return min_lat, -180.0, max_lat, 180.0
+    min_lng = (longitude - dlng + 540) % 360 - 180
+    max_lng = (longitude + dlng + 540) % 360 - 180
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def within_bbox(min_lat, min_lng, max_lat, max_lng):
+    """Q object: geohash range scan for candidates, then the exact box check."""
+    condition = Q()
+    for box in split_bbox(min_lat, min_lng, max_lat, max_lng):
+        cells = Q()
+        for prefix in cover(*box):
+            # '{' sorts right after 'z', the last geohash character.
+            cells |= Q(geohash__gte=prefix, geohash__lt=prefix + '{')
+        condition |= cells & Q(
+            latitude__gte=box[0], longitude__gte=box[1],
+            latitude__lte=box[2], longitude__lte=box[3],
+        )
+    return condition
+
+
+def distance_km(latitude, longitude):
+    """Haversine distance from a point, as a database expression."""
+    lat0, lng0 = math.radians(latitude), math.radians(longitude)
+    half_dlat = Sin((Radians(F('latitude')) - lat0) / 2)
+    half_dlng = Sin((Radians(F('longitude')) - lng0) / 2)
+    a = Power(half_dlat, 2) + math.cos(lat0) * Cos(Radians(F('latitude'))) * Power(half_dlng, 2)
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a), output_field=FloatField())
+
+
+def within_box(queryset, min_lat, min_lng, max_lat, max_lng):
+    """
+    Listings inside a bounding box, nearest the box center first.
+
+    Ordering by distance (rather than the default ``-created_at``) also keeps
+    the planner on the geohash index instead of walking the created_at index.
+    """
+    center_lng = (min_lng + max_lng) / 2
+    if min_lng > max_lng:
+        center_lng = (center_lng + 360) % 360 - 180
+    center = ((min_lat + max_lat) / 2, center_lng)
+    return queryset.filter(within_bbox(min_lat, min_lng, max_lat, max_lng)).annotate(
+        distance_km=distance_km(*center)
+    ).order_by('distance_km')
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """Listings within ``radius_km`` of a point, nearest first, with ``distance_km``."""
+    candidates = queryset.filter(within_bbox(*radius_bbox(latitude, longitude, radius_km)))
+    return candidates.annotate(
+        distance_km=distance_km(latitude, longitude)
+    ).filter(distance_km__lte=radius_km).order_by('distance_km')
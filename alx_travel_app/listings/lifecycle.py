@@ -0,0 +1,111 @@
+"""
+Booking lifecycle: status changes that follow from the calendar, and the
+emails that follow from a confirmation.
+
+:func:`advance` runs periodically (``tasks.booking_lifecycle``). It
+completes confirmed bookings whose stay is over and cancels pending ones
+that were never confirmed, with one UPDATE per batch of bookings rather
+than a save per row. Neither change touches the analytics rollups:
+confirmed and completed bookings both count as revenue, and pending or
+cancelled ones never do.
+
+:func:`send_confirmations` runs in a worker after a booking is confirmed
+(see ``tasks.queue_confirmations``), so the request does not wait on SMTP.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from . import occupancy
+from .models import Booking
+
+
+def get_pending_ttl():
+    return timedelta(hours=getattr(settings, 'LISTINGS_PENDING_TTL_HOURS', 24))
+
+
+def get_batch_size():
+    return getattr(settings, 'LISTINGS_LIFECYCLE_BATCH_SIZE', 1000)
+
+
+def transition(queryset, status, now, batch_size, listings=None):
+    """
+    Set ``status`` on the bookings in ``queryset``, ``batch_size`` per
+    UPDATE so that no statement holds its locks for long. Each UPDATE
+    re-applies the queryset's filters, so a booking changed since it was
+    selected is left alone. Returns the number of bookings changed, and
+    adds their listings' ids to the ``listings`` set if one is given.
+    """
+    queryset = queryset.order_by('pk')
+    rows = queryset.values_list('pk', 'listing_id')
+    changed, last_pk = 0, 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return changed
+        changed += queryset.filter(pk__in=[pk for pk, _ in batch]).update(status=status, updated_at=now)
+        if listings is not None:
+            listings.update(listing_id for _, listing_id in batch)
+        last_pk = batch[-1][0]
+
+
+def advance(now=None, batch_size=None, using='default'):
+    """
+    Complete confirmed bookings whose check-out day has come, and cancel
+    pending bookings older than ``LISTINGS_PENDING_TTL_HOURS`` or whose
+    check-in day has come. Returns how many bookings went each way.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or get_batch_size()
+    today = timezone.localdate(now)
+    bookings = Booking.objects.using(using)
+    finished = bookings.filter(status='confirmed', check_out__lte=today)
+    stale = bookings.filter(
+        Q(created_at__lt=now - get_pending_ttl()) | Q(check_in__lte=today), status='pending'
+    )
+    # Completing a booking keeps its nights taken; expiring one frees them.
+    freed = set()
+    counts = {
+        'completed': transition(finished, 'completed', now, batch_size),
+        'expired': transition(stale, 'cancelled', now, batch_size, listings=freed),
+    }
+    occupancy.invalidate(freed, using=using)
+    return counts
+
+
+def confirmation_messages(booking):
+    stay = f'{booking.check_in:%d %b %Y} to {booking.check_out:%d %b %Y}'
+    listing = booking.listing
+    if booking.guest.email:
+        yield EmailMessage(
+            f'Your stay at {listing.title} is confirmed',
+            f'Hi {booking.guest.first_name or booking.guest.username},\n\n'
+            f'Your booking #{booking.pk} at {listing.title}, {listing.city}, for {stay} '
+            f'({booking.guests_count} guests) is confirmed. Total: {booking.total_price}.',
+            to=[booking.guest.email],
+        )
+    if listing.host.email:
+        yield EmailMessage(
+            f'New confirmed booking for {listing.title}',
+            f'Booking #{booking.pk} by {booking.guest.username} for {stay} '
+            f'({booking.guests_count} guests) is confirmed. Total: {booking.total_price}.',
+            to=[listing.host.email],
+        )
+
+
+def send_confirmations(booking_ids, using='default'):
+    """
+    Email the guest and the host of each booking in ``booking_ids`` that is
+    still confirmed, over one connection. Returns the number of emails sent.
+    """
+    bookings = (
+        Booking.objects.using(using).filter(pk__in=booking_ids, status='confirmed')
+        .select_related('listing', 'listing__host', 'guest').order_by('pk')
+    )
+    messages = [message for booking in bookings for message in confirmation_messages(booking)]
+    if not messages:
+        return 0
+    return get_connection().send_messages(messages)
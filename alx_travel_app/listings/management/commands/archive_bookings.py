@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from listings import archive
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Move completed and cancelled bookings that checked out more than '
+        'LISTINGS_ARCHIVE_AFTER_DAYS ago into the archive table, in batches'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Bookings per transaction (default: LISTINGS_ARCHIVE_BATCH_SIZE).')
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the bookings that would move.')
+    
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = archive.archivable(using=options['database']).count()
+            self.stdout.write(f'{count} bookings would be archived.')
+            return
+        
+        started = time.perf_counter()
+        
+        def progress(total):
+            rate = total / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(f'  {total} bookings archived ({rate:.0f}/s)')
+        
+        total = archive.archive(
+            batch_size=options['batch_size'], using=options['database'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {total} bookings in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,181 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from listings.benchmarking import summarize, wsgi_get
+from listings.models import Booking, Listing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+# asgi-sync is the ASGI handler with the plain DRF views, for reference.
+SERVERS = ('wsgi', 'asgi-sync', 'asgi')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the hot read endpoints (listing list, detail, availability, '
+        'booking list) under a threaded WSGI handler and under the ASGI handler '
+        'with and without the native async views, in-process, at several client '
+        'counts. '
+        'Each server runs in its own process against the current database; run '
+        '"seed" first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 50, 500])
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per concurrency level.')
+        parser.add_argument('--server', choices=[*SERVERS, 'all'], default='all')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['server'] == 'all':
+            report = {'requests': options['requests']}
+            for server in SERVERS:
+                report[server] = self.run_child(server, options)
+            # How the async views compare with each baseline: > 1 is better.
+            report['speedup'] = {
+                baseline: {
+                    clients: {
+                        'rps': round(report['asgi'][clients]['rps'] / result['rps'], 2),
+                        'p99': round(result['p99_ms'] / report['asgi'][clients]['p99_ms'], 2),
+                    }
+                    for clients, result in report[baseline].items()
+                }
+                for baseline in ('wsgi', 'asgi-sync')
+            }
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        if not Listing.objects.exists() or not Booking.objects.exists():
+            raise CommandError('No listings or bookings to read; run "manage.py seed" first.')
+        client = Client()
+        client.force_login(User.objects.get(pk=Booking.objects.values_list('guest', flat=True).first()))
+        try:
+            count = max(options['requests'], *options['concurrency'])
+            targets = self.targets(count, options['seed'], client.cookies[settings.SESSION_COOKIE_NAME].value)
+            run = self.run_wsgi if options['server'] == 'wsgi' else self.run_asgi
+            run(targets[:20], 1)  # warm up
+            report = {}
+            for clients in options['concurrency']:
+                report[clients] = run(targets[:max(options['requests'], clients)], clients)
+        finally:
+            client.logout()
+        self.stdout.write(json.dumps(report))
+
+    def run_child(self, server, options):
+        """Run one server in a fresh process, since the URLconf is fixed at import."""
+        env = {**os.environ, 'LISTINGS_ASYNC_READS': 'true' if server == 'asgi' else 'false'}
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_asgi', '--server', server,
+            '--requests', str(options['requests']), '--seed', str(options['seed']),
+            '--concurrency', *map(str, options['concurrency']),
+        ]
+        self.stderr.write(f'Benchmarking {server}...')
+        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'The {server} run failed:\n{result.stderr}')
+        return json.loads(result.stdout)
+
+    def targets(self, count, seed, session):
+        """A repeatable random mix of ``count`` ``(path, query, cookie)`` reads."""
+        rng = random.Random(seed)
+        last_pk = Listing.objects.order_by('-pk').values_list('pk', flat=True).first()
+        cities = list(Listing.objects.order_by().values_list('city', flat=True).distinct()[:20])
+        cookie = f'{settings.SESSION_COOKIE_NAME}={session}'
+        targets = []
+        for _ in range(count):
+            kind = rng.random()
+            if kind < 0.3:
+                query = f'page={rng.randint(1, 5)}&city={rng.choice(cities)}'
+                targets.append(('/api/listings/', query, ''))
+            elif kind < 0.6:
+                targets.append((f'/api/listings/{rng.randint(1, last_pk)}/', '', ''))
+            elif kind < 0.85:
+                check_in = date.today() + timedelta(days=rng.randint(1, 90))
+                stay = f'check_in={check_in}&check_out={check_in + timedelta(days=rng.randint(1, 7))}'
+                targets.append(('/api/listings/available/', f'{stay}&city={rng.choice(cities)}', ''))
+            else:
+                targets.append(('/api/bookings/', '', cookie))
+        return targets
+
+    def host(self):
+        return next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')
+                     and not host.startswith('.')), 'localhost')
+
+    def run_wsgi(self, targets, clients):
+        """``clients`` threads, like a threaded WSGI server with that many workers."""
+        from django.core.wsgi import get_wsgi_application
+        application = get_wsgi_application()
+        host = self.host()
+
+        def request(target):
+            elapsed, status_code, _ = wsgi_get(application, host, *target)
+            return elapsed, status_code == 200
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            results = list(pool.map(request, targets))
+        return self.summarize(results, time.perf_counter() - started)
+
+    def run_asgi(self, targets, clients):
+        """``clients`` concurrent requests on one event loop, like an ASGI server."""
+        from django.core.asgi import get_asgi_application
+        application = get_asgi_application()
+        host = self.host()
+
+        async def request(target):
+            path, query, cookie = target
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+                'query_string': query.encode(), 'client': ('127.0.0.1', 0), 'server': (host, 80),
+                'headers': [(b'host', host.encode()), (b'cookie', cookie.encode())],
+            }
+            done, sent, statuses = asyncio.Event(), [], []
+
+            async def receive():
+                if not sent:
+                    sent.append(True)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await done.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                elif not message.get('more_body'):
+                    done.set()
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - started, statuses[0] == 200
+
+        async def run():
+            queue = iter(targets)
+            results = []
+
+            async def client():
+                for target in queue:
+                    results.append(await request(target))
+
+            await asyncio.gather(*(client() for _ in range(clients)))
+            return results
+
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        return self.summarize(results, time.perf_counter() - started)
+
+    def summarize(self, results, elapsed):
+        timings = [duration for duration, _ in results]
+        return {
+            **summarize(timings),
+            'non_200': sum(not ok for _, ok in results),
+            'rps': round(len(results) / elapsed, 1),
+        }
@@ -0,0 +1,122 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from listings.benchmarking import next_id, rolled_back, summarize, time_runs
+from listings.models import Listing, Booking
+from datetime import date, timedelta
+from decimal import Decimal
+import json
+import random
+import time
+
+CITIES = [
+    'Lagos', 'Abuja', 'Accra', 'Nairobi', 'Cairo', 'Cape Town', 'Kigali', 'Dakar',
+    'New York', 'Miami', 'Austin', 'Aspen', 'San Francisco', 'Chicago', 'Seattle',
+    'London', 'Paris', 'Berlin', 'Lisbon', 'Madrid', 'Rome', 'Athens', 'Prague',
+    'Tokyo', 'Seoul', 'Bangkok', 'Singapore', 'Sydney', 'Dubai', 'Istanbul',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the availability search against a synthetic catalog. '
+        'The data is created inside a transaction that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100_000)
+        parser.add_argument('--bookings', type=int, default=1_000_000)
+        parser.add_argument('--runs', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        with rolled_back():
+            started = time.perf_counter()
+            self.populate(options['listings'], options['bookings'])
+            self.stdout.write(f'Populated in {time.perf_counter() - started:.1f}s')
+            report = self.run_queries(options['runs'])
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def populate(self, listing_count, booking_count):
+        host_id = next_id(User)
+        hosts = [
+            User(id=host_id + i, username=f'bench_host_{host_id + i}', password='!')
+            for i in range(max(1, listing_count // 100))
+        ]
+        User.objects.bulk_create(hosts, batch_size=self.batch_size)
+
+        first_listing = next_id(Listing)
+        batch = []
+        for i in range(listing_count):
+            batch.append(Listing(
+                id=first_listing + i,
+                title=f'Bench listing {i}',
+                description='Synthetic listing for benchmarking.',
+                address=f'{i} Bench Street',
+                city=self.rng.choice(CITIES),
+                country='Benchland',
+                price_per_night=Decimal(self.rng.randint(30, 500)),
+                max_guests=self.rng.randint(1, 10),
+                bedrooms=self.rng.randint(1, 5),
+                bathrooms=self.rng.randint(1, 3),
+                property_type=self.rng.choice(Listing.PROPERTY_TYPES)[0],
+                host=self.rng.choice(hosts),
+            ))
+            if len(batch) == self.batch_size:
+                Listing.objects.bulk_create(batch)
+                batch = []
+        Listing.objects.bulk_create(batch)
+        self.stdout.write(f'Created {listing_count} listings')
+
+        # Non-overlapping stays per listing, spread over two years.
+        start = date.today() - timedelta(days=365)
+        per_listing, remainder = divmod(booking_count, listing_count)
+        guest = hosts[0]
+        batch = []
+        created = 0
+        for i in range(listing_count):
+            day = start + timedelta(days=self.rng.randint(0, 30))
+            for _ in range(per_listing + (1 if i < remainder else 0)):
+                nights = self.rng.randint(1, 7)
+                batch.append(Booking(
+                    listing_id=first_listing + i,
+                    guest=guest,
+                    check_in=day,
+                    check_out=day + timedelta(days=nights),
+                    total_price=Decimal(nights * 100),
+                    guests_count=1,
+                    status=self.rng.choices(
+                        ['confirmed', 'completed', 'pending', 'cancelled'], [5, 3, 1, 1]
+                    )[0],
+                ))
+                day += timedelta(days=nights + self.rng.randint(0, 60))
+                if len(batch) == self.batch_size:
+                    Booking.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+                    if created % (self.batch_size * 40) == 0:
+                        self.stdout.write(f'  {created} bookings')
+        Booking.objects.bulk_create(batch)
+        self.stdout.write(f'Created {booking_count} bookings')
+
+    def random_search(self):
+        check_in = date.today() + timedelta(days=self.rng.randint(-300, 300))
+        check_out = check_in + timedelta(days=self.rng.randint(2, 7))
+        listings = Listing.objects.available(check_in, check_out, self.rng.randint(1, 4))
+        return listings.filter(city=self.rng.choice(CITIES))
+
+    def run_queries(self, runs):
+        self.stdout.write('Query plan:')
+        self.stdout.write(self.random_search().explain())
+        first_page = time_runs(lambda: list(self.random_search()[:20]), runs)
+        count = time_runs(lambda: self.random_search().count(), runs)
+        return {
+            'listings': Listing.objects.count(),
+            'bookings': Booking.objects.count(),
+            'first_page': summarize(first_page),
+            'count': summarize(count),
+        }
@@ -0,0 +1,172 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test import Client, override_settings
+from listings import cache
+from listings.benchmarking import compare, summarize, wsgi_get
+from listings.models import Booking, Listing
+from listings.replicas import get_replicas
+from listings.synthetic import Generator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+import django
+import json
+import platform
+import random
+import re
+import time
+
+SCENARIOS = ('listings', 'listing-bookings', 'bookings')
+BASELINE = Path(__file__).resolve().parents[2] / 'benchmarks' / 'endpoints.json'
+# Bookings are generated around a fixed day, so every run sees the same data.
+TODAY = date(2030, 1, 1)
+QUERY_COUNT = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the API routes with concurrent in-process clients against a '
+        'seeded dataset in a separate database, and report throughput, latency '
+        'percentiles and queries per request as JSON. With --baseline, flag '
+        'regressions against a previous report and fail if there are any.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1000)
+        parser.add_argument('--bookings', type=int, help='Default: 10 per listing.')
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--requests', type=int, default=300, help='Requests per scenario and concurrency level.')
+        parser.add_argument('--baseline', nargs='?', const=str(BASELINE),
+                            help=f'Compare with this report (default {BASELINE.name} when given without a path).')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed fraction of p95 or throughput regression. Queries per request '
+                                 'may grow by half a query at most, and non-2xx responses not at all.')
+        parser.add_argument('--save-baseline', nargs='?', const=str(BASELINE), help='Write the report here.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database, and reuse it if it holds a dataset of the same size.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read the baseline: {exc}')
+
+        replicas = [connections[alias] for alias in get_replicas()]
+        if any(replica.vendor != connection.vendor for replica in replicas):
+            raise CommandError('The replicas must use the same database engine as the primary.')
+        replica_names = [replica.settings_dict['NAME'] for replica in replicas]
+        old_name = connection.settings_dict['NAME']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        test_settings['NAME'] = self.database_name(old_name)
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        # Replica reads go to the benchmark database too, as with TEST MIRROR.
+        for replica in replicas:
+            replica.close()
+            replica.creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            dataset = self.seed(options)
+            # Every request sampled for its query count; nothing logged as slow.
+            with override_settings(DEBUG=False, LISTINGS_PERF_SAMPLE_RATE=1.0,
+                                   LISTINGS_PERF_SERVER_TIMING=True, LISTINGS_PERF_SLOW_MS=float('inf')):
+                results = self.run(options)
+        finally:
+            for replica, name in zip(replicas, replica_names):
+                replica.close()
+                replica.settings_dict['NAME'] = name
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        report = {
+            'dataset': dataset,
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'requests': options['requests'],
+            },
+            'results': results,
+        }
+        if baseline is not None:
+            report['regressions'] = compare(results, baseline['results'], options['tolerance'])
+        if options['save_baseline']:
+            Path(options['save_baseline']).write_text(json.dumps(report, indent=2) + '\n')
+        self.stdout.write(json.dumps(report, indent=2))
+        if report.get('regressions'):
+            raise CommandError(f'{len(report["regressions"])} regression(s) against the baseline.')
+
+    def database_name(self, name):
+        if connection.vendor == 'sqlite':
+            return str(settings.BASE_DIR / 'bench_db.sqlite3')
+        return f'bench_{name}'
+
+    def seed(self, options):
+        """Generate the dataset, unless a kept database already holds it."""
+        dataset = {
+            'listings': options['listings'],
+            'bookings': options['bookings'] if options['bookings'] is not None else options['listings'] * 10,
+            'seed': options['seed'],
+        }
+        if Listing.objects.count() == dataset['listings'] and Booking.objects.count() == dataset['bookings']:
+            return dataset
+        call_command('flush', interactive=False, verbosity=0)
+        self.stderr.write(f'Seeding {dataset["listings"]} listings and {dataset["bookings"]} bookings...')
+        Generator(
+            dataset['listings'], dataset['bookings'], users=options['users'], seed=options['seed'], today=TODAY
+        ).run()
+        return dataset
+
+    def targets(self, scenario, count, rng):
+        """``count`` ``(path, query, cookie)`` requests for ``scenario``."""
+        if scenario == 'listings':
+            cities = list(Listing.objects.order_by('city').values_list('city', flat=True).distinct()[:10])
+            queries = [f'page={page}' for page in range(1, 6)] + [f'city={city}' for city in cities]
+            return [('/api/listings/', rng.choice(queries), '') for _ in range(count)]
+        if scenario == 'listing-bookings':
+            pks = list(Listing.objects.order_by('pk').values_list('pk', flat=True))
+            return [(f'/api/listings/{rng.choice(pks)}/bookings/', '', '') for _ in range(count)]
+        guests = User.objects.filter(bookings__isnull=False).distinct().order_by('pk')[:20]
+        cookies = []
+        for guest in guests:
+            client = Client()
+            client.force_login(guest)
+            cookies.append(f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}')
+        return [('/api/bookings/', '', rng.choice(cookies)) for _ in range(count)]
+
+    def run(self, options):
+        application = get_wsgi_application()
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')
+                     and not host.startswith('.')), 'localhost')
+        rng = random.Random(options['seed'])
+        results = {}
+        for scenario in options['scenarios']:
+            results[scenario] = {}
+            targets = self.targets(scenario, max(options['requests'], *options['concurrency']), rng)
+            self.drive(application, host, targets[:20], 1)  # warm up
+            for clients in options['concurrency']:
+                self.stderr.write(f'{scenario}: {clients} client(s)...')
+                # Every level starts from an empty response cache.
+                cache.get_cache().clear()
+                results[scenario][str(clients)] = self.drive(application, host, targets, clients)
+        return results
+
+    def drive(self, application, host, targets, clients):
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            started = time.perf_counter()
+            responses = list(pool.map(lambda target: wsgi_get(application, host, *target), targets))
+            elapsed = time.perf_counter() - started
+        counts = [QUERY_COUNT.search(headers.get('Server-Timing', '')) for _, _, headers in responses]
+        counts = [int(match.group(1)) for match in counts if match]
+        return {
+            **summarize([duration for duration, _, _ in responses]),
+            'rps': round(len(responses) / elapsed, 1),
+            'queries_per_request': round(sum(counts) / len(counts), 2) if counts else None,
+            'non_2xx': sum(not 200 <= status_code < 300 for _, status_code, _ in responses),
+        }
@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from listings import geo
+from listings.benchmarking import next_id, rolled_back, summarize, time_runs
+from listings.models import Listing
+from decimal import Decimal
+import json
+import random
+import time
+
+CENTERS = [
+    (6.5244, 3.3792), (9.0765, 7.3986), (5.6037, -0.1870), (-1.2921, 36.8219),
+    (30.0444, 31.2357), (-33.9249, 18.4241), (40.7128, -74.0060), (25.7617, -80.1918),
+    (51.5074, -0.1278), (48.8566, 2.3522), (52.5200, 13.4050), (38.7223, -9.1393),
+    (35.6762, 139.6503), (1.3521, 103.8198), (-33.8688, 151.2093), (25.2048, 55.2708),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark radius and bounding-box search against a synthetic catalog, '
+        'comparing the geohash-narrowed query with a full distance scan. '
+        'The data is created inside a transaction that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=200_000)
+        parser.add_argument('--runs', type=int, default=100)
+        parser.add_argument('--radius-km', type=float, default=10)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        with rolled_back():
+            started = time.perf_counter()
+            self.populate(options['listings'], options['batch_size'])
+            self.stdout.write(f'Populated in {time.perf_counter() - started:.1f}s')
+            report = self.run_queries(options['runs'], options['radius_km'])
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def populate(self, count, batch_size):
+        host = User.objects.create(username=f'bench_host_{next_id(User)}', password='!')
+        first_id = next_id(Listing)
+        batch = []
+        for i in range(count):
+            latitude, longitude = self.rng.choice(CENTERS)
+            listing = Listing(
+                id=first_id + i,
+                title=f'Bench listing {i}',
+                description='Synthetic listing for benchmarking.',
+                address=f'{i} Bench Street',
+                city='Bench City',
+                country='Benchland',
+                # Roughly within 50 km of a city center.
+                latitude=latitude + self.rng.gauss(0, 0.2),
+                longitude=longitude + self.rng.gauss(0, 0.2),
+                price_per_night=Decimal(100),
+                max_guests=2,
+                bedrooms=1,
+                bathrooms=1,
+                property_type='apartment',
+                host=host,
+            )
+            listing.refresh_geohash()
+            batch.append(listing)
+            if len(batch) == batch_size:
+                Listing.objects.bulk_create(batch)
+                batch = []
+        Listing.objects.bulk_create(batch)
+
+    def random_point(self):
+        latitude, longitude = self.rng.choice(CENTERS)
+        return latitude + self.rng.gauss(0, 0.1), longitude + self.rng.gauss(0, 0.1)
+
+    def run_queries(self, runs, radius_km):
+        listings = Listing.objects.all()
+
+        def indexed_radius():
+            return list(geo.within_radius(listings, *self.random_point(), radius_km).values_list('pk'))
+
+        def full_scan_radius():
+            latitude, longitude = self.random_point()
+            return list(
+                listings.filter(latitude__isnull=False)
+                .annotate(distance_km=geo.distance_km(latitude, longitude))
+                .filter(distance_km__lte=radius_km)
+                .values_list('pk')
+            )
+
+        def indexed_bbox():
+            latitude, longitude = self.random_point()
+            box = geo.radius_bbox(latitude, longitude, radius_km)
+            return list(geo.within_box(listings, *box).values_list('pk'))
+
+        latitude, longitude = self.random_point()
+        box = geo.radius_bbox(latitude, longitude, radius_km)
+        self.stdout.write('Query plan (bbox):')
+        self.stdout.write(geo.within_box(listings, *box).explain())
+
+        results = {
+            'listings': Listing.objects.count(),
+            'radius_km': radius_km,
+            'matches_per_radius_query': len(indexed_radius()),
+            'geohash_radius': summarize(time_runs(indexed_radius, runs)),
+            'geohash_bbox': summarize(time_runs(indexed_bbox, runs)),
+            # The full scan evaluates the distance for every row, so keep it short.
+            'full_scan_radius': summarize(time_runs(full_scan_radius, max(1, runs // 10))),
+        }
+        return results
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from listings.benchmarking import hammer_reservations, next_id
+from listings.models import Listing
+from datetime import date, timedelta
+from decimal import Decimal
+import json
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure reservation throughput with concurrent threads booking overlapping '
+        'stays, on one listing and spread over several. The threads need committed '
+        'data, so the listings are created for real and deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=50, help='Reservations per thread.')
+
+    def handle(self, *args, **options):
+        user_id = next_id(User)
+        host = User.objects.create(username=f'bench_host_{user_id}', password='!')
+        guest = User.objects.create(username=f'bench_guest_{user_id}', password='!')
+        try:
+            listing_ids = [
+                Listing.objects.create(
+                    title=f'Bench listing {i}',
+                    description='Synthetic listing for benchmarking.',
+                    address=f'{i} Bench Street',
+                    city='Bench City',
+                    country='Benchland',
+                    price_per_night=Decimal(100),
+                    max_guests=2,
+                    bedrooms=1,
+                    bathrooms=1,
+                    property_type='apartment',
+                    host=host,
+                ).pk
+                for i in range(options['listings'])
+            ]
+            # Far enough ahead not to meet real bookings in the calendar.
+            start = date.today() + timedelta(days=3650)
+            report = {}
+            for name, ids in (('same_listing', listing_ids[:1]), ('many_listings', listing_ids)):
+                outcomes, elapsed = hammer_reservations(
+                    ids, guest, start, options['threads'], options['attempts']
+                )
+                report[name] = {
+                    'listings': len(ids),
+                    'reservations': len(outcomes),
+                    'booked': outcomes.count('booked'),
+                    'conflicts': outcomes.count('conflict'),
+                    'per_second': round(len(outcomes) / elapsed, 1),
+                }
+                start += timedelta(days=365)
+        finally:
+            # Deleting the users cascades to their listings and bookings.
+            User.objects.filter(pk__in=[host.pk, guest.pk]).delete()
+        self.stdout.write(json.dumps(report, indent=2))
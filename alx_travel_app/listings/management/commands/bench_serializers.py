@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+from listings.benchmarking import next_id, rolled_back, summarize, time_runs
+from listings.compiled import compile_serializer
+from listings.models import Amenity, Booking, Listing, ListingAmenity
+from listings.serializers import BookingSerializer, ListingSerializer
+from datetime import date, timedelta
+from decimal import Decimal
+import json
+
+AMENITIES = ['WiFi', 'Kitchen', 'Pool', 'Air Conditioning', 'Free Parking', 'TV']
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the compiled read serializers against the DRF serializers '
+        'on a page of listings and bookings, and check that both render the '
+        'same JSON. The data is created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', type=int, default=1000, help='Objects serialized per run.')
+        parser.add_argument('--runs', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.populate(options['objects'])
+            listings = list(Listing.objects.for_serialization().order_by('-pk')[:options['objects']])
+            bookings = list(Booking.objects.for_serialization().order_by('-pk')[:options['objects']])
+            report = {
+                'objects': options['objects'],
+                'listings': self.compare(ListingSerializer, listings, options['runs']),
+                'bookings': self.compare(BookingSerializer, bookings, options['runs']),
+            }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def populate(self, count):
+        host = User.objects.create(username=f'bench_host_{next_id(User)}', password='!')
+        guest = User.objects.create(username=f'bench_guest_{next_id(User)}', password='!')
+        amenities = Amenity.objects.resolve(AMENITIES)
+        first_id = next_id(Listing)
+        Listing.objects.bulk_create([
+            Listing(
+                id=first_id + i,
+                title=f'Bench listing {i}',
+                description='Synthetic listing for benchmarking.',
+                address=f'{i} Bench Street',
+                city='Bench City',
+                country='Benchland',
+                latitude=6.5 + i / 10000,
+                longitude=3.3 + i / 10000,
+                price_per_night=Decimal('120.50'),
+                max_guests=4,
+                bedrooms=2,
+                bathrooms=1,
+                property_type='apartment',
+                host=host,
+            )
+            for i in range(count)
+        ])
+        ListingAmenity.objects.bulk_create([
+            ListingAmenity(listing_id=first_id + i, amenity=amenity, position=position)
+            for i in range(count)
+            for position, amenity in enumerate(amenities[:3 + i % 3])
+        ])
+        start = date.today() + timedelta(days=1)
+        Booking.objects.bulk_create([
+            Booking(
+                listing_id=first_id + i,
+                guest=guest,
+                check_in=start,
+                check_out=start + timedelta(days=2),
+                total_price=Decimal('241.00'),
+                guests_count=2,
+            )
+            for i in range(count)
+        ])
+
+    def compare(self, serializer_class, instances, runs):
+        compiled = compile_serializer(serializer_class)
+        renderer = JSONRenderer()
+        if renderer.render(compiled.many(instances)) != renderer.render(
+            serializer_class(instances, many=True).data
+        ):
+            raise CommandError(f'Compiled {serializer_class.__name__} renders different JSON.')
+
+        drf = time_runs(lambda: serializer_class(instances, many=True).data, runs)
+        fast = time_runs(lambda: compiled.many(instances), runs)
+        drf_rate = len(instances) * runs / sum(drf)
+        fast_rate = len(instances) * runs / sum(fast)
+        return {
+            'drf': summarize(drf),
+            'compiled': summarize(fast),
+            'drf_objects_per_sec': round(drf_rate),
+            'compiled_objects_per_sec': round(fast_rate),
+            'speedup': round(fast_rate / drf_rate, 2),
+        }
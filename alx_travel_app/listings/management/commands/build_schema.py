@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from listings import apidocs
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate the OpenAPI schema into API_SCHEMA_DIR, where the docs routes '
+        'serve it from; run on every deploy. Does nothing when API_DOCS_ENABLED is off.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Directory to write into (default: API_SCHEMA_DIR).')
+    
+    def handle(self, *args, **options):
+        if not apidocs.docs_enabled():
+            self.stdout.write('API docs are disabled; not building the schema.')
+            return
+        
+        started = time.perf_counter()
+        paths = apidocs.build(options['output'])
+        for path in paths:
+            self.stdout.write(f'  {path} ({path.stat().st_size} bytes)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Built the schema in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from listings import search
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the listing full-text search index in batches'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+    
+    def handle(self, *args, **options):
+        using = options['database']
+        backend = search.get_backend(connections[using])
+        self.stdout.write(f'Rebuilding search index with {type(backend).__name__}...')
+        
+        started = time.perf_counter()
+        
+        def progress(total):
+            rate = total / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(f'  {total} listings indexed ({rate:.0f}/s)')
+        
+        total = search.rebuild(options['batch_size'], using=using, progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} listings in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from listings import ratings
+import time
+
+
+class Command(BaseCommand):
+    help = 'Recompute listing rating aggregates from reviews, repairing any drift'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+    
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        
+        def progress(checked, repaired):
+            self.stdout.write(f'  {checked} listings checked, {repaired} repaired')
+        
+        checked, repaired = ratings.recompute(
+            options['batch_size'], using=options['database'], progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} listings, repaired {repaired} in '
+            f'{time.perf_counter() - started:.1f}s'
+        ))
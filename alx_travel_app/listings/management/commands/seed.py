@@ -1,13 +1,32 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from listings.models import Listing, Booking, Review
+from listings.synthetic import Generator
 from datetime import datetime, timedelta
 import random
+import time
 
 class Command(BaseCommand):
-    help = 'Seed the database with sample data for ALX Travel App'
+    help = (
+        'Seed the database with sample data for ALX Travel App. Pass --listings '
+        '(and optionally --bookings) to generate synthetic data at scale instead.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, help='Scale mode: number of listings to generate.')
+        parser.add_argument('--bookings', type=int, help='Scale mode: total bookings (default 10 per listing).')
+        parser.add_argument('--users', type=int, help='Scale mode: users to draw hosts and guests from.')
+        parser.add_argument('--seed', type=int, default=42, help='Scale mode: random seed.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Scale mode: listings (with their bookings) per transaction.')
+        parser.add_argument('--database', default='default')
     
     def handle(self, *args, **options):
+        if options['listings'] is not None:
+            return self.generate(options)
+        if options['bookings'] is not None or options['users'] is not None:
+            raise CommandError('--bookings and --users require --listings.')
+        
         self.stdout.write('Seeding database...')
         
         # Create sample users
@@ -38,6 +57,8 @@ class Command(BaseCommand):
                 'address': '123 Main St',
                 'city': 'New York',
                 'country': 'USA',
+                'latitude': 40.7128,
+                'longitude': -74.006,
                 'price_per_night': 120.00,
                 'max_guests': 4,
                 'bedrooms': 2,
@@ -52,6 +73,8 @@ class Command(BaseCommand):
                 'address': '456 Beach Road',
                 'city': 'Miami',
                 'country': 'USA',
+                'latitude': 25.7617,
+                'longitude': -80.1918,
                 'price_per_night': 350.00,
                 'max_guests': 8,
                 'bedrooms': 4,
@@ -66,6 +89,8 @@ class Command(BaseCommand):
                 'address': '789 Mountain View',
                 'city': 'Aspen',
                 'country': 'USA',
+                'latitude': 39.1911,
+                'longitude': -106.8175,
                 'price_per_night': 180.00,
                 'max_guests': 6,
                 'bedrooms': 3,
@@ -80,6 +105,8 @@ class Command(BaseCommand):
                 'address': '321 Central Ave',
                 'city': 'San Francisco',
                 'country': 'USA',
+                'latitude': 37.7749,
+                'longitude': -122.4194,
                 'price_per_night': 95.00,
                 'max_guests': 2,
                 'bedrooms': 1,
@@ -94,6 +121,8 @@ class Command(BaseCommand):
                 'address': '654 Family Lane',
                 'city': 'Austin',
                 'country': 'USA',
+                'latitude': 30.2672,
+                'longitude': -97.7431,
                 'price_per_night': 220.00,
                 'max_guests': 10,
                 'bedrooms': 5,
@@ -106,11 +135,14 @@ class Command(BaseCommand):
         
         listings = []
         for listing_data in listings_data:
+            amenities = listing_data.pop('amenities')
             listing, created = Listing.objects.get_or_create(
                 title=listing_data['title'],
                 city=listing_data['city'],
                 defaults=listing_data
             )
+            if created:
+                listing.set_amenities(amenities)
             listings.append(listing)
             status = 'Created' if created else 'Exists'
             self.stdout.write(f'{status} listing: {listing.title}')
@@ -161,4 +193,33 @@ class Command(BaseCommand):
         
         self.stdout.write(
             self.style.SUCCESS('Successfully seeded database with sample data!')
-        )
\ No newline at end of file
+        )
+    
+    def generate(self, options):
+        """Stream synthetic data into the database in batched transactions."""
+        if options['listings'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--listings and --chunk-size must be positive.')
+        bookings = options['bookings']
+        if bookings is None:
+            bookings = options['listings'] * 10
+        generator = Generator(
+            options['listings'], bookings, users=options['users'],
+            seed=options['seed'], using=options['database'],
+        )
+        self.stdout.write(
+            f'Generating {generator.user_count} users, {generator.listing_count} listings '
+            f'and {generator.booking_count} bookings (seed {options["seed"]})...'
+        )
+        
+        def progress(totals, elapsed):
+            rows = sum(totals.values())
+            self.stdout.write(
+                f'  {totals["listings"]}/{generator.listing_count} listings, '
+                f'{totals["bookings"]} bookings, {totals["reviews"]} reviews, '
+                f'{totals["users"]} users - {rows / elapsed:,.0f} rows/s'
+            )
+        
+        totals = generator.run(options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {sum(totals.values())} rows in {time.perf_counter() - generator.started:.1f}s'
+        ))
@@ -0,0 +1,101 @@
+"""
+Django's stock middleware, adapted for ASGI.
+
+Under ASGI, Django runs each hook of a ``MiddlewareMixin`` middleware in a
+``sync_to_async`` hop to the request's thread-sensitive executor, in case
+it does I/O. With the default stack that is over a dozen thread hand-offs
+per request, which costs more than serving a cached response. The hooks
+of the middleware below only inspect the request and set headers, so
+these subclasses call them directly on the event loop instead. Settings
+swap them in for the originals only with ``LISTINGS_ASYNC_READS`` on;
+under WSGI they would behave exactly like the originals anyway.
+
+Session and message middleware are left alone: saving a session, or
+messages stored in it, hits the database.
+
+``PerformanceMiddleware`` is this app's own; see ``listings.perf``.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.middleware import clickjacking, common, csrf, security
+
+from . import perf
+
+
+class InlineHooksMixin:
+    """Run ``process_request``/``process_response`` on the event loop under ASGI."""
+
+    def inline_hooks(self):
+        return True
+
+    async def __acall__(self, request):
+        if not self.inline_hooks():
+            return await super().__acall__(request)
+        response = None
+        if hasattr(self, 'process_request'):
+            response = self.process_request(request)
+        response = response or await self.get_response(request)
+        if hasattr(self, 'process_response'):
+            response = self.process_response(request, response)
+        return response
+
+
+class SecurityMiddleware(InlineHooksMixin, security.SecurityMiddleware):
+    pass
+
+
+class CommonMiddleware(InlineHooksMixin, common.CommonMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(InlineHooksMixin, csrf.CsrfViewMiddleware):
+    def inline_hooks(self):
+        # The token lives in the session, which loads from the database.
+        return not settings.CSRF_USE_SESSIONS
+
+
+class AuthenticationMiddleware(InlineHooksMixin, auth.AuthenticationMiddleware):
+    pass
+
+
+class XFrameOptionsMiddleware(InlineHooksMixin, clickjacking.XFrameOptionsMiddleware):
+    pass
+
+
+class PerformanceMiddleware:
+    """
+    Time each request and instrument a sample of them (see ``listings.perf``).
+    Put it first, so the timings cover the rest of the stack. It runs in
+    the caller's mode, sync or async, without a thread hop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started, request_metrics, token = perf.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            perf.current.reset(token)
+            raise
+        perf.finish(request, response, started, request_metrics, token)
+        return response
+
+    async def __acall__(self, request):
+        started, request_metrics, token = perf.start()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            perf.current.reset(token)
+            raise
+        perf.finish(request, response, started, request_metrics, token)
+        return response
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from listings.amenities import amenity_key, parse_amenities
+
+
+def split_amenities(apps, schema_editor):
+    """Parse the old comma-separated strings into catalog rows."""
+    Listing = apps.get_model('listings', 'Listing')
+    Amenity = apps.get_model('listings', 'Amenity')
+    ListingAmenity = apps.get_model('listings', 'ListingAmenity')
+
+    catalog = {}
+    links = []
+    for listing_id, text in Listing.objects.order_by('id').values_list('id', 'amenities_text').iterator():
+        for position, name in enumerate(parse_amenities(text or '')):
+            key = amenity_key(name)
+            if key not in catalog:
+                catalog[key] = Amenity.objects.create(name=name, slug=key)
+            links.append(ListingAmenity(
+                listing_id=listing_id, amenity=catalog[key], position=position
+            ))
+            if len(links) >= 1000:
+                ListingAmenity.objects.bulk_create(links)
+                links = []
+    ListingAmenity.objects.bulk_create(links)
+
+
+def join_amenities(apps, schema_editor):
+    """Rebuild the comma-separated strings when migrating backwards."""
+    Listing = apps.get_model('listings', 'Listing')
+    ListingAmenity = apps.get_model('listings', 'ListingAmenity')
+
+    names = {}
+    for listing_id, name in ListingAmenity.objects.order_by(
+        'listing_id', 'position'
+    ).values_list('listing_id', 'amenity__name').iterator():
+        names.setdefault(listing_id, []).append(name)
+    for listing_id, listing_names in names.items():
+        Listing.objects.filter(pk=listing_id).update(amenities_text=', '.join(listing_names))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Amenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'amenities',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ListingAmenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('amenity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listing_amenities', to='listings.amenity')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listing_amenities', to='listings.listing')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='listingamenity',
+            constraint=models.UniqueConstraint(fields=('amenity', 'listing'), name='listing_amenity_unique'),
+        ),
+        migrations.RenameField(
+            model_name='listing',
+            old_name='amenities',
+            new_name='amenities_text',
+        ),
+        migrations.RunPython(split_amenities, join_amenities),
+        migrations.RemoveField(
+            model_name='listing',
+            name='amenities_text',
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='amenities',
+            field=models.ManyToManyField(blank=True, related_name='listings', through='listings.ListingAmenity', to='listings.amenity'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from listings import search
+
+
+def create_search_index(apps, schema_editor):
+    backend = search.get_backend(schema_editor.connection)
+    backend.create(schema_editor)
+    Listing = apps.get_model('listings', 'Listing')
+    rows = Listing.objects.using(schema_editor.connection.alias).values_list('pk', *search.FIELDS)
+    backend.index(schema_editor.connection, rows.iterator())
+
+
+def drop_search_index(apps, schema_editor):
+    search.get_backend(schema_editor.connection).drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_normalize_amenities'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:26
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_ratings(apps, schema_editor):
+    # Rounded like listings.ratings.aggregates_for, so recompute_ratings agrees.
+    Listing = apps.get_model('listings', 'Listing')
+    Review = apps.get_model('listings', 'Review')
+    histograms = {}
+    rows = Review.objects.values_list('listing', 'rating').annotate(
+        reviews=models.Count('pk')
+    ).order_by()
+    for listing_id, rating, reviews in rows:
+        histograms.setdefault(listing_id, {})[rating] = reviews
+    for listing_id, histogram in histograms.items():
+        count = sum(histogram.values())
+        total = sum(stars * n for stars, n in histogram.items())
+        Listing.objects.filter(pk=listing_id).update(
+            review_count=count,
+            rating_sum=total,
+            avg_rating=(Decimal(total) / count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+            **{f'rating_{stars}_count': histogram.get(stars, 0) for stars in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_listing_coordinates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='avg_rating',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['avg_rating'], name='listing_avg_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['review_count'], name='listing_review_count_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
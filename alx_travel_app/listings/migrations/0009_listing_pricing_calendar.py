@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:41
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_listing_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingPricing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekend_uplift', models.DecimalField(decimal_places=2, default=0, max_digits=5, validators=[django.core.validators.MinValueValidator(0)])),
+                ('min_nights', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('weekly_discount', models.DecimalField(decimal_places=2, default=0, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('monthly_discount', models.DecimalField(decimal_places=2, default=0, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pricing', to='listings.listing')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SeasonalRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('price_per_night', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('min_nights', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seasonal_rates', to='listings.listing')),
+            ],
+            options={
+                'ordering': ['start_date'],
+                'indexes': [models.Index(fields=['listing', 'start_date', 'end_date'], name='seasonal_rate_listing_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('end_date__gt', models.F('start_date'))), name='season_end_after_start')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_listing_pricing_calendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleStatsRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='listings.listing')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyListingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('nights_booked', models.PositiveSmallIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('check_ins', models.PositiveSmallIntegerField(default=0)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='listings.listing')),
+            ],
+            options={
+                'verbose_name_plural': 'daily listing stats',
+                'constraints': [models.UniqueConstraint(fields=('listing', 'date'), name='daily_stats_listing_date_unique')],
+            },
+        ),
+    ]
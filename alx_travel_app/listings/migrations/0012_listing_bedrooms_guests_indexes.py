@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_booking_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['bedrooms'], name='listing_bedrooms_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['max_guests'], name='listing_guests_idx'),
+        ),
+    ]
@@ -1,6 +1,54 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.functions import Cast, Round
+from django.db.models.lookups import GreaterThan
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .amenities import amenity_key, parse_amenities
+from . import cache, geo
+
+class ListingQuerySet(models.QuerySet):
+    def for_serialization(self):
+        """Join the relations rendered by ListingSerializer in a single query."""
+        return self.select_related('host').prefetch_related(amenities_prefetch())
+    
+    def available(self, check_in, check_out, guests=1):
+        """
+        Listings that can host ``guests`` people from ``check_in`` to
+        ``check_out``, i.e. with no active booking overlapping the stay.
+        """
+        clashing = Booking.objects.active().overlapping(check_in, check_out).filter(
+            listing=models.OuterRef('pk')
+        )
+        return self.filter(
+            is_available=True, max_guests__gte=guests
+        ).exclude(models.Exists(clashing))
+    
+    def adjust_ratings(self, rating, delta):
+        """
+        Add (``delta=1``) or remove (``delta=-1``) one review of ``rating``
+        stars from the denormalized aggregates, in a single UPDATE computed
+        from the stored values, so concurrent reviews never lose an update.
+        ``avg_rating`` must be assigned first: it reads the old count and sum,
+        and MySQL evaluates SET left to right, with the values already set.
+        """
+        count = models.F('review_count') + delta
+        total = models.F('rating_sum') + rating * delta
+        bucket = f'rating_{rating}_count'
+        return self.update(
+            avg_rating=models.Case(
+                models.When(
+                    GreaterThan(count, 0),
+                    then=Cast(
+                        Round(total * models.Value(1.0) / count, 2),
+                        output_field=models.DecimalField(max_digits=3, decimal_places=2),
+                    ),
+                ),
+                default=None,
+            ),
+            review_count=count,
+            rating_sum=total,
+            **{bucket: models.F(bucket) + delta},
+        )
 
 class Listing(models.Model):
     PROPERTY_TYPES = [
@@ -17,22 +65,201 @@ class Listing(models.Model):
     address = models.CharField(max_length=300)
     city = models.CharField(max_length=100)
     country = models.CharField(max_length=100)
+    latitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    geohash = models.CharField(max_length=geo.PRECISION, blank=True, editable=False)
     price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
     max_guests = models.PositiveIntegerField()
     bedrooms = models.PositiveIntegerField()
     bathrooms = models.PositiveIntegerField()
     property_type = models.CharField(max_length=20, choices=PROPERTY_TYPES)
-    amenities = models.TextField(blank=True)  # JSON-like string or comma-separated
+    amenities = models.ManyToManyField(
+        'Amenity', through='ListingAmenity', related_name='listings', blank=True
+    )
     is_available = models.BooleanField(default=True)
+    # Review aggregates, maintained by Review.save() and the post_delete
+    # handler; repaired in bulk by the recompute_ratings command.
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
     host = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ListingQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.title} - {self.city}"
     
+    def save(self, *args, **kwargs):
+        self.refresh_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+    
+    def refresh_geohash(self):
+        """Recompute the spatial key; call this before ``bulk_create``/``bulk_update``."""
+        if self.latitude is None or self.longitude is None:
+            self.geohash = ''
+        else:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+    
+    @property
+    def rating_histogram(self):
+        return {str(stars): getattr(self, f'rating_{stars}_count') for stars in range(1, 6)}
+    
+    def set_amenities(self, names):
+        """Replace the listing's amenities, keeping the given order."""
+        amenities = Amenity.objects.resolve(parse_amenities(names))
+        ListingAmenity.objects.filter(listing=self).delete()
+        ListingAmenity.objects.bulk_create([
+            ListingAmenity(listing=self, amenity=amenity, position=position)
+            for position, amenity in enumerate(amenities)
+        ])
+        getattr(self, '_prefetched_objects_cache', {}).pop('listing_amenities', None)
+        cache.invalidate_listings([self.pk])
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['city', 'max_guests'], name='listing_city_guests_idx'),
+            models.Index(fields=['created_at', 'id'], name='listing_created_idx'),
+            models.Index(fields=['geohash'], name='listing_geohash_idx'),
+            models.Index(fields=['avg_rating'], name='listing_avg_rating_idx'),
+            models.Index(fields=['review_count'], name='listing_review_count_idx'),
+            # Attribute filters and facets (listings.filters.ListingFilterSet).
+            models.Index(fields=['country', 'city'], name='listing_country_city_idx'),
+            models.Index(fields=['property_type', 'price_per_night'], name='listing_type_price_idx'),
+            models.Index(fields=['price_per_night'], name='listing_price_idx'),
+            models.Index(fields=['bedrooms'], name='listing_bedrooms_idx'),
+            models.Index(fields=['max_guests'], name='listing_guests_idx'),
+        ]
+
+class AmenityManager(models.Manager):
+    def resolve(self, names):
+        """
+        Catalog entries for ``names``, in order, creating missing ones.
+        Names are matched on their canonical key, so variants share an entry.
+        """
+        keys = [amenity_key(name) for name in names]
+        existing = {amenity.slug: amenity for amenity in self.filter(slug__in=keys)}
+        missing = [
+            self.model(name=name, slug=key)
+            for name, key in zip(names, keys) if key not in existing
+        ]
+        if missing:
+            self.bulk_create(missing, ignore_conflicts=True)
+            existing.update((a.slug, a) for a in self.filter(slug__in=[m.slug for m in missing]))
+        return [existing[key] for key in keys]
+
+class Amenity(models.Model):
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True)  # canonical key, see amenities.py
+    
+    objects = AmenityManager()
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'amenities'
+
+class ListingAmenity(models.Model):
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='listing_amenities')
+    amenity = models.ForeignKey(Amenity, on_delete=models.CASCADE, related_name='listing_amenities')
+    position = models.PositiveSmallIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.listing_id} - {self.amenity}"
+    
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            # (amenity, listing) also serves "listings having amenity X" lookups.
+            models.UniqueConstraint(fields=['amenity', 'listing'], name='listing_amenity_unique'),
+        ]
+
+def amenities_prefetch(prefix=''):
+    """Prefetch a listing's amenities in display order with one extra query."""
+    return models.Prefetch(
+        f'{prefix}listing_amenities',
+        queryset=ListingAmenity.objects.select_related('amenity'),
+    )
+
+class ListingPricing(models.Model):
+    """Pricing rules applied on top of the nightly rates; see listings.pricing."""
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, related_name='pricing')
+    # Percent added to Friday and Saturday nights.
+    weekend_uplift = models.DecimalField(
+        max_digits=5, decimal_places=2, default=0, validators=[MinValueValidator(0)]
+    )
+    min_nights = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)])
+    # Percent off stays of 7+ and 28+ nights.
+    weekly_discount = models.DecimalField(
+        max_digits=5, decimal_places=2, default=0,
+        validators=[MinValueValidator(0), MaxValueValidator(100)]
+    )
+    monthly_discount = models.DecimalField(
+        max_digits=5, decimal_places=2, default=0,
+        validators=[MinValueValidator(0), MaxValueValidator(100)]
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Pricing for listing {self.listing_id}"
+
+class SeasonalRate(models.Model):
+    """A nightly rate overriding ``price_per_night`` for [start_date, end_date)."""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='seasonal_rates')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
+    min_nights = models.PositiveSmallIntegerField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.listing_id}: {self.start_date} - {self.end_date}"
+    
+    class Meta:
+        ordering = ['start_date']
+        indexes = [
+            models.Index(fields=['listing', 'start_date', 'end_date'], name='seasonal_rate_listing_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(end_date__gt=models.F('start_date')),
+                name='season_end_after_start'
+            )
+        ]
+
+class BookingQuerySet(models.QuerySet):
+    def for_serialization(self):
+        """Join the relations rendered by BookingSerializer in a single query."""
+        return self.select_related('listing', 'listing__host', 'guest').prefetch_related(
+            amenities_prefetch('listing__')
+        )
+    
+    def visible_to(self, user):
+        """Everything for staff, otherwise the user's own bookings."""
+        return self if user.is_staff else self.filter(guest=user)
+    
+    def active(self):
+        """Bookings that hold their dates, i.e. everything but cancellations."""
+        return self.exclude(status='cancelled')
+    
+    def overlapping(self, check_in, check_out):
+        """Bookings whose stay intersects the half-open range [check_in, check_out)."""
+        return self.filter(check_in__lt=check_out, check_out__gt=check_in)
 
 class Booking(models.Model):
     STATUS_CHOICES = [
@@ -53,11 +280,37 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = BookingQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.guest.username} - {self.listing.title}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored stay, so that moving it can mark the nights it
+        # used to cover for the analytics rollups (see listings.analytics),
+        # and the stored status, so that a confirmation is only sent once.
+        instance._stored_stay = tuple(
+            instance.__dict__.get(field) for field in ('listing_id', 'check_in', 'check_out')
+        )
+        instance._stored_status = instance.__dict__.get('status')
+        return instance
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Covers the overlap probe used by availability search: equality on
+            # listing, range on check_in/check_out, status filtered in the index.
+            models.Index(
+                fields=['listing', 'check_in', 'check_out', 'status'],
+                name='booking_listing_dates_idx',
+            ),
+            # Keyset pagination on (created_at, id), globally, per guest and per listing.
+            models.Index(fields=['created_at', 'id'], name='booking_created_idx'),
+            models.Index(fields=['guest', 'created_at', 'id'], name='booking_guest_created_idx'),
+            models.Index(fields=['listing', 'created_at', 'id'], name='booking_listing_created_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=models.Q(check_out__gt=models.F('check_in')),
@@ -65,8 +318,45 @@ class Booking(models.Model):
             )
         ]
 
+class ArchivedBooking(models.Model):
+    """
+    A finished booking moved out of ``Booking`` by ``archive_bookings``, with
+    the same columns and primary key; see listings.archive.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='archived_bookings')
+    guest = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings')
+    check_in = models.DateField()
+    check_out = models.DateField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    guests_count = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    special_requests = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = BookingQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"{self.guest.username} - {self.listing.title} (archived)"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['guest', 'created_at', 'id'], name='archived_guest_created_idx'),
+            models.Index(fields=['listing', 'created_at', 'id'], name='archived_listing_created_idx'),
+        ]
+
 class Review(models.Model):
-    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='review')
+    # A review points at its booking while the booking is live, and at the
+    # archived copy once it is archived; exactly one of the two is set.
+    booking = models.OneToOneField(
+        Booking, on_delete=models.CASCADE, null=True, blank=True, related_name='review'
+    )
+    archived_booking = models.OneToOneField(
+        ArchivedBooking, on_delete=models.CASCADE, null=True, blank=True, related_name='review'
+    )
     guest = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='reviews')
     rating = models.PositiveIntegerField(
@@ -79,6 +369,72 @@ class Review(models.Model):
     def __str__(self):
         return f"{self.guest.username} - {self.rating} stars"
     
+    @property
+    def booking_ref(self):
+        """The id of the reviewed booking, live or archived."""
+        return self.booking_id if self.booking_id is not None else self.archived_booking_id
+    
+    def save(self, *args, **kwargs):
+        """Save and move this review's contribution to the listing aggregates."""
+        using = kwargs.get('using') or router.db_for_write(Review, instance=self)
+        with transaction.atomic(using=using):
+            previous = None
+            if self.pk is not None:
+                # Lock the stored row so concurrent edits account from the right value.
+                previous = Review.objects.using(using).select_for_update().filter(
+                    pk=self.pk
+                ).values_list('listing_id', 'rating').first()
+            super().save(*args, **kwargs)
+            current = (self.listing_id, self.rating)
+            if previous != current:
+                if previous is not None:
+                    Listing.objects.using(using).filter(pk=previous[0]).adjust_ratings(previous[1], -1)
+                Listing.objects.using(using).filter(pk=current[0]).adjust_ratings(current[1], 1)
+                cache.invalidate_listings({current[0], *(previous or ())[:1]}, using=using)
+    
     class Meta:
         ordering = ['-created_at']
-        unique_together = ['booking', 'guest']
\ No newline at end of file
+        unique_together = ['booking', 'guest']
+        indexes = [
+            models.Index(fields=['listing', 'created_at', 'id'], name='review_listing_created_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(booking__isnull=False) | models.Q(archived_booking__isnull=False),
+                name='review_has_booking'
+            )
+        ]
+
+class DailyListingStats(models.Model):
+    """
+    Rollup of one listing's confirmed and completed bookings on one day.
+    Only days with activity have a row; see listings.analytics.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    nights_booked = models.PositiveSmallIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    check_ins = models.PositiveSmallIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.listing_id} on {self.date}"
+    
+    class Meta:
+        verbose_name_plural = 'daily listing stats'
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'date'], name='daily_stats_listing_date_unique'),
+        ]
+
+class StaleStatsRange(models.Model):
+    """Days [start_date, end_date) of a listing whose rollups need recomputing."""
+    # No constraint: deleting a listing deletes its bookings first, and
+    # those deletions mark ranges of the listing on the way out.
+    listing = models.ForeignKey(
+        Listing, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    start_date = models.DateField()
+    end_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.listing_id}: {self.start_date} - {self.end_date}"
@@ -0,0 +1,109 @@
+"""
+Per-listing availability calendar.
+
+``GET /api/listings/{id}/calendar/?start=2030-01&months=12`` tells which
+nights of a window of whole months are taken by a booking that holds its
+dates (anything but a cancellation): one character per night, ``"1"`` for
+taken and ``"0"`` for free, or with ``encoding=runs`` the ``[offset,
+nights]`` runs of taken nights.
+
+Each month's string is cached under the listing's calendar version; the
+months missing from the cache are computed together in one query, which
+also tells an unknown listing apart. Any change to the listing's bookings
+bumps the version once its transaction commits (:func:`invalidate`), so a
+reader never caches a month from before the change under the new version.
+Archived bookings are all in the past and are not read.
+"""
+import calendar
+import re
+from datetime import date, timedelta
+
+from django.db.models import FilteredRelation, Q
+
+from . import cache
+from .models import Listing
+
+ENCODINGS = ('bitmap', 'runs')
+MAX_MONTHS = 24
+TAKEN_RUN = re.compile('1+')
+
+
+def calendar_scope(pk):
+    return f'calendar:{pk}'
+
+
+def invalidate(listing_ids, using='default'):
+    """Orphan the cached months of ``listing_ids`` once the current transaction commits."""
+    scopes = [calendar_scope(pk) for pk in set(listing_ids)]
+    if scopes:
+        cache.bump(*scopes, using=using)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_key(version, pk, month):
+    return f'{cache.KEY_PREFIX}:calendar:{version}:{pk}:{month:%Y-%m}'
+
+
+def taken_nights(listing_id, start, end, using='default'):
+    """
+    The nights in [start, end) taken at the listing, as a set of dates, or
+    None if there is no such listing. One query: the listing LEFT JOINed to
+    its bookings that overlap the range.
+    """
+    stays = list(
+        Listing.objects.using(using).filter(pk=listing_id)
+        .annotate(stay=FilteredRelation('bookings', condition=(
+            Q(bookings__check_in__lt=end, bookings__check_out__gt=start)
+            & ~Q(bookings__status='cancelled')
+        )))
+        .values_list('stay__check_in', 'stay__check_out')
+    )
+    if not stays:
+        return None
+    nights = set()
+    for check_in, check_out in stays:
+        if check_in is None:
+            continue
+        night, last = max(check_in, start), min(check_out, end)
+        while night < last:
+            nights.add(night)
+            night += timedelta(days=1)
+    return nights
+
+
+def bitmap(listing_id, start, months, using='default'):
+    """
+    ``"0"``/``"1"`` for each night of the ``months`` months from ``start``
+    (the first of a month), or None if there is no such listing.
+    """
+    version = cache.current_version(calendar_scope(listing_id))
+    keys = {
+        month: month_key(version, listing_id, month)
+        for month in (add_months(start, offset) for offset in range(months))
+    }
+    store = cache.get_cache()
+    found = store.get_many(keys.values())
+    missing = [month for month, key in keys.items() if key not in found]
+    if missing:
+        taken = taken_nights(listing_id, missing[0], add_months(missing[-1], 1), using=using)
+        if taken is None:
+            return None
+        computed = {
+            keys[month]: ''.join(
+                '1' if month.replace(day=day) in taken else '0'
+                for day in range(1, calendar.monthrange(month.year, month.month)[1] + 1)
+            )
+            for month in missing
+        }
+        store.set_many(computed, cache.get_timeout())
+        found.update(computed)
+    return ''.join(found[key] for key in keys.values())
+
+
+def runs(nights):
+    """``[offset, length]`` of each run of taken nights in a :func:`bitmap`."""
+    return [[run.start(), run.end() - run.start()] for run in TAKEN_RUN.finditer(nights)]
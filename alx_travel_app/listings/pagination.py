@@ -0,0 +1,199 @@
+"""
+Pagination classes.
+
+``KeysetPagination`` walks a queryset in ``(-created_at, -id)`` order by
+filtering on the last row seen instead of using OFFSET, so every page costs
+the same as the first one and no ``COUNT(*)`` is run. ``SelectablePagination``
+is the project default: it keeps page-number pagination for existing clients
+and switches to keyset pagination when a request asks for it.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db import connections
+from django.db.models import Max, Min, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def approximate_count(queryset, cap=10000):
+    """
+    Cheap estimate of ``queryset.count()``.
+
+    Unfiltered querysets are answered from table statistics (MySQL) or the
+    primary key range (other backends). Filtered querysets are counted up to
+    ``cap`` rows. Returns ``(count, is_exact)``.
+    """
+    model = queryset.model
+    if not queryset.query.where:
+        connection = connections[queryset.db]
+        if connection.vendor == 'mysql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                    'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                    [model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            return (row[0] or 0) if row else 0, False
+        bounds = model._default_manager.using(queryset.db).aggregate(
+            low=Min('pk'), high=Max('pk')
+        )
+        if bounds['low'] is None:
+            return 0, True
+        return bounds['high'] - bounds['low'] + 1, False
+    count = queryset.order_by()[:cap + 1].count()
+    return min(count, cap), count <= cap
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on ``(created_at, id)``, newest first.
+
+    The cursor is an opaque token holding the ``created_at``/``id`` of the
+    row a page starts after, and the direction of travel. Pass
+    ``count=approx`` to include an approximate total.
+
+    Querysets already ordered some other way (``?ordering=``, search
+    relevance, distance) are refused with a 400 rather than silently
+    reordered.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering_message = (
+        'Cursor pagination only supports the default newest-first order; '
+        'use page numbers with ordering, q or the geo filters.'
+    )
+    # Orderings the keyset order agrees with.
+    compatible_orderings = {(), ('-created_at',), ('-created_at', '-id')}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = tuple(getattr(getattr(queryset, 'query', None), 'order_by', ()))
+        if ordering not in self.compatible_orderings:
+            raise ValidationError(self.ordering_message)
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'page')
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.count = approximate_count(queryset)
+
+        if reverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+        if position is not None:
+            created_at, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+                )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = position is not None if not reverse else has_more
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row, reverse):
+        payload = {'c': row.created_at.isoformat(), 'i': row.pk}
+        if reverse:
+            payload['r'] = 1
+        token = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            position = (datetime.fromisoformat(payload['c']), int(payload['i']))
+            return position, bool(payload.get('r'))
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            payload['count'], payload['count_exact'] = self.count
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_exact': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+
+class SelectablePagination(PageNumberPagination):
+    """
+    Page-number pagination by default; keyset pagination when the request
+    carries a ``cursor`` or ``pagination=cursor`` query parameter.
+
+    Viewsets that should always use keyset pagination can set
+    ``pagination_class = KeysetPagination`` instead.
+    """
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        params = request.query_params
+        if params.get(self.mode_query_param) == 'cursor' or params.get('cursor'):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,136 @@
+"""
+Nightly pricing calendar and quotes.
+
+A listing's calendar is its flat ``price_per_night``, an optional
+``ListingPricing`` row (weekend uplift, minimum stay, weekly and monthly
+discounts) and a few non-overlapping ``SeasonalRate`` ranges that override
+the nightly rate. Pricing a stay loads the calendar of every listing
+involved up front, with one query for listings and rules and one for the
+seasons touching the stay, then walks the nights once against the sorted
+seasons. A single quote and a page of quotes cost the same two queries.
+
+Quotes are cached per listing under its ``listings.cache`` version, which
+is bumped when the listing or its calendar changes.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from datetime import timedelta
+
+from django.db import transaction
+
+from . import cache
+from .models import Listing, ListingPricing, SeasonalRate
+
+WEEKEND_NIGHTS = {4, 5}  # Friday and Saturday nights
+WEEKLY_NIGHTS = 7
+MONTHLY_NIGHTS = 28
+MAX_NIGHTS = 365
+CENT = Decimal('0.01')
+
+
+def load_calendars(listing_ids, check_in, check_out, using='default'):
+    """``{pk: (listing, pricing or None, seasons)}`` for the stay, in two queries."""
+    listings = Listing.objects.using(using).select_related('pricing').filter(pk__in=listing_ids)
+    seasons = {}
+    for season in SeasonalRate.objects.using(using).filter(
+        listing_id__in=listing_ids, start_date__lt=check_out, end_date__gt=check_in
+    ).order_by('listing_id', 'start_date'):
+        seasons.setdefault(season.listing_id, []).append(season)
+    return {
+        listing.pk: (listing, getattr(listing, 'pricing', None), seasons.get(listing.pk, []))
+        for listing in listings
+    }
+
+
+def price(listing, pricing, seasons, check_in, check_out):
+    """
+    Quote a stay from a loaded calendar. ``seasons`` are the listing's
+    seasonal rates overlapping the stay, sorted by ``start_date``.
+    """
+    nights = (check_out - check_in).days
+    uplift = 1 + (pricing.weekend_uplift / 100 if pricing else 0)
+    min_nights = pricing.min_nights if pricing else 1
+    nightly, index, day = [], 0, check_in
+    for night in range(nights):
+        while index < len(seasons) and seasons[index].end_date <= day:
+            index += 1
+        season = seasons[index] if index < len(seasons) and seasons[index].start_date <= day else None
+        if season and night == 0 and season.min_nights:
+            min_nights = max(min_nights, season.min_nights)
+        rate = season.price_per_night if season else listing.price_per_night
+        if day.weekday() in WEEKEND_NIGHTS:
+            rate *= uplift
+        nightly.append(rate.quantize(CENT, rounding=ROUND_HALF_UP))
+        day += timedelta(days=1)
+
+    subtotal = sum(nightly, Decimal('0.00'))
+    discount_percent = Decimal(0)
+    if pricing and nights >= MONTHLY_NIGHTS and pricing.monthly_discount:
+        discount_percent = pricing.monthly_discount
+    elif pricing and nights >= WEEKLY_NIGHTS:
+        discount_percent = pricing.weekly_discount
+    discount = (subtotal * discount_percent / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+    return {
+        'listing_id': listing.pk,
+        'check_in': check_in.isoformat(),
+        'check_out': check_out.isoformat(),
+        'nights': nights,
+        'nightly_rates': [str(rate) for rate in nightly],
+        'subtotal': str(subtotal),
+        'discount_percent': str(discount_percent),
+        'discount': str(discount),
+        'total': str(subtotal - discount),
+        'min_nights': min_nights,
+        'bookable': nights >= min_nights,
+    }
+
+
+def compute_quotes(listing_ids, check_in, check_out, using='default'):
+    """Uncached quotes, ``{pk: quote}``; unknown ids are left out."""
+    calendars = load_calendars(listing_ids, check_in, check_out, using=using)
+    return {
+        pk: price(listing, pricing, seasons, check_in, check_out)
+        for pk, (listing, pricing, seasons) in calendars.items()
+    }
+
+
+def quotes(listing_ids, check_in, check_out, using='default'):
+    """Quotes of one stay for several listings, ``{pk: quote}``, through the cache."""
+    versions = cache.current_versions([cache.listing_scope(pk) for pk in listing_ids])
+    keys = {
+        pk: f'{cache.KEY_PREFIX}:quote:{versions[cache.listing_scope(pk)]}:{pk}:{check_in}:{check_out}'
+        for pk in listing_ids
+    }
+    store = cache.get_cache()
+    cached = store.get_many(keys.values())
+    results = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in listing_ids if pk not in results]
+    if missing:
+        computed = compute_quotes(missing, check_in, check_out, using=using)
+        store.set_many({keys[pk]: quote for pk, quote in computed.items()}, cache.get_timeout())
+        results.update(computed)
+    return results
+
+
+def get_calendar(listing):
+    """The listing's pricing rules and seasons, with defaults for missing rules."""
+    pricing = ListingPricing.objects.filter(listing=listing).first() or ListingPricing(listing=listing)
+    return {
+        'weekend_uplift': pricing.weekend_uplift,
+        'min_nights': pricing.min_nights,
+        'weekly_discount': pricing.weekly_discount,
+        'monthly_discount': pricing.monthly_discount,
+        'seasons': list(listing.seasonal_rates.all()),
+    }
+
+
+def set_calendar(listing, data):
+    """Replace the listing's pricing rules and seasons with validated ``data``."""
+    data = dict(data)
+    seasons = data.pop('seasons', [])
+    with transaction.atomic():
+        ListingPricing.objects.update_or_create(listing=listing, defaults=data)
+        SeasonalRate.objects.filter(listing=listing).delete()
+        SeasonalRate.objects.bulk_create(
+            [SeasonalRate(listing=listing, **season) for season in seasons]
+        )
+    cache.bump(cache.listing_scope(listing.pk))
@@ -0,0 +1,75 @@
+"""
+Bulk maintenance of the denormalized review aggregates on Listing.
+
+Day-to-day the aggregates are adjusted incrementally (see
+``ListingQuerySet.adjust_ratings``). Writes that bypass the model, such as
+``QuerySet.update()`` on reviews or manual SQL, can make them drift;
+:func:`recompute` rebuilds them from the reviews table.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Count
+
+from . import cache
+from .models import Listing, Review
+
+AGGREGATE_FIELDS = [
+    'review_count', 'rating_sum', 'avg_rating',
+    'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+]
+
+
+def aggregates_for(histogram):
+    """Aggregate field values for a ``{stars: count}`` histogram."""
+    values = {f'rating_{stars}_count': histogram.get(stars, 0) for stars in range(1, 6)}
+    values['review_count'] = sum(histogram.values())
+    values['rating_sum'] = sum(stars * count for stars, count in histogram.items())
+    values['avg_rating'] = None
+    if values['review_count']:
+        values['avg_rating'] = (
+            Decimal(values['rating_sum']) / values['review_count']
+        ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return values
+
+
+def recompute(batch_size=1000, using='default', progress=None):
+    """
+    Recompute the aggregates of every listing, ``batch_size`` listings per
+    transaction, with one grouped query per batch. Only listings whose
+    stored values differ are written. Returns ``(checked, repaired)``.
+    """
+    listings = Listing.objects.using(using).order_by('pk').only('pk', *AGGREGATE_FIELDS)
+    last_pk, checked, repaired = 0, 0, 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(listings.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return checked, repaired
+            histograms = {}
+            rows = (
+                Review.objects.using(using)
+                .filter(listing__in=[listing.pk for listing in batch])
+                .values_list('listing', 'rating')
+                .annotate(reviews=Count('pk'))
+                .order_by()
+            )
+            for listing_id, rating, reviews in rows:
+                histograms.setdefault(listing_id, {})[rating] = reviews
+
+            stale = []
+            for listing in batch:
+                values = aggregates_for(histograms.get(listing.pk, {}))
+                if any(getattr(listing, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(listing, field, value)
+                    stale.append(listing)
+            Listing.objects.using(using).bulk_update(stale, AGGREGATE_FIELDS)
+        if stale:
+            cache.invalidate_listings([listing.pk for listing in stale], using=using)
+
+        last_pk = batch[-1].pk
+        checked += len(batch)
+        repaired += len(stale)
+        if progress:
+            progress(checked, repaired)
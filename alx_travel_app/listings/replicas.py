@@ -0,0 +1,226 @@
+"""
+Read replicas.
+
+``ReplicaReadMixin`` sends the reads of safe-method requests to one of the
+aliases in ``DATABASE_REPLICAS`` (see settings), through ``ReplicaRouter``;
+everything else, and every write, uses the primary (``default``).
+
+Replicas lag behind the primary, so:
+
+- After a user writes through the API, their reads stay on the primary for
+  ``LISTINGS_REPLICA_PIN_SECONDS`` (read-your-writes). The pin is kept in
+  the cache, so it follows the user across workers when the cache is shared.
+- Actions whose responses or data go to a shared cache (a view's
+  ``primary_read_actions``) read from the primary, so a replica's stale rows
+  are never cached for everyone.
+
+A replica that cannot be reached is skipped for
+``LISTINGS_REPLICA_RETRY_SECONDS``; if a query on it fails, the request is
+retried on the primary.
+
+Streaming responses (the exports) run their queries while the response is
+iterated, after the view has returned, so their content is wrapped to keep
+reading from the replica (:func:`iterate_on`, or :func:`aiterate_on` under
+ASGI). If the replica fails before anything was sent, the response is built
+again on the primary; once output has gone out, the error ends the download.
+"""
+import contextlib
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, InterfaceError, OperationalError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from . import cache
+
+CONNECTION_ERRORS = (InterfaceError, OperationalError)
+
+# The alias reads go to in the current context; None for the primary.
+read_alias = ContextVar('listings_read_alias', default=None)
+# Replica alias -> time.monotonic() until which it is skipped.
+unavailable = {}
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_pin_seconds():
+    return getattr(settings, 'LISTINGS_REPLICA_PIN_SECONDS', 5)
+
+
+def get_retry_seconds():
+    return getattr(settings, 'LISTINGS_REPLICA_RETRY_SECONDS', 30)
+
+
+def pin_key(user):
+    return f'{cache.KEY_PREFIX}:primary-pin:{user.pk}'
+
+
+def pin(user):
+    """Keep ``user``'s reads on the primary for a while, after a write."""
+    if user.is_authenticated and get_replicas():
+        cache.get_cache().set(pin_key(user), True, get_pin_seconds())
+
+
+def is_pinned(user):
+    return user.is_authenticated and bool(cache.get_cache().get(pin_key(user)))
+
+
+def mark_down(alias):
+    unavailable[alias] = time.monotonic() + get_retry_seconds()
+
+
+def is_up(alias):
+    if unavailable.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except CONNECTION_ERRORS:
+        mark_down(alias)
+        return False
+    unavailable.pop(alias, None)
+    return True
+
+
+def choose(user):
+    """A reachable replica for reads by ``user``, or None for the primary."""
+    replicas = get_replicas()
+    if not replicas or is_pinned(user):
+        return None
+    return next((alias for alias in random.sample(replicas, len(replicas)) if is_up(alias)), None)
+
+
+@contextlib.contextmanager
+def reading(alias):
+    """Route reads in the block to ``alias`` (None for the primary)."""
+    token = read_alias.set(alias)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def iterate_on(alias, iterable):
+    """``iterable``, with the reads of each step routed to ``alias``."""
+    iterator = iter(iterable)
+    while True:
+        with reading(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+async def aiterate_on(alias, iterable):
+    """:func:`iterate_on` for an async ``iterable``."""
+    iterator = aiter(iterable)
+    while True:
+        with reading(alias):
+            try:
+                item = await anext(iterator)
+            except StopAsyncIteration:
+                return
+        yield item
+
+
+def call(user, func, *args, **kwargs):
+    """
+    ``func(*args, **kwargs)`` with its reads on a replica chosen for ``user``,
+    run again on the primary if the replica fails.
+    """
+    alias = choose(user)
+    if alias is None:
+        return func(*args, **kwargs)
+    try:
+        with reading(alias):
+            return func(*args, **kwargs)
+    except CONNECTION_ERRORS:
+        mark_down(alias)
+        return func(*args, **kwargs)
+
+
+class ReplicaRouter:
+    """Send reads to the alias in :data:`read_alias`; writes always go to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """Serve safe-method requests from a replica; see the module docstring."""
+    primary_read_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and self.action not in self.primary_read_actions:
+            self.read_token = read_alias.set(choose(request.user))
+
+    def handle_exception(self, exc):
+        alias = read_alias.get()
+        if alias is not None and isinstance(exc, CONNECTION_ERRORS):
+            mark_down(alias)
+            read_alias.set(None)
+            try:
+                return self.run_handler()
+            except Exception as retry_exc:
+                exc = retry_exc
+        return super().handle_exception(exc)
+
+    def run_handler(self):
+        handler = getattr(self, self.request.method.lower())
+        return handler(self.request, *self.args, **self.kwargs)
+
+    def stream_from(self, alias, content):
+        """``content`` read from ``alias``, or from the primary if that fails before anything is sent."""
+        sent = False
+        try:
+            for chunk in iterate_on(alias, content):
+                sent = True
+                yield chunk
+        except CONNECTION_ERRORS:
+            mark_down(alias)
+            if sent:
+                raise
+            yield from self.run_handler().streaming_content
+
+    async def astream_from(self, alias, content):
+        """:meth:`stream_from` for the async content of responses served under ASGI."""
+        sent = False
+        try:
+            async for chunk in aiterate_on(alias, content):
+                sent = True
+                yield chunk
+        except CONNECTION_ERRORS:
+            mark_down(alias)
+            if sent:
+                raise
+            response = await sync_to_async(self.run_handler)()
+            async for chunk in response.streaming_content:
+                yield chunk
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'read_token', None)
+        if token is not None:
+            alias = read_alias.get()
+            read_alias.reset(token)
+            self.read_token = None
+            if alias is not None and response.streaming:
+                stream = self.astream_from if response.is_async else self.stream_from
+                response.streaming_content = stream(alias, response.streaming_content)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
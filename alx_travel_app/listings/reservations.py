@@ -0,0 +1,79 @@
+"""
+Reservation engine.
+
+Bookings are written through :func:`reserve` so that the overlap check and
+the insert happen in one transaction while holding a lock on the listing
+row. Only requests for the same listing contend for that lock; bookings
+for different listings proceed in parallel. SQLite, which only has a
+database-wide write lock, serializes all of them instead.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from . import pricing
+from .models import Listing, Booking
+
+
+class ReservationError(Exception):
+    """The booking request cannot be honoured as submitted."""
+
+
+class ListingUnavailable(ReservationError):
+    """Another active booking already holds some of the requested nights."""
+
+
+def price_stay(listing, check_in, check_out):
+    """
+    Total price of a stay from the listing's pricing calendar, which is read
+    fresh rather than from the quote cache.
+    """
+    _, rules, seasons = pricing.load_calendars([listing.pk], check_in, check_out)[listing.pk]
+    quote = pricing.price(listing, rules, seasons, check_in, check_out)
+    if not quote['bookable']:
+        raise ReservationError(f'This listing requires a stay of at least {quote["min_nights"]} nights.')
+    return Decimal(quote['total'])
+
+
+def reserve(listing_id, guest, check_in, check_out, guests_count,
+            special_requests='', booking=None):
+    """
+    Create a booking, or move ``booking`` to new dates, if the listing is free.
+
+    The listing row is locked with ``SELECT ... FOR UPDATE`` before looking
+    for overlapping bookings, so two concurrent reservations for the same
+    listing are serialized and cannot both succeed. On SQLite, which has no
+    row locks, the ``IMMEDIATE`` transaction mode configured in settings
+    gives the same guarantee by taking the database's write lock up front,
+    at the cost of serializing reservations for different listings too.
+    """
+    if check_out <= check_in:
+        raise ReservationError('check_out must be after check_in.')
+
+    with transaction.atomic():
+        listing = Listing.objects.select_for_update().get(pk=listing_id)
+        if not listing.is_available:
+            raise ReservationError('This listing is not accepting bookings.')
+        if guests_count > listing.max_guests:
+            raise ReservationError(
+                f'This listing accepts at most {listing.max_guests} guests.'
+            )
+
+        clashing = Booking.objects.active().overlapping(check_in, check_out).filter(
+            listing=listing
+        )
+        if booking is not None:
+            clashing = clashing.exclude(pk=booking.pk)
+        if clashing.exists():
+            raise ListingUnavailable('The listing is already booked for these dates.')
+
+        if booking is None:
+            booking = Booking(guest=guest)
+        booking.listing = listing
+        booking.check_in = check_in
+        booking.check_out = check_out
+        booking.guests_count = guests_count
+        booking.special_requests = special_requests
+        booking.total_price = price_stay(listing, check_in, check_out)
+        booking.save()
+    return booking
@@ -0,0 +1,201 @@
+"""
+Full-text search over listing title, description, city and country.
+
+SQLite uses an FTS5 virtual table keyed by the listing id, kept in sync by
+the signal handlers in ``listings.signals``. MySQL uses a FULLTEXT index,
+which the server maintains itself. Other backends fall back to
+``icontains`` filtering without ranking.
+"""
+import re
+
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from . import cache
+
+FTS_TABLE = 'listings_listing_fts'
+FIELDS = ('title', 'description', 'city', 'country')
+
+
+def tokenize(query):
+    """Words of a user query, stripped of any search-engine syntax."""
+    return re.findall(r'\w+', query.lower())
+
+
+class SQLiteBackend:
+    """FTS5 external index; ``rank`` is bm25, where lower means more relevant."""
+
+    def create(self, schema_editor):
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            f'{", ".join(FIELDS)}, '
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+
+    def drop(self, schema_editor):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+    def match_expression(self, tokens):
+        # Quote every token so user input is never parsed as FTS syntax, and
+        # treat the last one as a prefix for search-as-you-type.
+        terms = [f'"{token}"' for token in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def search(self, queryset, tokens):
+        table = queryset.model._meta.db_table
+        expression = self.match_expression(tokens)
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+        rank = RawSQL(
+            f'SELECT -rank FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+            [expression],
+        )
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+    def index(self, connection, rows):
+        """(Re)index ``rows`` of ``(id, title, description, city, country)``."""
+        rows = list(rows)
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FIELDS)}) VALUES (%s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, connection, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in ids])
+
+    def prune(self, connection):
+        """Drop index entries whose listing no longer exists."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid NOT IN (SELECT id FROM listings_listing)'
+            )
+
+
+class MySQLBackend:
+    """InnoDB FULLTEXT index; MATCH ... AGAINST scores higher for better matches."""
+    index_name = 'listing_fulltext_idx'
+
+    def create(self, schema_editor):
+        schema_editor.execute(
+            f'CREATE FULLTEXT INDEX {self.index_name} ON listings_listing ({", ".join(FIELDS)})'
+        )
+
+    def drop(self, schema_editor):
+        schema_editor.execute(f'DROP INDEX {self.index_name} ON listings_listing')
+
+    def search(self, queryset, tokens):
+        table = queryset.model._meta.db_table
+        columns = ', '.join(f'{table}.{field}' for field in FIELDS)
+        terms = [f'+{token}' for token in tokens]
+        terms[-1] += '*'
+        expression = ' '.join(terms)
+        rank = RawSQL(f'MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)', [expression])
+        return queryset.annotate(search_rank=rank).filter(search_rank__gt=0)
+
+    def index(self, connection, rows):
+        pass
+
+    def remove(self, connection, ids):
+        pass
+
+    def prune(self, connection):
+        pass
+
+
+class FallbackBackend:
+    """Unranked substring matching for backends without a native index."""
+
+    def create(self, schema_editor):
+        pass
+
+    def drop(self, schema_editor):
+        pass
+
+    def search(self, queryset, tokens):
+        for token in tokens:
+            condition = Q()
+            for field in FIELDS:
+                condition |= Q(**{f'{field}__icontains': token})
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def index(self, connection, rows):
+        pass
+
+    def remove(self, connection, ids):
+        pass
+
+    def prune(self, connection):
+        pass
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend(),
+    'mysql': MySQLBackend(),
+}
+
+
+def get_backend(connection):
+    return BACKENDS.get(connection.vendor, FallbackBackend())
+
+
+def search(queryset, query):
+    """
+    Listings in ``queryset`` matching every word of ``query``, most relevant
+    first. Ranked backends annotate the rows with ``search_rank``.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset
+    backend = get_backend(connections[queryset.db])
+    results = backend.search(queryset, tokens)
+    if 'search_rank' in results.query.annotations:
+        results = results.order_by('-search_rank', '-created_at')
+    return results
+
+
+def index_listings(listings, using='default'):
+    """Add or refresh ``listings`` (a Listing queryset or list) in the index."""
+    rows = [(listing.pk, *(getattr(listing, field) for field in FIELDS)) for listing in listings]
+    connection = connections[using]
+    get_backend(connection).index(connection, rows)
+
+
+def remove_listings(ids, using='default'):
+    connection = connections[using]
+    get_backend(connection).remove(connection, list(ids))
+
+
+def rebuild(batch_size=1000, using='default', progress=None):
+    """
+    Reindex every listing, ``batch_size`` rows per transaction in primary-key
+    order, then prune entries of deleted listings. The index stays queryable
+    throughout. ``progress`` is called with the running total.
+    """
+    from .models import Listing
+
+    connection = connections[using]
+    backend = get_backend(connection)
+    listings = Listing.objects.using(using).order_by('pk').values_list('pk', *FIELDS)
+    last_pk, total = 0, 0
+    while True:
+        batch = list(listings.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic(using=using):
+            backend.index(connection, batch)
+        last_pk = batch[-1][0]
+        total += len(batch)
+        if progress:
+            progress(total)
+    with transaction.atomic(using=using):
+        backend.prune(connection)
+    cache.bump(cache.LIST_SCOPE, using=using)
+    return total
@@ -1,26 +1,103 @@
 from rest_framework import serializers
-from .models import Listing, Booking, Review
+from . import perf
+from .models import Listing, Booking, Review, SeasonalRate, amenities_prefetch
+from .amenities import parse_amenities
+from .analytics import GRANULARITIES
+from .fieldsets import SparseFieldsMixin
+from .occupancy import ENCODINGS, MAX_MONTHS, add_months
+from .pricing import MAX_NIGHTS
+from .reservations import reserve
 from django.contrib.auth.models import User
+from django.utils import timezone
+from datetime import datetime
 
-class UserSerializer(serializers.ModelSerializer):
+class AmenitiesField(serializers.Field):
+    """
+    Amenities as a comma-separated string, e.g. ``"WiFi, Kitchen"``.
+    
+    Reads the listing's prefetched ``listing_amenities`` in display order;
+    accepts either a comma-separated string or a list of names.
+    """
+    default_error_messages = {
+        'invalid': 'Expected a comma-separated string or a list of names.',
+    }
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'listing_amenities')
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+    
+    def to_representation(self, value):
+        return ', '.join(link.amenity.name for link in value.all())
+    
+    def to_internal_value(self, data):
+        if not isinstance(data, (str, list)):
+            self.fail('invalid')
+        return parse_amenities(data)
+
+class TimedListSerializer(serializers.ListSerializer):
+    """``many=True`` counterpart of :class:`TimedDataMixin`."""
+    
+    @property
+    def data(self):
+        with perf.timer('serialize'):
+            return super().data
+
+class TimedDataMixin:
+    """Time ``data`` for the request instrumentation (see ``listings.perf``)."""
+    
+    @property
+    def data(self):
+        with perf.timer('serialize'):
+            return super().data
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(TimedDataMixin, SparseFieldsMixin, serializers.ModelSerializer):
     host = UserSerializer(read_only=True)
+    amenities = AmenitiesField()
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    
+    expandable = {'host': 'host_id'}
+    field_columns = {'rating_histogram': tuple(f'rating_{stars}_count' for stars in range(1, 6))}
+    field_prefetches = {'amenities': amenities_prefetch}
     
     class Meta:
         model = Listing
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'title', 'description', 'address', 'city', 'country',
-            'price_per_night', 'max_guests', 'bedrooms', 'bathrooms',
+            'latitude', 'longitude', 'price_per_night', 'max_guests', 'bedrooms', 'bathrooms',
             'property_type', 'amenities', 'is_available', 'host',
+            'avg_rating', 'review_count', 'rating_histogram',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'avg_rating', 'review_count', 'created_at', 'updated_at']
+    
+    def validate(self, attrs):
+        latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError('Provide both latitude and longitude, or neither.')
+        return attrs
+    
+    def create(self, validated_data):
+        amenities = validated_data.pop('listing_amenities', [])
+        listing = super().create(validated_data)
+        listing.set_amenities(amenities)
+        return listing
+    
+    def update(self, instance, validated_data):
+        amenities = validated_data.pop('listing_amenities', None)
+        listing = super().update(instance, validated_data)
+        if amenities is not None:
+            listing.set_amenities(amenities)
+        return listing
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(TimedDataMixin, SparseFieldsMixin, serializers.ModelSerializer):
     guest = UserSerializer(read_only=True)
     listing = ListingSerializer(read_only=True)
     listing_id = serializers.PrimaryKeyRelatedField(
@@ -31,15 +108,73 @@ class BookingSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Booking
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'listing', 'listing_id', 'guest', 'check_in', 'check_out',
             'total_price', 'guests_count', 'status', 'special_requests',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'guest', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'guest', 'total_price', 'created_at', 'updated_at']
+    
+    expandable = {'listing': 'listing_id', 'guest': 'guest_id'}
+    RESERVATION_FIELDS = ('listing', 'check_in', 'check_out', 'guests_count')
+    
+    def validate(self, attrs):
+        listing = attrs.get('listing', getattr(self.instance, 'listing', None))
+        check_in = attrs.get('check_in', getattr(self.instance, 'check_in', None))
+        check_out = attrs.get('check_out', getattr(self.instance, 'check_out', None))
+        guests_count = attrs.get('guests_count', getattr(self.instance, 'guests_count', None))
+        if check_in and check_out and check_out <= check_in:
+            raise serializers.ValidationError({'check_out': 'Must be after check_in.'})
+        if listing and guests_count and guests_count > listing.max_guests:
+            raise serializers.ValidationError(
+                {'guests_count': f'This listing accepts at most {listing.max_guests} guests.'}
+            )
+        return attrs
+    
+    def create(self, validated_data):
+        """Book through the reservation engine, which also prices the stay."""
+        return reserve(
+            validated_data['listing'].pk,
+            validated_data['guest'],
+            validated_data['check_in'],
+            validated_data['check_out'],
+            validated_data['guests_count'],
+            special_requests=validated_data.get('special_requests', ''),
+        )
+    
+    def update(self, instance, validated_data):
+        """Re-check availability when the stay changes or a cancellation is revived."""
+        reactivated = (
+            instance.status == 'cancelled'
+            and validated_data.get('status', 'cancelled') != 'cancelled'
+        )
+        changed = any(
+            field in validated_data and validated_data[field] != getattr(instance, field)
+            for field in self.RESERVATION_FIELDS
+        )
+        if not (changed or reactivated):
+            return super().update(instance, validated_data)
+        
+        instance.status = validated_data.get('status', instance.status)
+        return reserve(
+            validated_data.get('listing', instance.listing).pk,
+            instance.guest,
+            validated_data.get('check_in', instance.check_in),
+            validated_data.get('check_out', instance.check_out),
+            validated_data.get('guests_count', instance.guests_count),
+            special_requests=validated_data.get('special_requests', instance.special_requests),
+            booking=instance,
+        )
+
+class BookingStatusSerializer(serializers.Serializer):
+    """One item of a batch status change: ``{"id": 12, "status": "confirmed"}``."""
+    id = serializers.IntegerField(min_value=1)
+    status = serializers.ChoiceField(choices=Booking.STATUS_CHOICES)
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedDataMixin, SparseFieldsMixin, serializers.ModelSerializer):
     guest = UserSerializer(read_only=True)
+    booking = serializers.IntegerField(source='booking_ref', read_only=True)
     booking_id = serializers.PrimaryKeyRelatedField(
         queryset=Booking.objects.all(),
         source='booking',
@@ -53,8 +188,196 @@ class ReviewSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Review
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'booking', 'booking_id', 'guest', 'listing', 'listing_id',
             'rating', 'comment', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'guest', 'booking', 'listing', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['id', 'guest', 'booking', 'listing', 'created_at', 'updated_at']
+    
+    expandable = {'guest': 'guest_id'}
+    field_columns = {'booking': ('booking', 'archived_booking')}
+
+class AvailabilitySearchSerializer(serializers.Serializer):
+    """Validates the query parameters of the availability search."""
+    city = serializers.CharField(required=False)
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    guests = serializers.IntegerField(min_value=1, default=1)
+    
+    def validate(self, attrs):
+        if attrs['check_out'] <= attrs['check_in']:
+            raise serializers.ValidationError({'check_out': 'Must be after check_in.'})
+        return attrs
+
+
+class GeoSearchSerializer(serializers.Serializer):
+    """
+    Validates the geospatial query parameters: either ``lat``/``lng``/``radius_km``
+    or ``bbox=min_lng,min_lat,max_lng,max_lat`` (GeoJSON order).
+    """
+    lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    lng = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    radius_km = serializers.FloatField(required=False, min_value=0, max_value=500)
+    bbox = serializers.CharField(required=False)
+    
+    def validate_bbox(self, value):
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError('Expected min_lng,min_lat,max_lng,max_lat.')
+        if not (-90 <= min_lat <= max_lat <= 90):
+            raise serializers.ValidationError('Latitudes must satisfy -90 <= min_lat <= max_lat <= 90.')
+        if not (-180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+            raise serializers.ValidationError('Longitudes must be between -180 and 180.')
+        return min_lat, min_lng, max_lat, max_lng
+    
+    def validate(self, attrs):
+        radius = [attrs.get(key) is not None for key in ('lat', 'lng', 'radius_km')]
+        if any(radius) and not all(radius):
+            raise serializers.ValidationError('lat, lng and radius_km must be given together.')
+        return attrs
+
+
+class ExportSerializer(serializers.Serializer):
+    """
+    Validates the filters of the bulk exports: ``start``/``end`` dates
+    (inclusive), and comma-separated ``status`` values and ``listing`` ids.
+    """
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.CharField(required=False)
+    listing = serializers.CharField(required=False)
+    
+    def validate_status(self, value):
+        statuses = [status.strip() for status in value.split(',') if status.strip()]
+        unknown = set(statuses) - {choice for choice, _ in Booking.STATUS_CHOICES}
+        if unknown:
+            raise serializers.ValidationError(f'Unknown status: {", ".join(sorted(unknown))}.')
+        return statuses
+    
+    def validate_listing(self, value):
+        try:
+            return [int(pk) for pk in value.split(',') if pk.strip()]
+        except ValueError:
+            raise serializers.ValidationError('Expected comma-separated listing ids.')
+    
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['end'] < attrs['start']:
+            raise serializers.ValidationError({'end': 'Must not be before start.'})
+        return attrs
+
+
+class SeasonalRateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SeasonalRate
+        fields = ['start_date', 'end_date', 'price_per_night', 'min_nights']
+        extra_kwargs = {'min_nights': {'min_value': 1}}
+    
+    def validate(self, attrs):
+        if attrs['end_date'] <= attrs['start_date']:
+            raise serializers.ValidationError({'end_date': 'Must be after start_date.'})
+        return attrs
+
+
+class PricingCalendarSerializer(serializers.Serializer):
+    """
+    A listing's whole pricing calendar. ``end_date`` of a season is
+    exclusive, like ``check_out``; seasons may not overlap.
+    """
+    weekend_uplift = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, default=0)
+    min_nights = serializers.IntegerField(min_value=1, max_value=MAX_NIGHTS, default=1)
+    weekly_discount = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=100, default=0
+    )
+    monthly_discount = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=100, default=0
+    )
+    seasons = SeasonalRateSerializer(many=True, default=list)
+    
+    def validate_seasons(self, seasons):
+        seasons = sorted(seasons, key=lambda season: season['start_date'])
+        for previous, season in zip(seasons, seasons[1:]):
+            if season['start_date'] < previous['end_date']:
+                raise serializers.ValidationError(
+                    f'Seasons starting {previous["start_date"]} and {season["start_date"]} overlap.'
+                )
+        return seasons
+
+
+class QuoteSerializer(serializers.Serializer):
+    """Validates quote requests: a stay and, for batch quotes, ``ids=1,2,3``."""
+    max_ids = 100
+    
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    ids = serializers.CharField(required=False)
+    
+    def validate_ids(self, value):
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in value.split(',') if pk.strip()))
+        except ValueError:
+            raise serializers.ValidationError('Expected comma-separated listing ids.')
+        if not ids or len(ids) > self.max_ids:
+            raise serializers.ValidationError(f'Expected between 1 and {self.max_ids} listing ids.')
+        return ids
+    
+    def validate(self, attrs):
+        nights = (attrs['check_out'] - attrs['check_in']).days
+        if nights < 1:
+            raise serializers.ValidationError({'check_out': 'Must be after check_in.'})
+        if nights > MAX_NIGHTS:
+            raise serializers.ValidationError({'check_out': f'Stays are limited to {MAX_NIGHTS} nights.'})
+        return attrs
+
+
+class CalendarSerializer(serializers.Serializer):
+    """
+    Validates availability calendar requests: the first month (``YYYY-MM``,
+    default this month), how many ``months`` and the ``encoding``.
+    """
+    start = serializers.CharField(required=False)
+    months = serializers.IntegerField(min_value=1, max_value=MAX_MONTHS, default=12)
+    encoding = serializers.ChoiceField(choices=ENCODINGS, default='bitmap')
+    
+    def validate_start(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m').date()
+        except ValueError:
+            raise serializers.ValidationError('Expected a month as YYYY-MM.')
+    
+    def validate(self, attrs):
+        attrs.setdefault('start', timezone.localdate().replace(day=1))
+        try:
+            add_months(attrs['start'], attrs['months'])
+        except ValueError:
+            raise serializers.ValidationError({'months': 'The window must end by the year 9999.'})
+        return attrs
+
+
+class AnalyticsSerializer(serializers.Serializer):
+    """
+    Validates host analytics queries: ``start``/``end`` dates (inclusive),
+    a ``granularity`` and optionally ``listing=1,2,3`` and, for staff, ``host``.
+    """
+    max_days = 731
+    
+    start = serializers.DateField()
+    end = serializers.DateField()
+    granularity = serializers.ChoiceField(choices=GRANULARITIES, default='day')
+    listing = serializers.CharField(required=False)
+    host = serializers.IntegerField(required=False, min_value=1)
+    
+    def validate_listing(self, value):
+        try:
+            return [int(pk) for pk in value.split(',') if pk.strip()]
+        except ValueError:
+            raise serializers.ValidationError('Expected comma-separated listing ids.')
+    
+    def validate(self, attrs):
+        days = (attrs['end'] - attrs['start']).days + 1
+        if days < 1:
+            raise serializers.ValidationError({'end': 'Must not be before start.'})
+        if days > self.max_days:
+            raise serializers.ValidationError({'end': f'Reports are limited to {self.max_days} days.'})
+        return attrs
@@ -0,0 +1,78 @@
+"""
+Signal handlers that keep derived data in sync with listings.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import analytics, cache, occupancy, search, tasks
+from .models import Booking, Listing, ListingPricing, Review, SeasonalRate
+
+# User fields that ListingSerializer does not render.
+UNRENDERED_USER_FIELDS = {'last_login', 'password'}
+
+
+@receiver(post_save, sender=Listing)
+def index_listing(sender, instance, using, **kwargs):
+    search.index_listings([instance], using=using)
+    cache.invalidate_listings([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Listing)
+def unindex_listing(sender, instance, using, **kwargs):
+    search.remove_listings([instance.pk], using=using)
+    cache.invalidate_listings([instance.pk], using=using)
+    occupancy.invalidate([instance.pk], using=using)
+
+
+@receiver(post_save, sender=User)
+def invalidate_hosted_listings(sender, instance, created, update_fields, using, **kwargs):
+    """A host's profile is embedded in every response for their listings."""
+    if created or (update_fields and set(update_fields) <= UNRENDERED_USER_FIELDS):
+        return
+    pks = list(Listing.objects.using(using).filter(host=instance).values_list('pk', flat=True))
+    if pks:
+        cache.invalidate_listings(pks, using=using)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, using, **kwargs):
+    Listing.objects.using(using).filter(pk=instance.listing_id).adjust_ratings(instance.rating, -1)
+    cache.invalidate_listings([instance.listing_id], using=using)
+
+
+@receiver(post_save, sender=ListingPricing)
+@receiver(post_delete, sender=ListingPricing)
+@receiver(post_save, sender=SeasonalRate)
+@receiver(post_delete, sender=SeasonalRate)
+def invalidate_quotes(sender, instance, using, **kwargs):
+    """Cached quotes live under the listing's version (see listings.pricing)."""
+    cache.bump(cache.listing_scope(instance.listing_id), using=using)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_booking_calendar(sender, instance, using, raw=False, **kwargs):
+    # Before mark_booking_stats_stale, which forgets the stay the booking moved from.
+    if not raw:
+        occupancy.invalidate({listing_id for listing_id, _, _ in analytics.booking_ranges(instance)}, using=using)
+
+
+@receiver(post_save, sender=Booking)
+def mark_booking_stats_stale(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        analytics.mark_stale(analytics.booking_ranges(instance), using=using)
+    instance._stored_stay = (instance.listing_id, instance.check_in, instance.check_out)
+
+
+@receiver(post_delete, sender=Booking)
+def mark_deleted_booking_stats_stale(sender, instance, using, **kwargs):
+    analytics.mark_stale(analytics.booking_ranges(instance), using=using)
+
+
+@receiver(post_save, sender=Booking)
+def queue_booking_confirmation(sender, instance, using, raw=False, **kwargs):
+    confirmed = instance.status == 'confirmed'
+    if not raw and confirmed and getattr(instance, '_stored_status', None) != 'confirmed':
+        tasks.queue_confirmations([instance.pk], using=using)
+    instance._stored_status = instance.status
@@ -0,0 +1,243 @@
+"""
+Deterministic synthetic data at load-testing scale.
+
+:class:`Generator` streams users, listings (with amenities and
+coordinates), bookings and reviews into the database with ``bulk_create``,
+one transaction per chunk of listings, so memory use does not grow with
+the size of the run. A listing's bookings are laid out one after another
+on its calendar and never overlap; stays that ended before ``today`` are
+mostly completed, and only completed stays get reviews. The same seed and
+``today`` always produce the same rows.
+
+Rows are inserted with explicit primary keys after the current maximum,
+and the review aggregates, search index and stale analytics ranges are
+filled in directly since ``bulk_create`` skips ``save()`` and signals.
+"""
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import analytics, cache, search
+from .benchmarking import next_id
+from .models import Amenity, Booking, Listing, ListingAmenity, Review
+from .ratings import aggregates_for
+
+CITIES = [
+    ('Lagos', 'Nigeria', 6.5244, 3.3792), ('Abuja', 'Nigeria', 9.0765, 7.3986),
+    ('Accra', 'Ghana', 5.6037, -0.1870), ('Nairobi', 'Kenya', -1.2921, 36.8219),
+    ('Cairo', 'Egypt', 30.0444, 31.2357), ('Cape Town', 'South Africa', -33.9249, 18.4241),
+    ('Marrakesh', 'Morocco', 31.6295, -7.9811), ('Zanzibar', 'Tanzania', -6.1659, 39.2026),
+    ('New York', 'USA', 40.7128, -74.0060), ('Miami', 'USA', 25.7617, -80.1918),
+    ('Austin', 'USA', 30.2672, -97.7431), ('San Francisco', 'USA', 37.7749, -122.4194),
+    ('London', 'United Kingdom', 51.5074, -0.1278), ('Paris', 'France', 48.8566, 2.3522),
+    ('Berlin', 'Germany', 52.5200, 13.4050), ('Lisbon', 'Portugal', 38.7223, -9.1393),
+    ('Barcelona', 'Spain', 41.3874, 2.1686), ('Rome', 'Italy', 41.9028, 12.4964),
+    ('Tokyo', 'Japan', 35.6762, 139.6503), ('Singapore', 'Singapore', 1.3521, 103.8198),
+    ('Sydney', 'Australia', -33.8688, 151.2093), ('Dubai', 'UAE', 25.2048, 55.2708),
+]
+AMENITIES = [
+    'WiFi', 'Kitchen', 'Air Conditioning', 'TV', 'Pool', 'Free Parking', 'Washer',
+    'Dryer', 'Heating', 'Workspace', 'Gym', 'Hot Tub', 'Fireplace', 'Balcony',
+    'Garden', 'Breakfast', 'Pet Friendly', 'Sea View', 'Elevator', 'Security',
+]
+ADJECTIVES = ['Cozy', 'Modern', 'Spacious', 'Charming', 'Sunny', 'Quiet', 'Stylish', 'Rustic', 'Luxury']
+FEATURES = [
+    'close to restaurants and nightlife', 'with a view over the city', 'steps from the beach',
+    'in a quiet residential street', 'near public transport', 'with a private garden',
+    'ideal for families', 'perfect for remote work', 'in the historic center',
+]
+# property type: (bedrooms range, nightly price range)
+PROPERTY_TYPES = {
+    'apartment': ((1, 3), (40, 180)),
+    'studio': ((1, 1), (30, 110)),
+    'condo': ((1, 3), (60, 220)),
+    'house': ((2, 5), (90, 400)),
+    'cabin': ((1, 4), (70, 260)),
+    'villa': ((3, 7), (200, 900)),
+}
+RATING_WEIGHTS = [3, 5, 12, 35, 45]
+REVIEW_RATE = 0.6
+COMMENTS = {
+    1: 'Not as described, would not stay again.',
+    2: 'Below expectations, several things were broken.',
+    3: 'Decent stay, but it could have been cleaner.',
+    4: 'Great place and a helpful host.',
+    5: 'Perfect stay, everything was exactly as listed!',
+}
+SPECIAL_REQUESTS = ['', '', '', 'Late arrival', 'Early check-in requested', 'Baby cot, please']
+
+
+class Generator:
+    """
+    Generate ``listings`` listings, ``bookings`` bookings and ``users`` users
+    (hosts and guests drawn from the same pool).
+    """
+
+    def __init__(self, listings, bookings, users=None, seed=42, today=None, using='default'):
+        self.listing_count = listings
+        self.booking_count = bookings
+        self.user_count = users or max(100, listings // 5)
+        self.rng = random.Random(seed)
+        self.today = today or date.today()
+        self.using = using
+
+    def run(self, chunk_size=1000, progress=None):
+        """
+        Insert everything, ``chunk_size`` listings (and their bookings and
+        reviews) per transaction. ``progress`` is called after each chunk
+        with the running totals. Returns the totals.
+        """
+        self.totals = {'users': 0, 'listings': 0, 'bookings': 0, 'reviews': 0}
+        self.started = time.perf_counter()
+        self.create_users(chunk_size * 10, progress)
+        self.amenities = Amenity.objects.db_manager(self.using).resolve(AMENITIES)
+        self.next_listing_id = next_id(Listing, using=self.using)
+        self.next_booking_id = next_id(Booking, using=self.using)
+        self.next_review_id = next_id(Review, using=self.using)
+        for start in range(0, self.listing_count, chunk_size):
+            with transaction.atomic(using=self.using):
+                self.create_chunk(start, min(start + chunk_size, self.listing_count))
+            if progress:
+                progress(self.totals, time.perf_counter() - self.started)
+        cache.bump(cache.LIST_SCOPE, using=self.using)
+        return self.totals
+
+    def create_users(self, chunk_size, progress):
+        self.first_user_id = next_id(User, using=self.using)
+        for start in range(0, self.user_count, chunk_size):
+            users = [
+                User(
+                    id=self.first_user_id + i,
+                    username=f'user{self.first_user_id + i}',
+                    email=f'user{self.first_user_id + i}@example.com',
+                    first_name=f'User{i}',
+                    password='!',  # unusable
+                )
+                for i in range(start, min(start + chunk_size, self.user_count))
+            ]
+            with transaction.atomic(using=self.using):
+                User.objects.using(self.using).bulk_create(users)
+            self.totals['users'] += len(users)
+        if progress:
+            progress(self.totals, time.perf_counter() - self.started)
+
+    def bookings_for(self, index):
+        """Bookings of the ``index``-th listing, spreading the total evenly."""
+        share, extra = divmod(self.booking_count, self.listing_count)
+        return share + (index < extra)
+
+    def create_chunk(self, start, stop):
+        listings, links, bookings, reviews = [], [], [], []
+        for index in range(start, stop):
+            listing = self.make_listing()
+            links.extend(
+                ListingAmenity(listing_id=listing.id, amenity=amenity, position=position)
+                for position, amenity in enumerate(
+                    self.rng.sample(self.amenities, self.rng.randint(3, 8))
+                )
+            )
+            histogram = {}
+            for booking in self.make_bookings(listing, self.bookings_for(index)):
+                bookings.append(booking)
+                if booking.status == 'completed' and self.rng.random() < REVIEW_RATE:
+                    review = self.make_review(booking)
+                    reviews.append(review)
+                    histogram[review.rating] = histogram.get(review.rating, 0) + 1
+            for field, value in aggregates_for(histogram).items():
+                setattr(listing, field, value)
+            listings.append(listing)
+
+        Listing.objects.using(self.using).bulk_create(listings)
+        ListingAmenity.objects.using(self.using).bulk_create(links)
+        Booking.objects.using(self.using).bulk_create(bookings)
+        Review.objects.using(self.using).bulk_create(reviews)
+        search.index_listings(listings, using=self.using)
+        spans = {}
+        for booking in bookings:
+            start, end = spans.get(booking.listing_id, (booking.check_in, booking.check_out))
+            spans[booking.listing_id] = (min(start, booking.check_in), max(end, booking.check_out))
+        analytics.mark_stale(
+            [(listing_id, start, end) for listing_id, (start, end) in spans.items()], using=self.using
+        )
+        self.totals['listings'] += len(listings)
+        self.totals['bookings'] += len(bookings)
+        self.totals['reviews'] += len(reviews)
+
+    def random_user_id(self, exclude=None):
+        user_id = self.first_user_id + self.rng.randrange(self.user_count)
+        if user_id == exclude:
+            user_id = self.first_user_id + (user_id - self.first_user_id + 1) % self.user_count
+        return user_id
+
+    def make_listing(self):
+        rng = self.rng
+        city, country, latitude, longitude = rng.choice(CITIES)
+        property_type = rng.choice(list(PROPERTY_TYPES))
+        (min_bedrooms, max_bedrooms), (min_price, max_price) = PROPERTY_TYPES[property_type]
+        bedrooms = rng.randint(min_bedrooms, max_bedrooms)
+        listing = Listing(
+            id=self.next_listing_id,
+            title=f'{rng.choice(ADJECTIVES)} {property_type} in {city}',
+            description=f'A {bedrooms}-bedroom {property_type} {rng.choice(FEATURES)}.',
+            address=f'{rng.randint(1, 999)} {rng.choice(ADJECTIVES)} Street',
+            city=city,
+            country=country,
+            # Within roughly 20 km of the city center.
+            latitude=round(latitude + rng.gauss(0, 0.08), 6),
+            longitude=round(longitude + rng.gauss(0, 0.08), 6),
+            price_per_night=Decimal(rng.randint(min_price, max_price)),
+            max_guests=bedrooms * 2,
+            bedrooms=bedrooms,
+            bathrooms=max(1, bedrooms - rng.randint(0, 1)),
+            property_type=property_type,
+            is_available=rng.random() < 0.95,
+            host_id=self.random_user_id(),
+        )
+        listing.refresh_geohash()
+        self.next_listing_id += 1
+        return listing
+
+    def make_bookings(self, listing, count):
+        """``count`` back-to-back stays, starting up to two years ago."""
+        rng = self.rng
+        check_in = self.today - timedelta(days=rng.randint(30, 730))
+        for _ in range(count):
+            check_in += timedelta(days=rng.randint(0, 10))
+            nights = rng.randint(1, 10)
+            check_out = check_in + timedelta(days=nights)
+            if check_out <= self.today:
+                status = 'completed' if rng.random() < 0.9 else 'cancelled'
+            elif check_in > self.today:
+                status = rng.choices(['confirmed', 'pending', 'cancelled'], [7, 2, 1])[0]
+            else:
+                status = 'confirmed'
+            yield Booking(
+                id=self.next_booking_id,
+                listing_id=listing.id,
+                guest_id=self.random_user_id(exclude=listing.host_id),
+                check_in=check_in,
+                check_out=check_out,
+                total_price=listing.price_per_night * nights,
+                guests_count=rng.randint(1, listing.max_guests),
+                status=status,
+                special_requests=rng.choice(SPECIAL_REQUESTS),
+            )
+            self.next_booking_id += 1
+            check_in = check_out
+
+    def make_review(self, booking):
+        rating = self.rng.choices(range(1, 6), RATING_WEIGHTS)[0]
+        review = Review(
+            id=self.next_review_id,
+            booking_id=booking.id,
+            guest_id=booking.guest_id,
+            listing_id=booking.listing_id,
+            rating=rating,
+            comment=COMMENTS[rating],
+        )
+        self.next_review_id += 1
+        return review
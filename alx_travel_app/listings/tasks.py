@@ -0,0 +1,39 @@
+"""
+Celery tasks for the listings app (see alx_travel_app.celery).
+"""
+from celery import shared_task
+from django.db import transaction
+
+from . import analytics, archive, lifecycle
+
+
+@shared_task
+def send_booking_confirmations(booking_ids, using='default'):
+    return lifecycle.send_confirmations(booking_ids, using=using)
+
+
+@shared_task
+def booking_lifecycle():
+    return lifecycle.advance()
+
+
+@shared_task
+def refresh_analytics():
+    return analytics.refresh()
+
+
+@shared_task
+def archive_bookings():
+    return archive.archive()
+
+
+def queue_confirmations(booking_ids, using='default'):
+    """
+    Send the confirmation emails for ``booking_ids`` from a worker once the
+    current transaction commits, so the worker reads the confirmed rows.
+    """
+    booking_ids = list(booking_ids)
+    if booking_ids:
+        transaction.on_commit(
+            lambda: send_booking_confirmations.delay(booking_ids, using=using), using=using
+        )
@@ -1,3 +1,1768 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, models, transaction
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import (
+    analytics, apidocs, archive, async_views, batch, cache, facets, geo, lifecycle, occupancy, perf,
+    pricing, ratings, replicas, search, synthetic, tasks,
+)
+from .benchmarking import compare, hammer_reservations
+from .compiled import compile_serializer
+from .models import (
+    Amenity, ArchivedBooking, Listing, ListingPricing, Booking, Review, SeasonalRate, StaleStatsRange,
+)
+from .reservations import ListingUnavailable, reserve
+from .serializers import BookingSerializer, ListingSerializer
+from .urls import router
+from .views import BookingViewSet, ListingViewSet
+
+# The API routes as served under ASGI, for AsyncReadTests.
+urlpatterns = [path('api/', include(async_views.with_async_reads(router.urls)))]
+
+
+def make_listing(host, **overrides):
+    """Create a listing with sensible defaults for tests."""
+    data = {
+        'title': 'Test Listing',
+        'description': 'A place to stay.',
+        'address': '1 Test Street',
+        'city': 'Lagos',
+        'country': 'Nigeria',
+        'price_per_night': Decimal('100.00'),
+        'max_guests': 4,
+        'bedrooms': 2,
+        'bathrooms': 1,
+        'property_type': 'apartment',
+        'host': host,
+    }
+    data.update(overrides)
+    amenities = data.pop('amenities', 'WiFi, Kitchen')
+    listing = Listing.objects.create(**data)
+    listing.set_amenities(amenities)
+    return listing
+
+
+def make_booking(listing, guest, start_offset=1, nights=2, **overrides):
+    """Create a booking starting ``start_offset`` days from today."""
+    check_in = date.today() + timedelta(days=start_offset)
+    data = {
+        'listing': listing,
+        'guest': guest,
+        'check_in': check_in,
+        'check_out': check_in + timedelta(days=nights),
+        'total_price': listing.price_per_night * nights,
+        'guests_count': 1,
+    }
+    data.update(overrides)
+    return Booking.objects.create(**data)
+
+
+async def consume(content):
+    """The bytes of an async streaming response."""
+    return b''.join([chunk async for chunk in content])
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Base class for query-budget tests.
+
+    Every endpoint is exercised at two data sizes; the number of queries
+    must not exceed the budget and must not grow with the number of rows.
+    """
+    small_size = 2
+    large_size = 15
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.guest = User.objects.create_user('guest')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.offset = 0
+
+    def populate(self, size):
+        """
+        Create ``size`` listings, each with its own host and one booking,
+        and add ``size`` more bookings to the first listing.
+        """
+        # Committed, so that the cached responses are invalidated.
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(size):
+                self.offset += 3
+                host = User.objects.create_user(f'host{self.offset}')
+                listing = make_listing(host, title=f'Listing {self.offset}')
+                make_booking(listing, self.guest, start_offset=self.offset)
+                first = Listing.objects.order_by('pk').first()
+                booking = make_booking(first, self.guest, start_offset=1000 + self.offset)
+                Review.objects.create(
+                    booking=booking, guest=self.guest, listing=first, rating=5, comment='Lovely.'
+                )
+
+    def count_queries(self, url, user=None):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries)
+
+    def assertQueryBudget(self, budget, url_factory, user=None):
+        """Assert ``budget`` holds for both data sizes and does not scale."""
+        self.populate(self.small_size)
+        small = self.count_queries(url_factory(), user)
+        self.populate(self.large_size - self.small_size)
+        large = self.count_queries(url_factory(), user)
+        self.assertLessEqual(small, budget, f'{small} queries, budget is {budget}')
+        self.assertEqual(small, large, 'query count grows with the number of rows')
+
+
+class ListingQueryBudgetTests(QueryBudgetTestCase):
+    def test_list(self):
+        # COUNT + page + amenities
+        self.assertQueryBudget(3, lambda: '/api/listings/')
+
+    def test_detail(self):
+        self.assertQueryBudget(2, lambda: f'/api/listings/{Listing.objects.first().pk}/')
+
+    def test_bookings_action(self):
+        # listing lookup + COUNT + page + amenities
+        self.assertQueryBudget(
+            4, lambda: f'/api/listings/{Listing.objects.order_by("pk").first().pk}/bookings/'
+        )
+
+    def test_list_with_cursor(self):
+        # No COUNT, no OFFSET: a single keyset query, plus amenities.
+        self.assertQueryBudget(2, lambda: '/api/listings/?pagination=cursor')
+
+    def test_reviews_action(self):
+        # listing lookup + page
+        self.assertQueryBudget(
+            2, lambda: f'/api/listings/{Listing.objects.order_by("pk").first().pk}/reviews/'
+        )
+
+    def test_available(self):
+        self.assertQueryBudget(
+            3, lambda: '/api/listings/available/?check_in=2030-01-01&check_out=2030-01-05'
+        )
+
+    def test_search(self):
+        self.assertQueryBudget(3, lambda: '/api/listings/?q=listing')
+
+    def test_radius(self):
+        self.assertQueryBudget(3, lambda: '/api/listings/?lat=6.5&lng=3.4&radius_km=50')
+
+    def test_bookings_action_is_paginated(self):
+        self.populate(1)
+        listing = Listing.objects.get()
+        for i in range(25):
+            make_booking(listing, self.guest, start_offset=2000 + i * 3)
+        response = self.client.get(f'/api/listings/{listing.pk}/bookings/')
+        self.assertEqual(response.json()['count'], 27)
+        self.assertEqual(len(response.json()['results']), 20)
+
+
+class BookingQueryBudgetTests(QueryBudgetTestCase):
+    def test_list_for_guest(self):
+        self.assertQueryBudget(3, lambda: '/api/bookings/', user=self.guest)
+
+    def test_list_with_cursor(self):
+        self.assertQueryBudget(2, lambda: '/api/bookings/?pagination=cursor', user=self.guest)
+
+    def test_list_for_staff(self):
+        self.assertQueryBudget(3, lambda: '/api/bookings/', user=self.staff)
+
+    def test_detail(self):
+        self.assertQueryBudget(
+            2, lambda: f'/api/bookings/{Booking.objects.first().pk}/', user=self.guest
+        )
+
+
+class AvailabilitySearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        host = User.objects.create_user('host')
+        self.guest = User.objects.create_user('guest')
+        self.free = make_listing(host, title='Free', max_guests=2)
+        self.busy = make_listing(host, title='Busy', max_guests=6)
+        self.elsewhere = make_listing(host, title='Elsewhere', city='Abuja')
+        make_booking(self.busy, self.guest, start_offset=10, nights=4)
+        make_booking(self.free, self.guest, start_offset=10, nights=4, status='cancelled')
+
+    def search(self, start_offset, nights, **params):
+        check_in = date.today() + timedelta(days=start_offset)
+        params.update(check_in=check_in, check_out=check_in + timedelta(days=nights))
+        response = self.client.get('/api/listings/available/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['title'] for item in response.json()['results']}
+
+    def test_excludes_overlapping_active_bookings(self):
+        self.assertEqual(self.search(12, 1, city='Lagos'), {'Free'})
+        self.assertEqual(self.search(8, 3, city='Lagos'), {'Free'})
+
+    def test_back_to_back_stays_do_not_overlap(self):
+        self.assertEqual(self.search(14, 2, city='Lagos'), {'Free', 'Busy'})
+        self.assertEqual(self.search(8, 2, city='Lagos'), {'Free', 'Busy'})
+
+    def test_filters_by_guests_and_city(self):
+        self.assertEqual(self.search(30, 2, city='Lagos', guests=3), {'Busy'})
+        self.assertEqual(self.search(30, 2), {'Free', 'Busy', 'Elsewhere'})
+
+    def test_rejects_inverted_range(self):
+        response = self.client.get(
+            '/api/listings/available/', {'check_in': '2030-01-05', 'check_out': '2030-01-01'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ReservationStressTests(TransactionTestCase):
+    """
+    Concurrent reservations must never double-book a listing, and bookings
+    for different listings must not block each other where the database has
+    row locks. Throughput is measured by the ``bench_reservations`` command.
+    """
+    threads = 8
+    attempts_per_thread = 10
+
+    def setUp(self):
+        self.guest = User.objects.create_user('guest')
+        host = User.objects.create_user('host')
+        self.listings = [make_listing(host, title=f'Listing {i}') for i in range(4)]
+
+    def hammer(self, listing_ids):
+        """Have every thread try to book overlapping stays on ``listing_ids``."""
+        outcomes, _ = hammer_reservations(
+            listing_ids, self.guest, date.today() + timedelta(days=1), self.threads, self.attempts_per_thread
+        )
+        return outcomes
+
+    def assertNoDoubleBookings(self):
+        for listing in self.listings:
+            stays = sorted(
+                Booking.objects.active().filter(listing=listing)
+                .values_list('check_in', 'check_out')
+            )
+            for (_, previous_out), (next_in, _) in zip(stays, stays[1:]):
+                self.assertLessEqual(previous_out, next_in, f'double booking on {listing}')
+
+    def test_same_listing(self):
+        outcomes = self.hammer([self.listings[0].pk])
+        self.assertEqual(len(outcomes), self.threads * self.attempts_per_thread)
+        self.assertEqual(
+            outcomes.count('booked'), Booking.objects.filter(listing=self.listings[0]).count()
+        )
+        self.assertIn('conflict', outcomes)
+        self.assertNoDoubleBookings()
+
+    def test_many_listings(self):
+        outcomes = self.hammer([listing.pk for listing in self.listings])
+        self.assertEqual(outcomes.count('booked'), Booking.objects.count())
+        self.assertNoDoubleBookings()
+
+    def test_lock_scope(self):
+        """
+        A reservation waits for a transaction holding another listing's lock
+        only on backends without row locks (SQLite, which locks the database).
+        """
+        locked, release, booked = threading.Event(), threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    Listing.objects.select_for_update().get(pk=self.listings[0].pk)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        def book_other_listing():
+            try:
+                check_in = date.today() + timedelta(days=1)
+                reserve(self.listings[1].pk, self.guest, check_in, check_in + timedelta(days=2), 1)
+                booked.set()
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_lock)
+        booker = threading.Thread(target=book_other_listing)
+        holder.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            booker.start()
+            if connection.features.has_select_for_update:
+                self.assertTrue(booked.wait(5), 'a reservation waited for the lock on another listing')
+            else:
+                self.assertFalse(booked.wait(0.5), 'the database-wide write lock was not held')
+                release.set()
+                self.assertTrue(booked.wait(5))
+        finally:
+            release.set()
+            holder.join()
+            if booker.ident is not None:
+                booker.join()
+
+    def test_total_price_is_computed_on_the_server(self):
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        response = client.post('/api/bookings/', {
+            'listing_id': self.listings[0].pk,
+            'check_in': '2031-03-01',
+            'check_out': '2031-03-04',
+            'guests_count': 2,
+            'total_price': '1.00',
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['total_price'], '300.00')
+
+        response = client.post('/api/bookings/', {
+            'listing_id': self.listings[0].pk,
+            'check_in': '2031-03-03',
+            'check_out': '2031-03-05',
+            'guests_count': 1,
+        })
+        self.assertEqual(response.status_code, 409)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        host = User.objects.create_user('host')
+        self.listings = [make_listing(host, title=f'Listing {i}') for i in range(7)]
+        # Several rows share a timestamp; the id breaks the tie.
+        Listing.objects.filter(pk__in=[l.pk for l in self.listings[2:5]]).update(
+            created_at=self.listings[2].created_at
+        )
+        self.expected = list(
+            Listing.objects.order_by('-created_at', '-id').values_list('title', flat=True)
+        )
+
+    def walk(self, url, key):
+        titles, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            titles.extend(item['title'] for item in response.json()['results'])
+            url = response.json()[key]
+            pages += 1
+        return titles, pages, response
+
+    def test_walks_forward_and_back(self):
+        titles, pages, last = self.walk('/api/listings/?pagination=cursor&page_size=2', 'next')
+        self.assertEqual(titles, self.expected)
+        self.assertEqual(pages, 4)
+        self.assertNotIn('count', last.data)
+
+        back, _, _ = self.walk(last.data['previous'], 'previous')
+        pages_before_last = [self.expected[i:i + 2] for i in range(0, 6, 2)]
+        self.assertEqual(back, [t for page in reversed(pages_before_last) for t in page])
+
+    def test_approximate_count(self):
+        response = self.client.get('/api/listings/?pagination=cursor&count=approx')
+        self.assertEqual(response.json()['count'], 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/listings/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_refuses_other_orderings(self):
+        for query in ('ordering=price_per_night', 'q=listing', 'lat=6.5&lng=3.4&radius_km=50'):
+            response = self.client.get(f'/api/listings/?pagination=cursor&{query}')
+            self.assertEqual(response.status_code, 400, query)
+        response = self.client.get('/api/listings/?pagination=cursor&ordering=-created_at')
+        self.assertEqual(response.status_code, 200)
+
+
+class AmenityTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.host = User.objects.create_user('host')
+        make_listing(self.host, title='Both', amenities='Wi-Fi, Swimming Pool, TV')
+        make_listing(self.host, title='Wifi only', amenities='wifi, Kitchen')
+        make_listing(self.host, title='None', amenities='')
+
+    def titles(self, query):
+        response = self.client.get(f'/api/listings/?amenities={query}')
+        return {item['title'] for item in response.json()['results']}
+
+    def test_filter_requires_all_amenities(self):
+        self.assertEqual(self.titles('WiFi'), {'Both', 'Wifi only'})
+        self.assertEqual(self.titles('wifi,pool'), {'Both'})
+        self.assertEqual(self.titles('wifi,sauna'), set())
+
+    def test_output_keeps_string_shape_and_order(self):
+        response = self.client.get('/api/listings/', {'amenities': 'tv'})
+        self.assertEqual(response.json()['results'][0]['amenities'], 'Wi-Fi, Swimming Pool, TV')
+
+    def test_write_accepts_string(self):
+        self.client.force_authenticate(self.host)
+        listing = Listing.objects.get(title='None')
+        response = self.client.patch(
+            f'/api/listings/{listing.pk}/', {'amenities': 'Kitchen, WIFI, kitchen'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['amenities'], 'Kitchen, Wi-Fi')
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.host = User.objects.create_user('host')
+        make_listing(self.host, title='Beach villa', description='Villa by the beach, villa pool.')
+        make_listing(self.host, title='City flat', description='Near the beach.', city='Accra')
+        self.cabin = make_listing(self.host, title='Cabin', description='Quiet woods.', country='Ghana')
+
+    def titles(self, query):
+        response = self.client.get('/api/listings/', {'q': query})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['title'] for item in response.json()['results']]
+
+    def test_ranks_by_relevance(self):
+        self.assertEqual(self.titles('beach'), ['Beach villa', 'City flat'])
+        self.assertEqual(self.titles('beach accra'), ['City flat'])
+
+    def test_prefix_and_syntax_are_safe(self):
+        self.assertEqual(self.titles('vil'), ['Beach villa'])
+        self.assertEqual(self.titles('"ghana" -(*'), ['Cabin'])
+
+    def test_index_follows_save_and_delete(self):
+        self.cabin.title = 'Treehouse'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cabin.save()
+        self.assertEqual(self.titles('treehouse'), ['Treehouse'])
+        self.assertEqual(self.titles('cabin'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cabin.delete()
+        self.assertEqual(self.titles('treehouse'), [])
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        self.assertEqual(self.titles('woods'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(search.rebuild(batch_size=2), 3)
+        self.assertEqual(self.titles('woods'), ['Cabin'])
+
+
+class GeoSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        host = User.objects.create_user('host')
+        make_listing(host, title='Lagos Island', latitude=6.4541, longitude=3.3947)
+        make_listing(host, title='Ikeja', latitude=6.6018, longitude=3.3515)
+        make_listing(host, title='Ibadan', latitude=7.3775, longitude=3.9470)
+        make_listing(host, title='Fiji', latitude=-17.7134, longitude=178.0650)
+        make_listing(host, title='Samoa', latitude=-13.7590, longitude=-172.1046)
+        make_listing(host, title='Nowhere')
+
+    def titles(self, **params):
+        response = self.client.get('/api/listings/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['title'] for item in response.json()['results']]
+
+    def test_encode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(Listing.objects.get(title='Ikeja').geohash[:5], geo.encode(6.6018, 3.3515, 5))
+        self.assertEqual(Listing.objects.get(title='Nowhere').geohash, '')
+
+    def test_radius_orders_by_distance(self):
+        self.assertEqual(self.titles(lat=6.45, lng=3.39, radius_km=5), ['Lagos Island'])
+        self.assertEqual(self.titles(lat=6.45, lng=3.39, radius_km=30), ['Lagos Island', 'Ikeja'])
+        self.assertEqual(
+            self.titles(lat=6.45, lng=3.39, radius_km=200), ['Lagos Island', 'Ikeja', 'Ibadan']
+        )
+
+    def test_bbox(self):
+        self.assertEqual(set(self.titles(bbox='3.0,6.0,3.5,7.0')), {'Lagos Island', 'Ikeja'})
+        # Crossing the antimeridian.
+        self.assertEqual(set(self.titles(bbox='170,-20,-170,-10')), {'Fiji', 'Samoa'})
+
+    def test_validation(self):
+        response = self.client.get('/api/listings/', {'lat': 6.45, 'radius_km': 5})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/listings/', {'bbox': '1,2,3'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        host = User.objects.create_user('host')
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(host, title='Rated')
+        self.other = make_listing(host, title='Other')
+
+    def review(self, rating, listing=None):
+        listing = listing or self.listing
+        booking = make_booking(listing, self.guest, start_offset=Booking.objects.count() * 3 + 1)
+        return Review.objects.create(
+            booking=booking, guest=self.guest, listing=listing, rating=rating, comment='.'
+        )
+
+    def aggregates(self, listing=None):
+        listing = Listing.objects.get(pk=(listing or self.listing).pk)
+        return listing.review_count, listing.avg_rating, listing.rating_histogram
+
+    def test_incremental_updates(self):
+        first = self.review(5)
+        self.review(4)
+        self.review(4)
+        self.assertEqual(
+            self.aggregates(), (3, Decimal('4.33'), {'1': 0, '2': 0, '3': 0, '4': 2, '5': 1})
+        )
+
+        first.rating = 1
+        first.save()
+        self.assertEqual(self.aggregates()[:2], (3, Decimal('3.00')))
+
+        first.listing = self.other
+        first.save()
+        self.assertEqual(self.aggregates()[:2], (2, Decimal('4.00')))
+        self.assertEqual(self.aggregates(self.other)[:2], (1, Decimal('1.00')))
+
+        first.booking.delete()
+        self.assertEqual(self.aggregates(self.other), (0, None, {str(i): 0 for i in range(1, 6)}))
+
+    def test_average_is_set_before_the_columns_it_reads(self):
+        # MySQL evaluates SET left to right, with the columns already assigned.
+        with CaptureQueriesContext(connection) as queries:
+            Listing.objects.filter(pk=self.listing.pk).adjust_ratings(5, 1)
+        assignments = queries[0]['sql'].split(' SET ', 1)[1]
+        self.assertLess(assignments.index('"avg_rating"'), assignments.index('"review_count" ='))
+        self.assertLess(assignments.index('"avg_rating"'), assignments.index('"rating_sum" ='))
+
+    def test_recompute_repairs_drift(self):
+        self.review(5)
+        self.review(3)
+        Review.objects.update(rating=1)
+        Listing.objects.filter(pk=self.other.pk).update(review_count=7)
+        self.assertEqual(ratings.recompute(batch_size=1), (2, 2))
+        self.assertEqual(self.aggregates()[:2], (2, Decimal('1.00')))
+        self.assertEqual(self.aggregates(self.other)[:2], (0, None))
+        self.assertEqual(ratings.recompute(), (2, 0))
+
+    def test_sort_and_filter(self):
+        self.review(3)
+        self.review(5, listing=self.other)
+        response = self.client.get('/api/listings/', {'ordering': '-avg_rating'})
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Other', 'Rated'])
+        self.assertEqual(response.json()['results'][0]['avg_rating'], '5.00')
+        response = self.client.get('/api/listings/', {'min_rating': 4})
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Other'])
+        for value in ('nan', 'inf', '-1', '6'):
+            self.assertEqual(self.client.get('/api/listings/', {'min_rating': value}).status_code, 400, value)
+
+
+class ConcurrentReviewTests(TransactionTestCase):
+    def test_concurrent_reviews_are_all_counted(self):
+        host = User.objects.create_user('host')
+        guest = User.objects.create_user('guest')
+        listing = make_listing(host)
+        bookings = [make_booking(listing, guest, start_offset=i * 3 + 1) for i in range(24)]
+
+        def worker(chunk):
+            try:
+                for booking in chunk:
+                    Review.objects.create(
+                        booking=booking, guest=guest, listing=listing,
+                        rating=booking.pk % 5 + 1, comment='.',
+                    )
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(bookings[i::6],)) for i in range(6)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        listing.refresh_from_db()
+        self.assertEqual(listing.review_count, 24)
+        self.assertEqual(listing.rating_sum, sum(b.pk % 5 + 1 for b in bookings))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        cache.stats.reset()
+        self.client = APIClient()
+        self.host = User.objects.create_user('host', first_name='Ada')
+        self.listing = make_listing(self.host, title='Cached')
+        self.url = f'/api/listings/{self.listing.pk}/'
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, HTTP_ACCEPT='application/json', **headers)
+
+    def test_hit_runs_no_queries(self):
+        self.assertEqual(self.get('/api/listings/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.get('/api/listings/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['results'][0]['title'], 'Cached')
+        self.assertEqual(cache.stats.snapshot()['hit_rate'], 0.5)
+
+    def test_conditional_get(self):
+        first = self.get()
+        response = self.get(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.get(HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        response = self.get(HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_listing_change_invalidates(self):
+        etag = self.get()['ETag']
+        self.get('/api/listings/')
+        self.listing.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.listing.save()
+            # Nothing is invalidated before the commit.
+            self.assertEqual(self.get()['X-Cache'], 'HIT')
+        self.assertTrue(callbacks)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Renamed')
+        self.assertEqual(self.get('/api/listings/').json()['results'][0]['title'], 'Renamed')
+
+    def test_host_and_related_changes_invalidate(self):
+        self.get()
+        self.host.first_name = 'Grace'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.host.save()
+        self.assertEqual(self.get().json()['host']['first_name'], 'Grace')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.set_amenities('Pool')
+        self.assertEqual(self.get().json()['amenities'], 'Pool')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = make_booking(self.listing, self.host)
+            Review.objects.create(booking=booking, guest=self.host, listing=self.listing, rating=4, comment='.')
+        self.assertEqual(self.get().json()['review_count'], 1)
+
+    def test_padded_ids_are_invalidated_with_the_listing(self):
+        padded = f'/api/listings/0{self.listing.pk}/'
+        self.assertEqual(self.get(padded)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(padded)['X-Cache'], 'HIT')
+        self.listing.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.save()
+        self.assertEqual(self.get(padded).json()['title'], 'Renamed')
+        self.assertNotIn('X-Cache', self.get('/api/listings/abc/'))
+
+    def test_unrelated_user_changes_do_not_invalidate(self):
+        self.get()
+        self.host.last_login = self.listing.created_at
+        self.host.save(update_fields=['last_login'])
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+    def test_browsable_api_is_not_cached(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/html')
+        self.assertNotIn('X-Cache', response)
+
+
+class CompiledSerializerTests(TestCase):
+    def setUp(self):
+        host = User.objects.create_user('host', email='host@example.com', first_name='Ada')
+        guest = User.objects.create_user('guest')
+        rated = make_listing(host, latitude=6.45, longitude=3.39, price_per_night=Decimal('87.5'))
+        make_listing(host, amenities='', title='Plain')
+        booking = make_booking(rated, guest, special_requests='Late arrival')
+        make_booking(rated, guest, start_offset=10, status='cancelled')
+        Review.objects.create(booking=booking, guest=guest, listing=rated, rating=5, comment='.')
+
+    def assertSameJSON(self, serializer_class, queryset):
+        instances = list(queryset)
+        expected = JSONRenderer().render(serializer_class(instances, many=True).data)
+        actual = JSONRenderer().render(compile_serializer(serializer_class).many(instances))
+        self.assertEqual(actual, expected)
+
+    def test_listings_render_identically(self):
+        self.assertSameJSON(ListingSerializer, Listing.objects.for_serialization())
+
+    def test_bookings_render_identically(self):
+        self.assertSameJSON(BookingSerializer, Booking.objects.for_serialization())
+
+
+class SyntheticDataTests(TestCase):
+    def generate(self, **kwargs):
+        generator = synthetic.Generator(40, 300, seed=7, today=date(2025, 6, 1), **kwargs)
+        return generator.run(chunk_size=15)
+
+    def test_totals_and_invariants(self):
+        totals = self.generate()
+        self.assertEqual(totals['listings'], 40)
+        self.assertEqual(totals['bookings'], 300)
+        self.assertEqual(Booking.objects.count(), 300)
+        self.assertEqual(Review.objects.count(), totals['reviews'])
+        self.assertFalse(Review.objects.exclude(booking__status='completed').exists())
+        self.assertFalse(Booking.objects.filter(guest=models.F('listing__host')).exists())
+        for listing in Listing.objects.all():
+            stays = list(listing.bookings.order_by('check_in').values_list('check_in', 'check_out'))
+            self.assertTrue(all(a[1] <= b[0] for a, b in zip(stays, stays[1:])))
+        self.assertEqual(ratings.recompute(), (40, 0))
+        self.assertEqual(search.search(Listing.objects.all(), 'lagos').count(),
+                         Listing.objects.filter(city='Lagos').count())
+
+    def test_ids_are_read_from_the_target_database(self):
+        with mock.patch.object(synthetic, 'next_id', wraps=synthetic.next_id) as next_id:
+            synthetic.Generator(4, 10, seed=7, using='default').run()
+        self.assertEqual({call.kwargs.get('using') for call in next_id.call_args_list}, {'default'})
+        self.assertEqual(next_id.call_count, 4)
+
+    def test_same_seed_same_rows(self):
+        self.generate()
+        first = list(Booking.objects.order_by('pk').values_list('check_in', 'status', 'total_price'))
+        Booking.objects.all().delete()
+        Listing.objects.all().delete()
+        self.generate()
+        second = list(Booking.objects.order_by('pk').values_list('check_in', 'status', 'total_price'))
+        self.assertEqual(first, second)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.guest = User.objects.create_user('guest')
+        host = User.objects.create_user('host')
+        self.lagos = make_listing(host, city='Lagos')
+        self.accra = make_listing(host, city='Accra', title='Accra flat')
+        make_booking(self.lagos, self.guest, start_offset=1, status='confirmed')
+        make_booking(self.lagos, self.guest, start_offset=5, status='cancelled')
+        make_booking(self.accra, self.guest, start_offset=30)
+        make_booking(self.accra, host, start_offset=1)
+
+    def rows(self, response):
+        return list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_bookings_csv_is_scoped_and_filtered(self):
+        self.client.force_authenticate(self.guest)
+        response = self.client.get('/api/bookings/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(len(self.rows(response)), 3)
+
+        end = (date.today() + timedelta(days=10)).isoformat()
+        response = self.client.get(f'/api/bookings/export/?end={end}&status=confirmed,pending')
+        rows = self.rows(response)
+        self.assertEqual([row['status'] for row in rows], ['confirmed'])
+        self.assertEqual(rows[0]['listing_id'], str(self.lagos.pk))
+        self.assertEqual(rows[0]['total_price'], '200.00')
+
+    def test_listings_ndjson_applies_list_filters(self):
+        self.assertEqual(self.client.get('/api/listings/export/').status_code, 403)
+        self.client.force_authenticate(self.guest)
+        response = self.client.get('/api/listings/export/?format=ndjson&q=accra')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['city'] for line in lines], ['Accra'])
+
+    async def test_asgi_streams_with_an_async_iterator(self):
+        # Django buffers a sync iterator in full under ASGI.
+        client = AsyncClient()
+        await client.aforce_login(self.guest)
+        response = await client.get('/api/bookings/export/?format=ndjson')
+        self.assertTrue(response.is_async)
+        lines = (await consume(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_invalid_filters(self):
+        self.client.force_authenticate(self.guest)
+        response = self.client.get('/api/bookings/export/?format=ndjson&status=lost')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', json.loads(response.content))
+        self.assertEqual(self.client.get('/api/bookings/export/?listing=x').status_code, 400)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export', 'bookings', '--listing', str(self.accra.pk), stdout=out)
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(out.getvalue())))), 2)
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.host = User.objects.create_user('host')
+        self.client.force_authenticate(self.host)
+
+    def listing_item(self, i, **overrides):
+        item = {
+            'title': f'Batch listing {i}', 'description': 'Onboarded in bulk.',
+            'address': f'{i} Batch Road', 'city': 'Kumasi', 'country': 'Ghana',
+            'latitude': 6.69, 'longitude': -1.62, 'price_per_night': '75.00',
+            'max_guests': 2, 'bedrooms': 1, 'bathrooms': 1, 'property_type': 'apartment',
+            'amenities': 'WiFi, Pool' if i % 2 else 'wi-fi',
+        }
+        item.update(overrides)
+        return item
+
+    def test_create_listings_reports_each_item(self):
+        items = [self.listing_item(0), self.listing_item(1, max_guests=-1), self.listing_item(3)]
+        response = self.client.post('/api/listings/batch/', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (2, 1))
+        results = response.data['results']
+        self.assertEqual([result['ok'] for result in results], [True, False, True])
+        self.assertIn('max_guests', results[1]['errors'])
+
+        listing = Listing.objects.get(pk=results[2]['id'])
+        self.assertEqual(listing.host, self.host)
+        self.assertEqual(listing.geohash, geo.encode(6.69, -1.62))
+        # Spelling variants within a batch share one catalog entry.
+        self.assertEqual([a.name for a in listing.amenities.order_by('listing_amenities__position')], ['wi-fi', 'Pool'])
+        self.assertEqual(Amenity.objects.filter(slug='wifi').count(), 1)
+        self.assertEqual(search.search(Listing.objects.all(), 'kumasi').count(), 2)
+
+    def test_create_listings_in_constant_queries(self):
+        self.client.post('/api/listings/batch/', [self.listing_item(0)], format='json')
+        for size in (5, 60):
+            items = [self.listing_item(i) for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/listings/batch/', items, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertLessEqual(len(queries), 12)
+
+    def test_rejects_oversized_and_malformed_batches(self):
+        with override_settings(LISTINGS_BATCH_MAX_ITEMS=2):
+            items = [self.listing_item(i) for i in range(3)]
+            self.assertEqual(self.client.post('/api/listings/batch/', items, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/listings/batch/', {}, format='json').status_code, 400)
+        self.assertFalse(Listing.objects.exists())
+
+    def test_update_booking_statuses(self):
+        listing = make_listing(self.host)
+        other = User.objects.create_user('other')
+        pending = make_booking(listing, self.host, start_offset=1)
+        confirmed = make_booking(listing, self.host, start_offset=5, status='confirmed')
+        cancelled = make_booking(listing, self.host, start_offset=10, status='cancelled')
+        foreign = make_booking(listing, other, start_offset=20)
+        items = [
+            {'id': pending.pk, 'status': 'confirmed'},
+            {'id': confirmed.pk, 'status': 'completed'},
+            {'id': cancelled.pk, 'status': 'pending'},
+            {'id': foreign.pk, 'status': 'confirmed'},
+            {'id': pending.pk, 'status': 'cancelled'},
+            {'id': pending.pk, 'status': 'lost'},
+        ]
+        response = self.client.patch('/api/bookings/batch/', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['ok'] for result in response.data['results']],
+                         [True, True, False, False, False, False])
+        statuses = dict(Booking.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[pending.pk], 'confirmed')
+        self.assertEqual(statuses[confirmed.pk], 'completed')
+        self.assertEqual(statuses[cancelled.pk], 'cancelled')
+        self.assertEqual(statuses[foreign.pk], 'pending')
+        self.assertGreater(Booking.objects.get(pk=pending.pk).updated_at, pending.updated_at)
+
+
+class FacetedFilterTests(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+        host = User.objects.create_user('host')
+        make_listing(host, city='Lagos', property_type='apartment', price_per_night=Decimal('40'),
+                     bedrooms=1, latitude=6.52, longitude=3.38)
+        make_listing(host, city='Lagos', property_type='house', price_per_night=Decimal('150'),
+                     bedrooms=3, max_guests=6, latitude=6.53, longitude=3.39)
+        make_listing(host, city='Accra', country='Ghana', property_type='house',
+                     price_per_night=Decimal('600'), bedrooms=4, max_guests=8)
+
+    def get(self, query):
+        return self.client.get(f'/api/listings/?{query}', HTTP_ACCEPT='application/json').json()
+
+    def test_attribute_filters(self):
+        self.assertEqual(self.get('city=Lagos')['count'], 2)
+        self.assertEqual(self.get('country=Ghana')['count'], 1)
+        self.assertEqual(self.get('property_type=house,villa')['count'], 2)
+        self.assertEqual(self.get('min_price=100&max_price=200')['count'], 1)
+        self.assertEqual(self.get('min_bedrooms=3&guests=7')['count'], 1)
+        response = self.client.get('/api/listings/?min_price=cheap', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_facets_follow_filters(self):
+        data = self.get('facets=1')
+        self.assertEqual(data['facets']['city'], {'Lagos': 2, 'Accra': 1})
+        self.assertEqual(data['facets']['property_type']['house'], 2)
+        self.assertEqual(data['facets']['property_type']['villa'], 0)
+        self.assertEqual(data['facets']['price'], {'0-50': 1, '50-100': 0, '100-200': 1, '200-500': 0, '500+': 1})
+
+        facets = self.get('facets=1&property_type=house&lat=6.52&lng=3.38&radius_km=10')['facets']
+        self.assertEqual(facets['city'], {'Lagos': 1})
+        self.assertEqual(self.get('facets=1&q=accra')['facets']['city'], {'Accra': 1})
+        self.assertNotIn('facets', self.get('city=Lagos'))
+
+    def test_facets_are_one_query_and_cached(self):
+        with self.assertNumQueries(1):
+            facets.compute(Listing.objects.all())
+        self.get('facets=1&city=Lagos')
+        # Another ordering of the same filters reuses the cached facets: only
+        # the count, page and amenities queries run.
+        with self.assertNumQueries(3):
+            self.get('facets=1&city=Lagos&ordering=price_per_night')
+
+        listing = Listing.objects.get(city='Accra')
+        listing.city = 'Lagos'
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.save()
+        self.assertEqual(self.get('facets=1&city=Lagos')['facets']['city'], {'Lagos': 3})
+
+
+class PricingTests(TestCase):
+    # 2030-01-07 is a Monday.
+    monday = date(2030, 1, 7)
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.host = User.objects.create_user('host')
+        self.listing = make_listing(self.host, price_per_night=Decimal('100.00'))
+        ListingPricing.objects.create(
+            listing=self.listing, weekend_uplift=Decimal('20'), min_nights=2,
+            weekly_discount=Decimal('10'), monthly_discount=Decimal('25'),
+        )
+        # Thursday to Saturday night at 150.
+        SeasonalRate.objects.create(
+            listing=self.listing, start_date=self.monday + timedelta(days=3),
+            end_date=self.monday + timedelta(days=6), price_per_night=Decimal('150.00'),
+        )
+
+    def quote(self, check_in, nights, listing=None):
+        listing = listing or self.listing
+        return pricing.compute_quotes([listing.pk], check_in, check_in + timedelta(days=nights))[listing.pk]
+
+    def test_nightly_rates(self):
+        quote = self.quote(self.monday + timedelta(days=1), 6)
+        self.assertEqual(
+            quote['nightly_rates'],
+            ['100.00', '100.00', '150.00', '180.00', '180.00', '100.00'],
+        )
+        self.assertEqual((quote['subtotal'], quote['discount'], quote['total']), ('810.00', '0.00', '810.00'))
+
+    def test_length_of_stay_discounts_and_min_nights(self):
+        weekly = self.quote(self.monday + timedelta(days=14), 7)
+        self.assertEqual((weekly['subtotal'], weekly['discount_percent'], weekly['total']),
+                         ('740.00', '10.00', '666.00'))
+        monthly = self.quote(self.monday + timedelta(days=14), 28)
+        self.assertEqual(monthly['discount_percent'], '25.00')
+        self.assertFalse(self.quote(self.monday, 1)['bookable'])
+        plain = make_listing(self.host, price_per_night=Decimal('80.00'))
+        self.assertEqual(self.quote(self.monday, 7, listing=plain)['total'], '560.00')
+
+    def test_reservations_use_the_calendar(self):
+        guest = User.objects.create_user('guest')
+        booking = reserve(self.listing.pk, guest, self.monday + timedelta(days=1),
+                          self.monday + timedelta(days=7), 1)
+        self.assertEqual(booking.total_price, Decimal('810.00'))
+        with self.assertRaisesMessage(Exception, 'at least 2 nights'):
+            reserve(self.listing.pk, guest, self.monday + timedelta(days=20),
+                    self.monday + timedelta(days=21), 1)
+
+    def test_quote_endpoint_is_cached_until_the_calendar_changes(self):
+        url = (f'/api/listings/{self.listing.pk}/quote/'
+               f'?check_in={self.monday + timedelta(days=1)}&check_out={self.monday + timedelta(days=7)}')
+        self.assertEqual(self.client.get(url).data['total'], '810.00')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data['total'], '810.00')
+
+        self.client.force_authenticate(self.host)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/api/listings/{self.listing.pk}/pricing/', {
+                'weekend_uplift': '0',
+                'seasons': [{'start_date': str(self.monday), 'end_date': str(self.monday + timedelta(days=30)),
+                             'price_per_night': '90.00'}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['min_nights'], 1)
+        self.assertEqual(len(response.data['seasons']), 1)
+        self.assertEqual(self.client.get(url).data['total'], '540.00')
+
+    def test_calendar_validation_and_permissions(self):
+        url = f'/api/listings/{self.listing.pk}/pricing/'
+        self.client.force_authenticate(User.objects.create_user('other'))
+        self.assertEqual(self.client.put(url, {}, format='json').status_code, 403)
+        self.client.force_authenticate(self.host)
+        overlapping = [
+            {'start_date': '2030-01-01', 'end_date': '2030-01-10', 'price_per_night': '90.00'},
+            {'start_date': '2030-01-09', 'end_date': '2030-01-12', 'price_per_night': '95.00'},
+        ]
+        response = self.client.put(url, {'seasons': overlapping}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).data['weekend_uplift'], '20.00')
+
+    def test_batch_quotes_in_constant_queries(self):
+        listings = [make_listing(self.host, price_per_night=Decimal(50 + i)) for i in range(12)]
+        stay = f'check_in={self.monday}&check_out={self.monday + timedelta(days=3)}'
+        for page in (listings[:2], listings):
+            ids = ','.join(str(listing.pk) for listing in page)
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/api/listings/quotes/?{stay}&ids={ids},999999')
+            self.assertEqual([quote['listing_id'] for quote in response.data['results']],
+                             [listing.pk for listing in page])
+        self.assertEqual(response.data['results'][0]['total'], '150.00')
+        self.assertEqual(self.client.get(f'/api/listings/quotes/?{stay}').status_code, 400)
+
+
+class AnalyticsTests(TestCase):
+    # 2030-01-07 is a Monday.
+    monday = date(2030, 1, 7)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.host = User.objects.create_user('host')
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(self.host)
+        self.booking = self.book(self.listing, self.monday, 3, total_price=Decimal('100.00'))
+
+    def book(self, listing, check_in, nights, status='confirmed', **overrides):
+        return make_booking(
+            listing, self.guest, start_offset=(check_in - date.today()).days, nights=nights,
+            status=status, **overrides
+        )
+
+    def rollups(self, listing=None):
+        return list(
+            (listing or self.listing).daily_stats.order_by('date')
+            .values_list('date', 'nights_booked', 'revenue', 'check_ins')
+        )
+
+    def test_refresh_spreads_revenue_over_nights(self):
+        self.book(self.listing, self.monday + timedelta(days=4), 2, status='pending')
+        self.book(self.listing, self.monday + timedelta(days=3), 1, total_price=Decimal('80.00'))
+        analytics.refresh()
+        self.assertEqual(self.rollups(), [
+            (self.monday, 1, Decimal('33.33'), 1),
+            (self.monday + timedelta(days=1), 1, Decimal('33.33'), 0),
+            (self.monday + timedelta(days=2), 1, Decimal('33.34'), 0),
+            (self.monday + timedelta(days=3), 1, Decimal('80.00'), 1),
+        ])
+        self.assertFalse(StaleStatsRange.objects.exists())
+
+        [result] = analytics.report([self.listing], self.monday, self.monday + timedelta(days=9), 'week')
+        self.assertEqual([period['period_start'] for period in result['periods']],
+                         [self.monday, self.monday + timedelta(days=7)])
+        self.assertEqual(result['periods'][0], {
+            'period_start': self.monday, 'days': 7, 'nights_booked': 4, 'occupancy': 0.5714,
+            'revenue': '180.00', 'adr': '45.00', 'check_ins': 2,
+        })
+        self.assertEqual(result['periods'][1]['days'], 3)
+        self.assertEqual(result['periods'][1]['adr'], None)
+        self.assertEqual(result['totals']['days'], 10)
+        self.assertEqual(result['totals']['occupancy'], 0.4)
+
+    def test_incremental_refresh_follows_booking_changes(self):
+        other = make_listing(self.host)
+        other_booking = self.book(other, self.monday, 2)
+        call_command('refresh_analytics', '--full', stdout=io.StringIO())
+        self.assertEqual(len(self.rollups(other)), 2)
+        self.assertEqual(analytics.refresh(), 0)
+
+        # Moving a stay recomputes the nights it left as well as the new ones.
+        booking = Booking.objects.get(pk=self.booking.pk)
+        booking.check_in += timedelta(days=10)
+        booking.check_out += timedelta(days=10)
+        booking.save()
+        self.assertEqual(analytics.refresh(), 1)
+        self.assertEqual([row[0] for row in self.rollups()],
+                         [self.monday + timedelta(days=10 + night) for night in range(3)])
+
+        batch.update_booking_statuses([{'id': booking.pk, 'status': 'cancelled'}], Booking.objects.all())
+        other_booking.delete()
+        self.assertEqual(analytics.refresh(), 2)
+        self.assertEqual(self.rollups(), [])
+        self.assertEqual(self.rollups(other), [])
+
+        other.delete()
+        self.assertEqual(analytics.refresh(), 0)
+
+    def test_endpoint_is_scoped_to_the_host(self):
+        self.book(make_listing(self.host), self.monday, 1)
+        stranger = User.objects.create_user('stranger')
+        make_listing(stranger)
+        analytics.refresh()
+        url = f'/api/listings/analytics/?start={self.monday}&end={self.monday + timedelta(days=30)}'
+
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+        self.client.force_authenticate(self.host)
+        with self.assertNumQueries(3):
+            response = self.client.get(url + '&granularity=month')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        totals = {result['listing_id']: result['totals'] for result in response.data['results']}
+        self.assertEqual(totals[self.listing.pk]['revenue'], '100.00')
+        self.assertEqual(totals[self.listing.pk]['occupancy'], round(3 / 31, 4))
+        response = self.client.get(url + f'&listing={self.listing.pk}')
+        self.assertEqual([result['listing_id'] for result in response.data['results']], [self.listing.pk])
+        self.assertEqual(len(response.data['results'][0]['periods']), 31)
+
+        self.assertEqual(self.client.get(url + f'&host={stranger.pk}').status_code, 403)
+        self.assertEqual(self.client.get(url + '&granularity=year').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/listings/analytics/?start={self.monday}'
+                                         f'&end={self.monday - timedelta(days=1)}').status_code, 400)
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(url + f'&host={stranger.pk}')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['totals']['nights_booked'], 0)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncReadTests(TransactionTestCase):
+    """
+    The native async read views, against the sync views of the default
+    URLconf. Their queries run on pool threads with their own connections,
+    which only see committed data.
+    """
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.host = User.objects.create_user('host')
+        self.guest = User.objects.create_user('guest', password='secret')
+        self.listings = [
+            make_listing(self.host, city='Lagos' if i % 2 else 'Accra', price_per_night=Decimal(80 + i))
+            for i in range(25)
+        ]
+        for listing in self.listings[:3]:
+            make_booking(listing, self.guest, start_offset=5)
+        self.async_client = AsyncClient()
+
+    def sync_get(self, url, user=None):
+        client = Client()
+        if user:
+            client.force_login(user)
+        with override_settings(ROOT_URLCONF='alx_travel_app.urls'):
+            response = client.get(url)
+        cache.get_cache().clear()
+        return response
+
+    async def test_hot_reads_render_like_the_sync_views(self):
+        stay = f'check_in={date.today() + timedelta(days=4)}&check_out={date.today() + timedelta(days=7)}'
+        urls = [
+            '/api/listings/',
+            '/api/listings/?city=Lagos&ordering=-price_per_night',
+            '/api/listings/?page=2&min_price=81',
+            f'/api/listings/{self.listings[0].pk}/',
+            f'/api/listings/available/?{stay}',
+            f'/api/listings/available/?{stay}&page=2',
+            f'/api/listings/available/?{stay}&city=Accra',
+            '/api/listings/?fields=id,title,host',
+            '/api/bookings/',
+            '/api/bookings/?fields=id,listing.title',
+        ]
+        await self.async_client.aforce_login(self.guest)
+        for url in urls:
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url.split('?')[0]).func))
+            expected = await sync_to_async(self.sync_get)(url, self.guest)
+            # Any fall through to the DRF views would fail loudly.
+            with mock.patch.object(ListingViewSet, 'dispatch', side_effect=AssertionError), \
+                    mock.patch.object(BookingViewSet, 'dispatch', side_effect=AssertionError):
+                response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response.content, expected.content, url)
+            self.assertEqual(response['Allow'], expected['Allow'], url)
+            self.assertIn('Accept', response['Vary'], url)
+            self.assertEqual(response.get('X-Cache'), expected.get('X-Cache'), url)
+
+    # Basic auth hashes the password, which would log the requests as slow.
+    @override_settings(LISTINGS_PERF_SLOW_MS=float('inf'))
+    async def test_bookings_go_through_the_viewset_authenticators(self):
+        credentials = base64.b64encode(b'guest:secret').decode()
+        with mock.patch.object(BookingViewSet, 'dispatch', side_effect=AssertionError):
+            response = await self.async_client.get(
+                '/api/bookings/', headers={'Authorization': f'Basic {credentials}'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 3)
+
+        # Rejected credentials fall through to the DRF view's error response.
+        wrong = base64.b64encode(b'guest:wrong').decode()
+        response = await self.async_client.get('/api/bookings/', headers={'Authorization': f'Basic {wrong}'})
+        self.assertEqual(response.status_code, 403)
+
+    async def test_cached_reads_revalidate(self):
+        url = f'/api/listings/{self.listings[0].pk}/'
+        first = await self.async_client.get(url)
+        second = await self.async_client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual((first['X-Cache'], second.status_code, second['X-Cache']), ('MISS', 304, 'HIT'))
+
+    async def test_everything_else_falls_through_to_drf(self):
+        stay = f'check_in={date.today() + timedelta(days=7)}&check_out={date.today() + timedelta(days=4)}'
+        cases = [
+            ('/api/listings/999999/', 404),
+            ('/api/listings/abc/', 404),
+            ('/api/listings/?page=9', 404),
+            ('/api/listings/?min_rating=high', 400),
+            (f'/api/listings/available/?{stay}', 400),
+            ('/api/listings/?fields=id,secret', 400),
+            ('/api/bookings/', 403),
+        ]
+        for url, status_code in cases:
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, status_code, url)
+            self.assertEqual(response.content, (await sync_to_async(self.sync_get)(url)).content, url)
+
+        response = await self.async_client.get('/api/listings/?pagination=cursor&facets=1')
+        self.assertIn('next', response.json())
+        response = await self.async_client.get('/api/listings/', headers={'Accept': 'text/html'})
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+
+        await self.async_client.aforce_login(self.host)
+        response = await self.async_client.post('/api/listings/', {
+            'title': 'New', 'description': 'New listing.', 'address': '2 Test Street', 'city': 'Lagos',
+            'country': 'Nigeria', 'price_per_night': '90.00', 'max_guests': 2, 'bedrooms': 1,
+            'bathrooms': 1, 'property_type': 'apartment',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((await self.async_client.get('/api/listings/')).json()['count'], 26)
+
+
+class LifecycleTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.host = User.objects.create_user('host', email='host@example.com')
+        self.guest = User.objects.create_user('guest', email='guest@example.com')
+        self.listing = make_listing(self.host)
+
+    def test_advance_updates_in_batches(self):
+        done = make_booking(self.listing, self.guest, start_offset=-3, status='confirmed')
+        leaving = make_booking(self.listing, self.guest, start_offset=-2, status='confirmed')
+        staying = make_booking(self.listing, self.guest, start_offset=-1, status='confirmed')
+        fresh = make_booking(self.listing, self.guest, start_offset=5)
+        forgotten = make_booking(self.listing, self.guest, start_offset=10)
+        Booking.objects.filter(pk=forgotten.pk).update(created_at=timezone.now() - timedelta(days=2))
+        arrived = make_booking(self.listing, self.guest, start_offset=0)
+        cancelled = make_booking(self.listing, self.guest, start_offset=-5, status='cancelled')
+        stale_ranges = StaleStatsRange.objects.count()
+
+        # Per transition: a SELECT per batch plus one to find the end, an UPDATE per batch.
+        with self.assertNumQueries(10):
+            self.assertEqual(lifecycle.advance(batch_size=1), {'completed': 2, 'expired': 2})
+        statuses = dict(Booking.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            [statuses[booking.pk] for booking in (done, leaving, staying, fresh, forgotten, arrived, cancelled)],
+            ['completed', 'completed', 'confirmed', 'pending', 'cancelled', 'cancelled', 'cancelled'],
+        )
+        self.assertGreater(Booking.objects.get(pk=done.pk).updated_at, done.updated_at)
+        self.assertEqual(StaleStatsRange.objects.count(), stale_ranges)
+        self.assertEqual(tasks.booking_lifecycle(), {'completed': 0, 'expired': 0})
+
+    def test_confirmations_are_queued_after_commit(self):
+        self.client.force_authenticate(self.guest)
+        first = make_booking(self.listing, self.guest, start_offset=1)
+        second = make_booking(self.listing, self.guest, start_offset=5)
+        with mock.patch.object(tasks.send_booking_confirmations, 'delay') as delay:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.client.patch(f'/api/bookings/{first.pk}/', {'status': 'confirmed'}, format='json')
+                delay.assert_not_called()
+            for callback in callbacks:
+                callback()
+            delay.assert_called_once_with([first.pk], using='default')
+
+            delay.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                # Already confirmed: no second email.
+                self.client.patch(f'/api/bookings/{first.pk}/', {'special_requests': 'Late'}, format='json')
+                self.client.patch('/api/bookings/batch/', [
+                    {'id': first.pk, 'status': 'confirmed'}, {'id': second.pk, 'status': 'confirmed'},
+                ], format='json')
+            delay.assert_called_once_with([second.pk], using='default')
+
+        Booking.objects.filter(pk=second.pk).update(status='cancelled')
+        self.assertEqual(tasks.send_booking_confirmations([first.pk, second.pk]), 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['guest@example.com', 'host@example.com'])
+        self.assertIn(f'#{first.pk}', mail.outbox[0].body)
+
+
+class ReplicaSelectionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(User.objects.create_user('host'))
+        self.addCleanup(replicas.unavailable.clear)
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_writes_pin_reads_to_the_primary(self):
+        self.assertEqual(replicas.choose(self.guest), 'default')
+        booking = make_booking(self.listing, self.guest)
+        self.client.force_authenticate(self.guest)
+        self.client.patch(f'/api/bookings/{booking.pk}/', {'special_requests': 'Quiet'}, format='json')
+        self.assertIsNone(replicas.choose(self.guest))
+        self.assertEqual(replicas.choose(User.objects.create_user('other')), 'default')
+
+        replicas.mark_down('default')
+        self.assertIsNone(replicas.choose(self.listing.host))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_reads_the_primary(self):
+        self.assertIsNone(replicas.choose(self.guest))
+        self.assertEqual(replicas.ReplicaRouter().db_for_read(Listing), None)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Replicas mirror the test database, so their queries see the same rows.
+    Without DATABASE_REPLICA_URLS, a second connection to the test database
+    stands in for one.
+    """
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        if not settings.DATABASE_REPLICAS:
+            alias = 'test_replica'
+            default = connections['default'].settings_dict
+            connections.settings[alias] = {**default, 'TEST': {**default['TEST'], 'MIRROR': 'default'}}
+            cls.addClassCleanup(connections.settings.pop, alias)
+            cls.addClassCleanup(connections.__delitem__, alias)
+            cls.addClassCleanup(lambda: connections[alias].close())
+            cls.enterClassContext(override_settings(DATABASE_REPLICAS=[alias]))
+        super().setUpClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(User.objects.create_user('host'))
+        self.booking = make_booking(self.listing, self.guest)
+        self.client.force_authenticate(self.guest)
+        cache.get_cache().clear()
+        self.addCleanup(replicas.unavailable.clear)
+
+    def get(self, url, client=None):
+        """``(response, number of queries on the primary, on the replicas)``."""
+        with CaptureQueriesContext(connection) as primary:
+            contexts = [CaptureQueriesContext(connections[alias]) for alias in settings.DATABASE_REPLICAS]
+            for context in contexts:
+                context.__enter__()
+            try:
+                if client is None:
+                    response = self.client.get(url)
+                    if response.streaming:
+                        response.streamed = b''.join(response.streaming_content)
+                else:
+                    response = async_to_sync(client.get)(url)
+                    response.streamed = async_to_sync(consume)(response.streaming_content)
+            finally:
+                for context in contexts:
+                    context.__exit__(None, None, None)
+        return response, len(primary), sum(len(context) for context in contexts)
+
+    def test_safe_reads_go_to_a_replica(self):
+        response, on_primary, on_replicas = self.get('/api/bookings/')
+        self.assertEqual((response.status_code, response.data['count']), (200, 1))
+        self.assertEqual(on_primary, 0)
+        self.assertGreater(on_replicas, 0)
+
+        # Responses that fill the shared cache are built on the primary.
+        _, on_primary, on_replicas = self.get(f'/api/listings/{self.listing.pk}/')
+        self.assertEqual(on_replicas, 0)
+        self.assertGreater(on_primary, 0)
+
+        self.client.patch(f'/api/bookings/{self.booking.pk}/', {'special_requests': 'Quiet'}, format='json')
+        _, on_primary, on_replicas = self.get('/api/bookings/')
+        self.assertEqual(on_replicas, 0)
+
+    def test_failed_replica_falls_back_to_the_primary(self):
+        failing = mock.patch.object(
+            connections[settings.DATABASE_REPLICAS[0]], 'cursor', side_effect=OperationalError('gone')
+        )
+        with mock.patch.object(settings, 'DATABASE_REPLICAS', settings.DATABASE_REPLICAS[:1]), failing:
+            response, on_primary, _ = self.get('/api/bookings/')
+            self.assertEqual((response.status_code, response.data['count']), (200, 1))
+            self.assertGreater(on_primary, 0)
+            self.assertIn(settings.DATABASE_REPLICAS[0], replicas.unavailable)
+            _, _, on_replicas = self.get('/api/bookings/')
+            self.assertEqual(on_replicas, 0)
+
+    def test_exports_stream_from_the_replica(self):
+        response, on_primary, on_replicas = self.get('/api/bookings/export/?format=ndjson')
+        self.assertEqual(len(response.streamed.splitlines()), 1)
+        self.assertEqual(on_primary, 0)
+        self.assertGreater(on_replicas, 0)
+
+        failing = mock.patch.object(
+            connections[settings.DATABASE_REPLICAS[0]], 'cursor', side_effect=OperationalError('gone')
+        )
+        with mock.patch.object(settings, 'DATABASE_REPLICAS', settings.DATABASE_REPLICAS[:1]), failing:
+            response, on_primary, _ = self.get('/api/bookings/export/')
+            self.assertEqual(len(list(csv.DictReader(io.StringIO(response.streamed.decode())))), 1)
+            self.assertGreater(on_primary, 0)
+            self.assertIn(settings.DATABASE_REPLICAS[0], replicas.unavailable)
+
+    def test_asgi_exports_stream_from_the_replica(self):
+        client = AsyncClient()
+        async_to_sync(client.aforce_login)(self.guest)
+        response, on_primary, on_replicas = self.get('/api/bookings/export/?format=ndjson', client)
+        self.assertTrue(response.is_async)
+        self.assertEqual(len(response.streamed.splitlines()), 1)
+        self.assertGreater(on_replicas, 0)
+
+        failing = mock.patch.object(
+            connections[settings.DATABASE_REPLICAS[0]], 'cursor', side_effect=OperationalError('gone')
+        )
+        with mock.patch.object(settings, 'DATABASE_REPLICAS', settings.DATABASE_REPLICAS[:1]), failing:
+            response, on_primary, _ = self.get('/api/bookings/export/?format=ndjson', client)
+            self.assertEqual(len(response.streamed.splitlines()), 1)
+            self.assertGreater(on_primary, 0)
+
+
+@override_settings(LISTINGS_PERF_SAMPLE_RATE=1.0, LISTINGS_PERF_SERVER_TIMING=True)
+class PerformanceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.guest = User.objects.create_user('guest')
+        listing = make_listing(User.objects.create_user('host'))
+        for offset in (1, 5, 9):
+            make_booking(listing, self.guest, start_offset=offset)
+        self.client.force_authenticate(self.guest)
+        perf.metrics.reset()
+
+    def test_sampled_requests_report_their_timings(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/bookings/')
+        query_count = len(queries)
+        timing = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 'serialize', 'total'})
+        self.assertIn(f'desc="{query_count} queries"', timing['db'])
+
+        self.client.get('/api/bookings/')
+        self.client.get('/api/nowhere/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        endpoints = self.client.get('/api/metrics/').data['endpoints']
+        bookings = endpoints['GET booking-list']
+        self.assertEqual((bookings['requests'], bookings['sampled']), (2, 2))
+        self.assertEqual(bookings['queries_per_request'], query_count)
+        self.assertLessEqual(bookings['total_ms']['p50'], bookings['total_ms']['p99'])
+        self.assertGreater(bookings['serialize_ms']['max'], 0)
+        self.assertEqual(endpoints['GET <unresolved>']['requests'], 1)
+
+    @override_settings(LISTINGS_PERF_SLOW_MS=0)
+    def test_slow_requests_log_their_sql(self):
+        with self.assertLogs('listings.perf', 'WARNING') as logs:
+            self.client.get('/api/bookings/')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['event'], line['endpoint']), ('slow_request', 'GET booking-list'))
+        self.assertTrue(any('listings_booking' in statement['sql'] for statement in line['sql']))
+
+    @override_settings(LISTINGS_PERF_SERVER_TIMING=False)
+    def test_server_timing_is_for_staff_only(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/bookings/'))
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        self.assertIn('Server-Timing', self.client.get('/api/bookings/'))
+
+    @override_settings(LISTINGS_PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_only_counted(self):
+        response = self.client.get('/api/bookings/')
+        self.assertNotIn('Server-Timing', response)
+        stats = perf.metrics.snapshot()['GET booking-list']
+        self.assertEqual((stats['requests'], stats['sampled'], stats['db_ms']), (1, 0, None))
+
+    def test_histogram_percentiles(self):
+        histogram = perf.Histogram()
+        for value in range(1, 1001):
+            histogram.add(value / 10)
+        self.assertAlmostEqual(histogram.percentile(0.5), 50, delta=5)
+        self.assertAlmostEqual(histogram.percentile(0.99), 99, delta=10)
+        self.assertEqual(histogram.percentile(1), 100)
+
+
+class SchemaArtifactTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.schema_dir = Path(directory.name)
+        self.enterContext(override_settings(API_SCHEMA_DIR=self.schema_dir))
+        apidocs.artifacts.clear()
+        self.addCleanup(apidocs.artifacts.clear)
+        self.client = Client(HTTP_HOST='localhost')
+
+    def test_serves_the_prebuilt_schema_with_an_etag(self):
+        call_command('build_schema', stdout=io.StringIO())
+        with mock.patch.object(apidocs, 'generate', side_effect=AssertionError('regenerated')):
+            response = self.client.get('/swagger.json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, (self.schema_dir / 'openapi.json').read_bytes())
+            self.assertIn('/listings/', json.loads(response.content)['paths'])
+            self.assertIn('max-age=3600', response['Cache-Control'])
+
+            revalidated = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated['ETag'], response['ETag'])
+
+            # A deploy that rebuilds the schema is picked up without a restart.
+            path = self.schema_dir / 'openapi.json'
+            path.write_bytes(b'{"swagger": "2.0", "paths": {}}')
+            os.utime(path, (time.time() + 10, time.time() + 10))
+            rebuilt = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(rebuilt.status_code, 200)
+            self.assertNotEqual(rebuilt['ETag'], response['ETag'])
+
+    def test_generates_once_without_an_artifact(self):
+        with mock.patch.object(apidocs, 'generate', wraps=apidocs.generate) as generate:
+            self.assertEqual(self.client.get('/swagger.yaml').status_code, 200)
+            self.assertEqual(self.client.get('/swagger.json').status_code, 200)
+            self.assertEqual(self.client.get('/swagger.yaml').status_code, 200)
+        self.assertEqual(generate.call_count, 1)
+        self.assertFalse(any(self.schema_dir.iterdir()))
+
+    def test_schema_describes_the_response_bodies(self):
+        schema = json.loads(apidocs.generate()['json'])
+        listing_list = schema['paths']['/listings/']['get']['responses']['200']
+        self.assertIn('results', listing_list['schema']['properties'])
+        self.assertIn('schema', schema['paths']['/bookings/{id}/']['get']['responses']['200'])
+
+    def test_nothing_is_built_when_docs_are_disabled(self):
+        with override_settings(API_DOCS_ENABLED=False), \
+                mock.patch.object(apidocs, 'generate') as generate:
+            call_command('build_schema', stdout=io.StringIO())
+            apidocs.warm()
+        generate.assert_not_called()
+
+
+class BenchmarkComparisonTests(TestCase):
+    def result(self, p95_ms=100, rps=50, queries=4, non_2xx=0):
+        return {'p95_ms': p95_ms, 'rps': rps, 'queries_per_request': queries, 'non_2xx': non_2xx}
+
+    def test_flags_regressions_beyond_the_tolerance(self):
+        baseline = {'bookings': {'1': self.result(), '8': self.result()}, 'listings': {'1': self.result(p95_ms=2)}}
+        results = {
+            'bookings': {'1': self.result(p95_ms=120, rps=41, queries=4.4), '8': self.result(p95_ms=130, rps=30, queries=5)},
+            'listings': {'1': self.result(p95_ms=6), '32': self.result(p95_ms=1000)},
+        }
+        regressions = compare(results, baseline, tolerance=0.2)
+        self.assertEqual(
+            [(item['scenario'], item['clients'], item['metric']) for item in regressions],
+            [('bookings', '8', 'p95_ms'), ('bookings', '8', 'rps'), ('bookings', '8', 'queries_per_request')],
+        )
+        self.assertEqual((regressions[0]['baseline'], regressions[0]['current']), (100, 130))
+
+    def test_flags_new_error_responses_even_when_faster(self):
+        regressions = compare(
+            {'listings': {'1': self.result(p95_ms=5, rps=400, non_2xx=3)}},
+            {'listings': {'1': self.result()}}, tolerance=0.2,
+        )
+        self.assertEqual([item['metric'] for item in regressions], ['non_2xx'])
+
+        # Baselines saved before non_2xx was recorded.
+        previous = self.result()
+        del previous['non_2xx']
+        regressions = compare({'listings': {'1': self.result(non_2xx=1)}}, {'listings': {'1': previous}}, 0.2)
+        self.assertEqual([(item['metric'], item['baseline']) for item in regressions], [('non_2xx', None)])
+
+
+class BookingArchiveTests(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(User.objects.create_user('host'))
+        self.completed = make_booking(self.listing, self.guest, start_offset=-800, status='completed')
+        self.cancelled = make_booking(self.listing, self.guest, start_offset=-700, status='cancelled')
+        self.confirmed = make_booking(self.listing, self.guest, start_offset=-600, status='confirmed')
+        self.recent = make_booking(self.listing, self.guest, start_offset=-10, status='completed')
+        self.upcoming = make_booking(self.listing, self.guest, start_offset=10)
+        make_booking(self.listing, User.objects.create_user('other'), start_offset=-900, status='completed')
+        self.review = Review.objects.create(
+            booking=self.completed, guest=self.guest, listing=self.listing, rating=4, comment='Fine.'
+        )
+        StaleStatsRange.objects.all().delete()
+
+    def ids(self, response):
+        return [row['id'] for row in response.json()['results']]
+
+    def test_archive_moves_finished_bookings_and_keeps_reviews(self):
+        # Per batch: select, copy, repoint reviews, delete, in a savepoint.
+        with self.assertNumQueries(15):
+            self.assertEqual(archive.archive(batch_size=2), 3)
+        self.assertEqual(
+            set(Booking.objects.values_list('pk', flat=True)),
+            {self.confirmed.pk, self.recent.pk, self.upcoming.pk},
+        )
+        archived = ArchivedBooking.objects.get(pk=self.completed.pk)
+        self.assertEqual(
+            (archived.created_at, archived.updated_at, archived.status, archived.total_price),
+            (self.completed.created_at, self.completed.updated_at, 'completed', self.completed.total_price),
+        )
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.booking_id, self.review.archived_booking_id), (None, self.completed.pk))
+        self.assertEqual(self.review.booking_ref, self.completed.pk)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.review_count, 1)
+        self.assertFalse(StaleStatsRange.objects.exists())
+
+        # Archived revenue stays in the rollups.
+        analytics.refresh(full=True)
+        self.assertTrue(self.listing.daily_stats.filter(date=self.completed.check_in).exists())
+        reviews = self.client.get(f'/api/listings/{self.listing.pk}/reviews/').json()['results']
+        self.assertEqual(reviews[0]['booking'], self.completed.pk)
+
+    def test_lists_include_archived_bookings_only_when_asked(self):
+        archive.archive()
+        self.client.force_authenticate(self.guest)
+        live = [self.upcoming.pk, self.recent.pk, self.confirmed.pk]
+        history = [self.upcoming.pk, self.recent.pk, self.confirmed.pk, self.cancelled.pk, self.completed.pk]
+        self.assertEqual(self.ids(self.client.get('/api/bookings/')), live)
+
+        response = self.client.get('/api/bookings/?include_archived=true&page_size=2')
+        self.assertEqual((response.json()['count'], self.ids(response)), (5, history))
+        seen, url = [], '/api/bookings/?include_archived=true&pagination=cursor&page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            seen += [row['id'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(seen, history)
+
+        export = self.client.get('/api/bookings/export/?include_archived=1&format=ndjson')
+        exported = [json.loads(line)['id'] for line in b''.join(export.streaming_content).splitlines()]
+        self.assertEqual(sorted(exported), sorted(history))
+
+        listing_history = self.client.get(f'/api/listings/{self.listing.pk}/bookings/?include_archived=true')
+        self.assertEqual(listing_history.json()['count'], 6)
+        self.assertEqual(self.client.get(f'/api/listings/{self.listing.pk}/bookings/').json()['count'], 3)
+
+
+class AvailabilityCalendarTests(TestCase):
+    month = date(2030, 3, 1)
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(User.objects.create_user('host'))
+        self.url = f'/api/listings/{self.listing.pk}/calendar/'
+        # The nights of 30 March to 1 April, across two months.
+        self.book(date(2030, 3, 30), 3)
+        self.book(date(2030, 3, 5), 2, status='cancelled')
+
+    def book(self, check_in, nights, **overrides):
+        return make_booking(
+            self.listing, self.guest, start_offset=(check_in - date.today()).days, nights=nights, **overrides
+        )
+
+    def test_returns_taken_nights_from_one_query_then_from_the_cache(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'start': '2030-03', 'months': 2})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['end'], date(2030, 5, 1))
+        self.assertEqual(response.data['occupied'], '0' * 29 + '111' + '0' * 29)
+        with self.assertNumQueries(0):
+            runs = self.client.get(self.url, {'start': '2030-03', 'months': 2, 'encoding': 'runs'})
+        self.assertEqual(runs.data['occupied'], [[29, 3]])
+
+        # Only the month not cached yet is read.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'start': '2030-04', 'months': 2})
+        self.assertEqual(len(queries), 1)
+        self.assertIn("'2030-05-01'", queries[0]['sql'])
+        self.assertNotIn("'2030-04-01'", queries[0]['sql'])
+        self.assertEqual(response.data['occupied'], '1' + '0' * 60)
+
+    def test_booking_changes_invalidate_the_cached_months(self):
+        params = {'start': '2030-03', 'months': 1, 'encoding': 'runs'}
+        self.client.get(self.url, params)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = self.book(date(2030, 3, 10), 1)
+        self.assertEqual(self.client.get(self.url, params).data['occupied'], [[9, 1], [29, 2]])
+
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/api/bookings/batch/', [{'id': booking.pk, 'status': 'cancelled'}], format='json')
+        self.assertEqual(self.client.get(self.url, params).data['occupied'], [[29, 2]])
+
+    def test_rejects_unknown_listings_and_bad_windows(self):
+        self.assertEqual(self.client.get('/api/listings/999999/calendar/').status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'start': 'March'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'months': 25}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': '9999-12', 'months': 2}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': '9999-11', 'months': 1}).status_code, 200)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['start'], timezone.localdate().replace(day=1))
+        start = response.data['start']
+        self.assertEqual(len(response.data['occupied']), (occupancy.add_months(start, 12) - start).days)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.host = User.objects.create_user('host')
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(self.host)
+        self.listing.set_amenities('WiFi, Kitchen')
+        self.booking = make_booking(self.listing, self.guest, start_offset=10)
+
+    def test_listing_fields_prune_the_response_and_the_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/listings/', {'fields': 'id,title,host'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            response.json()['results'], [{'id': self.listing.pk, 'title': 'Test Listing', 'host': self.host.pk}]
+        )
+        # Count and page only: no join to the host, no amenities prefetch.
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('description', queries[1]['sql'])
+        self.assertNotIn('auth_user', queries[1]['sql'])
+
+        detail = self.client.get(
+            f'/api/listings/{self.listing.pk}/', {'fields': 'amenities,rating_histogram,host.username'}
+        ).json()
+        self.assertEqual(detail, {
+            'amenities': 'WiFi, Kitchen',
+            'host': {'username': 'host'},
+            'rating_histogram': {str(stars): 0 for stars in range(1, 6)},
+        })
+        # Without either parameter, the full representation.
+        self.assertEqual(self.client.get(f'/api/listings/{self.listing.pk}/').json()['host']['username'], 'host')
+
+    def test_booking_expansion_joins_only_the_expanded_relations(self):
+        self.client.force_authenticate(self.guest)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/bookings/', {'fields': 'id,listing.title,guest', 'expand': 'listing'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            response.json()['results'],
+            [{'id': self.booking.pk, 'listing': {'title': 'Test Listing'}, 'guest': self.guest.pk}],
+        )
+        page_sql = queries[-1]['sql']
+        self.assertIn('listings_listing', page_sql)
+        self.assertNotIn('auth_user', page_sql)
+        self.assertNotIn('description', page_sql)
+
+        expanded = self.client.get(f'/api/bookings/{self.booking.pk}/', {'expand': 'listing,listing.host'}).json()
+        self.assertEqual((expanded['guest'], expanded['listing']['host']['id']), (self.guest.pk, self.host.pk))
+        nested = self.client.get(
+            f'/api/listings/{self.listing.pk}/bookings/', {'fields': 'id,status'}
+        ).json()['results']
+        self.assertEqual(nested, [{'id': self.booking.pk, 'status': self.booking.status}])
+
+    def test_reviews_and_bad_fieldsets(self):
+        Review.objects.create(
+            booking=self.booking, guest=self.guest, listing=self.listing, rating=5, comment='Great.'
+        )
+        reviews = self.client.get(
+            f'/api/listings/{self.listing.pk}/reviews/', {'fields': 'rating,booking,guest'}
+        ).json()['results']
+        self.assertEqual(reviews, [{'booking': self.booking.pk, 'guest': self.guest.pk, 'rating': 5}])
+
+        self.assertEqual(self.client.get('/api/listings/', {'fields': 'id,secret'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/listings/', {'expand': 'amenities'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/listings/', {'fields': 'host.'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/listings/', {'expand': 'host.password'}).status_code, 400)
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 # Create a router and register viewsets
 router = DefaultRouter()
@@ -8,6 +9,11 @@ router.register(r'listings', views.ListingViewSet, basename='listing')
 router.register(r'bookings', views.BookingViewSet, basename='booking')
 
 # The API URLs are determined automatically by the router
+routes = router.urls
+if settings.LISTINGS_ASYNC_READS:
+    routes = async_views.with_async_reads(routes)
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('', include(routes)),
 ]
\ No newline at end of file
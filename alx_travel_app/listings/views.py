@@ -1,19 +1,85 @@
-from rest_framework import viewsets, permissions
+import os
+
+from rest_framework import viewsets, permissions, exceptions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Listing, Booking
-from .serializers import ListingSerializer, BookingSerializer
+from rest_framework.views import APIView
+from django_filters.rest_framework import DjangoFilterBackend
+from . import analytics, archive, batch, cache, exports, facets, occupancy, perf, pricing
+from .compiled import FastReadMixin, FastSerializer
+from .fieldsets import SparseReadMixin
+from .filters import (
+    AmenityFilter, FullTextSearchFilter, GeoFilter, ListingFilterSet, RatingFilter,
+)
+from .models import Listing, Booking, ArchivedBooking, Review
+from .pagination import KeysetPagination
+from .replicas import ReplicaReadMixin
+from .reservations import ReservationError, ListingUnavailable
+from .serializers import (
+    ListingSerializer, BookingSerializer, ReviewSerializer, AvailabilitySearchSerializer,
+    ExportSerializer, PricingCalendarSerializer, QuoteSerializer, AnalyticsSerializer,
+    CalendarSerializer,
+)
+
+
+class Conflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The request conflicts with the current state of the resource.'
+    default_code = 'conflict'
 
 
-class ListingViewSet(viewsets.ModelViewSet):
+class ListingViewSet(
+    ReplicaReadMixin, cache.CachedReadMixin, SparseReadMixin, FastReadMixin, viewsets.ModelViewSet
+):
     """
     ViewSet for managing property listings.
     
-    Provides full CRUD operations for property listings.
+    Provides full CRUD operations for property listings. List and detail
+    reads are served from the response cache (see ``listings.cache``) and
+    rendered with the compiled serializer (see ``listings.compiled``); other
+    reads go to a replica (see ``listings.replicas``). Listing, booking and
+    review reads take ``?fields=`` and ``?expand=`` (see ``listings.fieldsets``).
     """
-    queryset = Listing.objects.all()
+    queryset = Listing.objects.for_serialization()
     serializer_class = ListingSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    filter_backends = [
+        DjangoFilterBackend, AmenityFilter, RatingFilter, FullTextSearchFilter, GeoFilter,
+        filters.OrderingFilter,
+    ]
+    filterset_class = ListingFilterSet
+    ordering_fields = ['avg_rating', 'review_count', 'price_per_night', 'created_at']
+    fast_read_actions = ('list', 'retrieve', 'available')
+    sparse_actions = ('list', 'retrieve', 'available', 'bookings', 'reviews')
+    # Read from the primary, since what they read is cached for everyone.
+    primary_read_actions = ('list', 'retrieve', 'calendar')
+    
+    def get_queryset(self):
+        # Nested actions and exports only need the listing row itself, not its relations.
+        if self.action in ('bookings', 'reviews', 'export', 'pricing'):
+            return Listing.objects.all()
+        return self.sparse_queryset(super().get_queryset())
+    
+    def get_available_queryset(self):
+        """The listings matching the availability search in the query parameters."""
+        params = AvailabilitySearchSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        search = params.validated_data
+        listings = self.filter_queryset(self.get_queryset()).available(
+            search['check_in'], search['check_out'], search['guests']
+        )
+        if search.get('city'):
+            listings = listings.filter(city=search['city'])
+        return listings
+    
+    def get_paginated_response(self, data):
+        """Add facet counts for the current filters to lists requested with ``?facets=1``."""
+        response = super().get_paginated_response(data)
+        if self.action == 'list' and self.request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = facets.facet_counts(
+                self.filter_queryset(self.get_queryset()), self.request.query_params
+            )
+        return response
     
     def perform_create(self, serializer):
         """Set the host to the current user when creating a listing."""
@@ -21,32 +87,270 @@ class ListingViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def bookings(self, request, pk=None):
-        """Get all bookings for a specific listing."""
+        """Get all bookings for a specific listing; ``?include_archived=true`` adds past ones."""
         listing = self.get_object()
-        bookings = Booking.objects.filter(listing=listing)
-        serializer = BookingSerializer(bookings, many=True)
+        bookings = Booking.objects.for_serialization().filter(listing=listing)
+        bookings = self.sparse_queryset(bookings, BookingSerializer)
+        if archive.requested(request):
+            archived = ArchivedBooking.objects.for_serialization().filter(listing=listing)
+            bookings = archive.History(bookings, self.sparse_queryset(archived, BookingSerializer))
+        fieldset = self.get_fieldset()
+        page = self.paginate_queryset(bookings)
+        if page is not None:
+            serializer = FastSerializer(BookingSerializer, page, many=True, fieldset=fieldset)
+            return self.get_paginated_response(serializer.data)
+        serializer = FastSerializer(BookingSerializer, bookings, many=True, fieldset=fieldset)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def reviews(self, request, pk=None):
+        """Get the reviews of a listing, newest first, with keyset pagination."""
+        listing = self.get_object()
+        reviews = Review.objects.select_related('guest').filter(listing=listing)
+        reviews = self.sparse_queryset(reviews, ReviewSerializer)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serializer = ReviewSerializer(page, many=True, fieldset=self.get_fieldset())
+        return paginator.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['get', 'put'])
+    def pricing(self, request, pk=None):
+        """
+        Read or replace the listing's pricing calendar (host or staff only
+        for writes): weekend uplift, minimum stay, weekly and monthly
+        discounts, and seasonal nightly rates.
+        """
+        listing = self.get_object()
+        if request.method == 'PUT':
+            if listing.host_id != request.user.pk and not request.user.is_staff:
+                raise exceptions.PermissionDenied('Only the host can change the pricing.')
+            serializer = PricingCalendarSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            pricing.set_calendar(listing, serializer.validated_data)
+        return Response(PricingCalendarSerializer(pricing.get_calendar(listing)).data)
+    
+    @action(detail=True, methods=['get'])
+    def quote(self, request, pk=None):
+        """Price a stay (``check_in``, ``check_out``) night by night from the calendar."""
+        params = QuoteSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        try:
+            listing_id = int(pk)
+        except ValueError:
+            raise exceptions.NotFound()
+        quote = pricing.quotes(
+            [listing_id], params.validated_data['check_in'], params.validated_data['check_out']
+        ).get(listing_id)
+        if quote is None:
+            raise exceptions.NotFound()
+        return Response(quote)
+    
+    @action(detail=True, methods=['get'])
+    def calendar(self, request, pk=None):
+        """
+        Which nights are taken over ``?start=YYYY-MM&months=12``, one
+        ``"0"``/``"1"`` per night, or ``encoding=runs`` for ``[offset, nights]``
+        runs of taken nights. Cached per listing and month.
+        """
+        params = CalendarSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        try:
+            listing_id = int(pk)
+        except ValueError:
+            raise exceptions.NotFound()
+        nights = occupancy.bitmap(listing_id, query['start'], query['months'])
+        if nights is None:
+            raise exceptions.NotFound()
+        return Response({
+            'listing': listing_id,
+            'start': query['start'],
+            'end': occupancy.add_months(query['start'], query['months']),
+            'encoding': query['encoding'],
+            'occupied': nights if query['encoding'] == 'bitmap' else occupancy.runs(nights),
+        })
+    
+    @action(detail=False, methods=['get'])
+    def quotes(self, request):
+        """
+        Price one stay for a page of listings: ``?check_in=&check_out=&ids=1,2,3``
+        (at most 100 ids). Unknown ids are left out of the results.
+        """
+        params = QuoteSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        search = params.validated_data
+        if 'ids' not in search:
+            raise exceptions.ValidationError({'ids': ['This field is required.']})
+        results = pricing.quotes(search['ids'], search['check_in'], search['check_out'])
+        return Response({
+            'check_in': search['check_in'],
+            'check_out': search['check_out'],
+            'results': [results[pk] for pk in search['ids'] if pk in results],
+        })
+    
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def analytics(self, request):
+        """
+        Occupancy, revenue and ADR of the current user's listings per day,
+        week or month: ``?start=&end=`` (inclusive), ``granularity=`` and
+        optionally ``listing=1,2,3``. Staff may pass ``host=<user id>``.
+        Answered from the daily rollups kept by ``refresh_analytics``.
+        """
+        params = AnalyticsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        host_id = query.get('host', request.user.pk)
+        if host_id != request.user.pk and not request.user.is_staff:
+            raise exceptions.PermissionDenied('Only staff can see the analytics of other hosts.')
+        listings = Listing.objects.filter(host_id=host_id).only('id', 'title', 'created_at')
+        if 'listing' in query:
+            listings = listings.filter(pk__in=query['listing'])
+        page = self.paginate_queryset(listings)
+        results = analytics.report(
+            list(listings) if page is None else page, query['start'], query['end'], query['granularity']
+        )
+        if page is not None:
+            return self.get_paginated_response(results)
+        return Response(results)
+    
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch_create(self, request):
+        """
+        Create a list of listings hosted by the current user in one transaction.
+        
+        Each item is validated like a single create; invalid items are
+        skipped and reported. Responds 201 if every item was created, 207
+        if some were, 400 if none were.
+        """
+        result = batch.create_listings(batch.get_items(request), request.user)
+        return Response(result.data, status=result.status_code(status.HTTP_201_CREATED))
+    
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated],
+            renderer_classes=[exports.CSVRenderer, exports.NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream every matching listing as CSV (default) or ``?format=ndjson``.
+        
+        Accepts the list filters plus ``start``/``end`` (creation dates) and
+        ``listing`` (comma-separated ids); nothing is paginated.
+        """
+        params = ExportSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params.validated_data.pop('status', None)
+        listings = exports.filter_listings(
+            self.filter_queryset(self.get_queryset()), **params.validated_data
+        )
+        return exports.streaming_response(
+            listings, exports.LISTING_COLUMNS, request.accepted_renderer.format, 'listings',
+            asynchronous=exports.is_asgi(request),
+        )
+    
+    @action(detail=False, methods=['get'], url_path='cache-stats',
+            permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """Hit/miss counters of the listing response cache in this process."""
+        return Response(cache.stats.snapshot())
+    
+    @action(detail=False, methods=['get'])
+    def available(self, request):
+        """
+        Search listings free for the whole requested stay.
+        
+        Query parameters: ``check_in`` and ``check_out`` (required, ISO dates),
+        ``city`` and ``guests`` (optional). Overlapping non-cancelled bookings
+        are excluded in the same query that selects the listings.
+        """
+        listings = self.get_available_queryset()
+        page = self.paginate_queryset(listings)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(listings, many=True)
         return Response(serializer.data)
 
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(ReplicaReadMixin, SparseReadMixin, FastReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing property bookings.
     
     Provides full CRUD operations for property bookings.
     Users can only view and manage their own bookings.
+    Reads go to a replica (see ``listings.replicas``). The list and the
+    export include archived bookings with ``?include_archived=true``.
     """
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    history_actions = ('list', 'export')
     
     def get_queryset(self):
         """Return only bookings for the authenticated user."""
         if getattr(self, 'swagger_fake_view', False):
             return Booking.objects.none()
-            
-        if self.request.user.is_staff:
-            return Booking.objects.all()
-        return Booking.objects.filter(guest=self.request.user)
+        
+        bookings = self.sparse_queryset(Booking.objects.for_serialization().visible_to(self.request.user))
+        if self.action in self.history_actions and archive.requested(self.request):
+            archived = ArchivedBooking.objects.for_serialization().visible_to(self.request.user)
+            return archive.History(bookings, self.sparse_queryset(archived))
+        return bookings
+    
+    @action(detail=False, methods=['get'],
+            renderer_classes=[exports.CSVRenderer, exports.NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream the bookings visible to the user as CSV (default) or ``?format=ndjson``.
+        
+        Filters: ``start``/``end`` (check-in dates, inclusive), ``status``
+        and ``listing`` (comma-separated); nothing is paginated.
+        """
+        params = ExportSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        bookings = exports.filter_bookings(self.get_queryset(), **params.validated_data)
+        return exports.streaming_response(
+            bookings, exports.BOOKING_COLUMNS, request.accepted_renderer.format, 'bookings',
+            asynchronous=exports.is_asgi(request),
+        )
+    
+    @action(detail=False, methods=['patch'], url_path='batch')
+    def batch_status(self, request):
+        """
+        Change the status of many bookings in one transaction.
+        
+        Takes a list of ``{"id", "status"}`` items, limited to the bookings
+        the user can see. Responds 200 if every item was applied, 207 if
+        some were, 400 if none were.
+        """
+        result = batch.update_booking_statuses(batch.get_items(request), self.get_queryset())
+        return Response(result.data, status=result.status_code(status.HTTP_200_OK))
     
     def perform_create(self, serializer):
         """Set the guest to the current user when creating a booking."""
-        serializer.save(guest=self.request.user)
\ No newline at end of file
+        self.reserve(serializer, guest=self.request.user)
+    
+    def perform_update(self, serializer):
+        self.reserve(serializer)
+    
+    def reserve(self, serializer, **kwargs):
+        """Save through the reservation engine, mapping its errors to HTTP."""
+        try:
+            serializer.save(**kwargs)
+        except ListingUnavailable as exc:
+            raise Conflict(str(exc))
+        except ReservationError as exc:
+            raise exceptions.ValidationError({'non_field_errors': [str(exc)]})
+
+
+
+class MetricsView(APIView):
+    """
+    Per-endpoint latency percentiles recorded by the request instrumentation
+    (see ``listings.perf``) in this process, plus how many of each endpoint's
+    requests were sampled for query and serializer timings.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        return Response({
+            'pid': os.getpid(),
+            'sample_rate': perf.get_sample_rate(),
+            'endpoints': perf.metrics.snapshot(),
+        })